@@ -32,7 +32,7 @@ const Dashboard = () => {
         });
     };
 
-    // Poll Backend API for real-time status
+    // Subscribe to real-time status from the backend
     useEffect(() => {
 
         // GEOLOCATION: Get User Location immediately
@@ -52,35 +52,37 @@ const Dashboard = () => {
             });
         }
 
-        const interval = setInterval(() => {
-            fetch('http://localhost:5000/api/status')
-                .then(res => res.json())
-                .then(data => {
-                    setSystemStatus(data);
-
-                    // Add to local alerts log if fire is detected and not already logged recently
-                    if (data.detected) {
-                        const newAlert = {
-                            id: Date.now(),
-                            time: new Date().toLocaleTimeString(),
-                            message: data.message,
-                            type: data.severity === "High" ? 'critical' : 'warning'
-                        };
-
-                        // Simple logic to avoid flooding the log (only add if last alert was > 5s ago)
-                        setAlerts(prev => {
-                            const last = prev[0];
-                            if (!last || (Date.now() - last.id > 5000)) {
-                                return [newAlert, ...prev].slice(0, 50); // Keep last 50
-                            }
-                            return prev;
-                        });
+        // Status is pushed by the backend (Server-Sent Events) only when it changes.
+        // EventSource reconnects by itself and resumes from the last event id.
+        const source = new EventSource('http://localhost:5000/api/stream');
+
+        source.addEventListener('status', (event) => {
+            const data = JSON.parse(event.data);
+            setSystemStatus(data);
+
+            // Add to local alerts log if fire is detected and not already logged recently
+            if (data.detected) {
+                const newAlert = {
+                    id: Date.now(),
+                    time: new Date().toLocaleTimeString(),
+                    message: data.message,
+                    type: data.severity === "High" ? 'critical' : 'warning'
+                };
+
+                // Simple logic to avoid flooding the log (only add if last alert was > 5s ago)
+                setAlerts(prev => {
+                    const last = prev[0];
+                    if (!last || (Date.now() - last.id > 5000)) {
+                        return [newAlert, ...prev].slice(0, 50); // Keep last 50
                     }
-                })
-                .catch(err => console.error("API Error:", err));
-        }, 1000); // Check every second
+                    return prev;
+                });
+            }
+        });
+
+        source.onerror = (err) => console.error("Status Stream Error:", err);
 
-        return () => clearInterval(interval);
+        return () => source.close();
     }, []);
 
     // Helper to determine status color
@@ -1,8 +1,10 @@
-import winsound
 import smtplib
 import os
+import queue
+import threading
+import time
+from collections import deque
 from email.message import EmailMessage
-from twilio.rest import Client  # Import Twilio (Install: pip install twilio)
 
 # --- TWILIO SMS CONFIGURATION ---
 TWILIO_SID = os.getenv("TWILIO_SID", "")
@@ -11,72 +13,302 @@ TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER", "")
 USER_PHONE_NUMBER = os.getenv("USER_PHONE_NUMBER", "")
 # ------------------------------------------------
 
+# --- SMTP CONFIGURATION (point at a local stub for testing, e.g. SMTP_SSL=0 SMTP_PORT=1025) ---
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USE_SSL = os.getenv("SMTP_SSL", "1") == "1"
+
+# --- ALERT DISPATCHER ---
+ALERT_WORKERS = 3
+ALERT_QUEUE_SIZE = 100
+ALERT_MAX_RETRIES = 3
+# Alarms from the same camera and zone within this window are the same
+# incident, unless the severity escalates
+ALERT_DEDUP_WINDOW = 60
+# Per-channel rate limits: (max sends, per seconds)
+CHANNEL_RATE_LIMITS = {
+    "sound": (6, 60),
+    "email": (5, 600),
+    "call": (2, 600),
+}
+SEVERITY_LEVELS = {"LOW": 1, "MEDIUM": 2, "HIGH": 3}
+
 def play_alarm():
-    winsound.PlaySound("alarm.wav", winsound.SND_FILENAME | winsound.SND_ASYNC)
+    # Preloaded sound on the audio thread, repeated triggers coalesce (see audio.py)
+    from audio import play_alarm as trigger_alarm_sound
+    trigger_alarm_sound()
+
+_twilio_client = None
+_twilio_lock = threading.Lock()
+
+def get_twilio_client():
+    """One Twilio client per process, reused for every call."""
+    global _twilio_client
+    with _twilio_lock:
+        if _twilio_client is None:
+            from twilio.rest import Client  # pip install twilio, only needed for calls
+            _twilio_client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
+        return _twilio_client
+
+def twilio_configured():
+    # Check if placeholders are still present
+    return bool(TWILIO_SID) and not ("ACxxx" in TWILIO_SID or "your_" in TWILIO_AUTH_TOKEN)
+
+def place_call(severity, location_url):
+    """Places the Twilio voice call. Raises on failure (used by the dispatcher)."""
+    client = get_twilio_client()
+    
+    # TwiML (Voice Markup)
+    twiml_response = f"""
+    <Response>
+        <Say voice="alice">
+            Emergency Alert! Fire detected at your location. 
+            Severity is {severity}. 
+            Please check the live feed immediately.
+        </Say>
+    </Response>
+    """
+    
+    call = client.calls.create(
+        twiml=twiml_response,
+        to=USER_PHONE_NUMBER,
+        from_=TWILIO_FROM_NUMBER
+    )
+    print(f"📞 Call Initiated! SID: {call.sid}")
 
 def make_call_alert(severity, location_url):
     """Makes a voice call alert via Twilio."""
     try:
-        # Check if placeholders are still present
-        if "ACxxx" in TWILIO_SID or "your_" in TWILIO_AUTH_TOKEN:
+        if not twilio_configured():
             print("⚠️ Twilio Credentials not set. Call Skipped.")
             return
-
-        client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
-        
-        # TwiML (Voice Markup)
-        twiml_response = f"""
-        <Response>
-            <Say voice="alice">
-                Emergency Alert! Fire detected at your location. 
-                Severity is {severity}. 
-                Please check the live feed immediately.
-            </Say>
-        </Response>
-        """
-        
-        call = client.calls.create(
-            twiml=twiml_response,
-            to=USER_PHONE_NUMBER,
-            from_=TWILIO_FROM_NUMBER
-        )
-        print(f"� Call Initiated! SID: {call.sid}")
+        place_call(severity, location_url)
     except Exception as e:
         print(f"❌ Failed to make call: {e}")
 
-def send_email_alert(image_path, location=None):
-    try:
-        EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS", "")
-        EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "")
-        TO_EMAIL = os.getenv("TO_EMAIL", "")
- 
-        msg = EmailMessage()
-        msg['Subject'] = "🔥 FIRE ALERT DETECTED!"
-        msg['From'] = EMAIL_ADDRESS
-        msg['To'] = TO_EMAIL
-        
-        content = "Fire detected. See attached image.\n"
+def build_email(image_path, location=None):
+    EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS", "")
+    TO_EMAIL = os.getenv("TO_EMAIL", "")
+
+    msg = EmailMessage()
+    msg['Subject'] = "🔥 FIRE ALERT DETECTED!"
+    msg['From'] = EMAIL_ADDRESS
+    msg['To'] = TO_EMAIL
+    
+    content = "Fire detected. See attached image.\n"
+    
+    if location and 'lat' in location and 'lon' in location:
+        lat = location['lat']
+        lon = location['lon']
+        maps_link = f"https://www.google.com/maps?q={lat},{lon}"
+        content += f"\n📍 ALERT LOCATION: {lat}, {lon}\n"
+        content += f"🔗 View on Map: {maps_link}\n"
         
-        if location and 'lat' in location and 'lon' in location:
-            lat = location['lat']
-            lon = location['lon']
-            maps_link = f"https://www.google.com/maps?q={lat},{lon}"
-            content += f"\n📍 ALERT LOCATION: {lat}, {lon}\n"
-            content += f"🔗 View on Map: {maps_link}\n"
-            
-        msg.set_content(content)
+    msg.set_content(content)
 
+    if image_path and os.path.exists(image_path):
         with open(image_path, 'rb') as f:
             file_data = f.read()
             file_name = os.path.basename(image_path)
 
         msg.add_attachment(file_data, maintype='image', subtype='jpeg', filename=file_name)
+    return msg
+
+
+class SMTPSession:
+    """Keeps one SMTP connection open across alerts, reconnecting when it drops."""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, use_ssl=SMTP_USE_SSL):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self._smtp = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = smtp_class(self.host, self.port, timeout=30)
+        password = os.getenv("EMAIL_PASSWORD", "")
+        if password:
+            smtp.login(os.getenv("EMAIL_ADDRESS", ""), password)
+        return smtp
 
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            smtp.send_message(msg)
+    def _alive(self):
+        try:
+            return self._smtp is not None and self._smtp.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
 
+    def send(self, msg):
+        with self._lock:
+            if not self._alive():
+                self.close()
+                self._smtp = self._connect()
+            self._smtp.send_message(msg)
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+_smtp_session = SMTPSession()
+
+def send_email_alert(image_path, location=None):
+    try:
+        _smtp_session.send(build_email(image_path, location))
         print("[EMAIL SENT] Fire alert email delivered.")
 
     except Exception as e:
         print("[EMAIL ERROR]", e)
+
+
+class RateLimiter:
+    """Sliding-window limit of max_events per `per` seconds."""
+
+    def __init__(self, max_events, per):
+        self.max_events = max_events
+        self.per = per
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        now = time.time()
+        with self._lock:
+            while self._times and now - self._times[0] > self.per:
+                self._times.popleft()
+            if len(self._times) >= self.max_events:
+                return False
+            self._times.append(now)
+            return True
+
+
+class AlertDispatcher:
+    """Single entry point for alarms: sound, email and voice call.
+
+    dispatch() only enqueues and returns, so the capture loop never blocks on
+    an alert. A fixed pool of workers delivers each channel with retries and
+    backoff, using the persistent SMTP session and Twilio client. Repeated
+    alarms of one camera and zone are merged into its ongoing incident (a
+    fire elsewhere is always a new one), and each channel has its own rate
+    limit against alert storms.
+    """
+
+    def __init__(self, workers=ALERT_WORKERS, queue_size=ALERT_QUEUE_SIZE,
+                 dedup_window=ALERT_DEDUP_WINDOW, rate_limits=None, channels=None):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dedup_window = dedup_window
+        self.limiters = {name: RateLimiter(*limit) for name, limit in (rate_limits or CHANNEL_RATE_LIMITS).items()}
+        self.channels = channels or {
+            "sound": lambda incident: play_alarm(),
+            "email": self._email,
+            "call": self._call,
+        }
+        self.stats = {"incidents": 0, "deduplicated": 0, "rate_limited": 0, "dropped": 0, "failed": 0}
+        self.sent = {name: 0 for name in self.channels}
+        self._incidents = {}  # (camera_id, zone) -> last incident delivered
+        self._lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @staticmethod
+    def _email(incident):
+        # The evidence image is written in the background, wait for it to attach it
+        ready = incident.get("evidence_ready")
+        if ready is not None:
+            ready.wait(timeout=5)
+        _smtp_session.send(build_email(incident["image_path"], incident.get("location")))
+
+    @staticmethod
+    def _call(incident):
+        if not twilio_configured():
+            print("⚠️ Twilio Credentials not set. Call Skipped.")
+            return
+        place_call(incident["severity"], incident.get("location_url"))
+
+    @staticmethod
+    def _incident_key(incident):
+        return incident.get("camera_id"), incident.get("zone")
+
+    def _is_duplicate(self, incident):
+        """Same incident = same camera and zone within the dedup window, without escalation."""
+        # Forget incidents that are over, so the dict stays as small as the live ones
+        for key, last in list(self._incidents.items()):
+            if incident["time"] - last["time"] > self.dedup_window:
+                del self._incidents[key]
+        last = self._incidents.get(self._incident_key(incident))
+        if last is None:
+            return False
+        level = SEVERITY_LEVELS.get(str(incident["severity"]).upper(), 0)
+        last_level = SEVERITY_LEVELS.get(str(last["severity"]).upper(), 0)
+        return level <= last_level
+
+    def dispatch(self, incident, channels=None):
+        """Queues an incident for delivery. Never blocks.
+
+        incident: dict with severity, camera_id, zone, image_path, location,
+        location_url. Returns False if it was merged into the ongoing
+        incident of the same camera and zone.
+        """
+        incident = dict(incident)
+        incident.setdefault("time", time.time())
+        with self._lock:
+            if self._is_duplicate(incident):
+                self.stats["deduplicated"] += 1
+                print(f"🔁 Alert from {incident.get('camera_id')} / {incident.get('zone')} "
+                      "merged into the ongoing incident")
+                return False
+            self._incidents[self._incident_key(incident)] = incident
+            self.stats["incidents"] += 1
+
+        for channel in channels or self.channels:
+            if not self.limiters.get(channel, RateLimiter(1, 0)).allow():
+                self.stats["rate_limited"] += 1
+                print(f"⏳ {channel} alert rate-limited")
+                continue
+            try:
+                self.queue.put_nowait((channel, incident))
+            except queue.Full:
+                self.stats["dropped"] += 1
+                print(f"⚠️ Alert queue full, {channel} alert dropped")
+        return True
+
+    def _worker(self):
+        while True:
+            channel, incident = self.queue.get()
+            delay = 1.0
+            for attempt in range(ALERT_MAX_RETRIES):
+                try:
+                    self.channels[channel](incident)
+                    self.sent[channel] += 1
+                    break
+                except Exception as e:
+                    print(f"❌ {channel} alert failed (attempt {attempt + 1}): {e}")
+                    time.sleep(delay)
+                    delay *= 2
+            else:
+                self.stats["failed"] += 1
+            self.queue.task_done()
+
+    def snapshot(self):
+        return {**self.stats, "sent": dict(self.sent), "queued": self.queue.qsize()}
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_alert_dispatcher():
+    """Shared AlertDispatcher, started on first use."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher()
+        return _dispatcher
+
+def peek_alert_dispatcher():
+    """The AlertDispatcher if something already started it, else None (never starts it)."""
+    return _dispatcher
@@ -0,0 +1,178 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import wave
+from shutil import which
+
+ALARM_SOUND = os.getenv("ALARM_SOUND", "alarm.wav")
+# auto, winsound, simpleaudio, aplay, file or null
+AUDIO_BACKEND = os.getenv("AUDIO_BACKEND", "auto")
+# Where the file backend logs each alarm (headless boxes, tests)
+AUDIO_SINK_PATH = os.getenv("AUDIO_SINK_PATH", "alarm_sink.log")
+
+
+def load_sound(path=ALARM_SOUND):
+    """Reads and decodes the WAV once. Returns (wav_bytes, params, pcm_frames)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    with wave.open(io.BytesIO(data)) as wav:
+        params = wav.getparams()
+        frames = wav.readframes(params.nframes)
+    return data, params, frames
+
+
+class NullBackend:
+    name = "null"
+
+    def play(self, sound):
+        pass
+
+
+class FileBackend:
+    """Appends a line per alarm instead of making noise."""
+
+    name = "file"
+
+    def __init__(self, path=AUDIO_SINK_PATH):
+        self.path = path
+
+    def play(self, sound):
+        data, params, _ = sound
+        with open(self.path, "a") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} alarm {len(data)} bytes "
+                    f"{params.framerate} Hz {params.nchannels} ch\n")
+
+
+class WinsoundBackend:
+    name = "winsound"
+
+    def __init__(self):
+        import winsound
+        self.winsound = winsound
+
+    def play(self, sound):
+        # SND_MEMORY can't be async, fine on the player thread
+        self.winsound.PlaySound(sound[0], self.winsound.SND_MEMORY)
+
+
+class SimpleaudioBackend:
+    name = "simpleaudio"
+
+    def __init__(self):
+        import simpleaudio
+        self.simpleaudio = simpleaudio
+
+    def play(self, sound):
+        _, params, frames = sound
+        self.simpleaudio.play_buffer(frames, params.nchannels, params.sampwidth, params.framerate).wait_done()
+
+
+class AplayBackend:
+    """ALSA command line player, fed the in-memory WAV on stdin."""
+
+    name = "aplay"
+
+    def __init__(self):
+        if which("aplay") is None:
+            raise RuntimeError("aplay not found")
+
+    def play(self, sound):
+        subprocess.run(["aplay", "-q", "-"], input=sound[0], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, timeout=60)
+
+
+BACKENDS = {
+    "null": NullBackend,
+    "file": FileBackend,
+    "winsound": WinsoundBackend,
+    "simpleaudio": SimpleaudioBackend,
+    "aplay": AplayBackend,
+}
+
+
+def create_backend(name=AUDIO_BACKEND):
+    if name != "auto":
+        return BACKENDS[name]()
+    candidates = ["winsound"] if sys.platform == "win32" else ["simpleaudio", "aplay"]
+    for candidate in candidates:
+        try:
+            return BACKENDS[candidate]()
+        except (ImportError, RuntimeError):
+            continue
+    print("⚠️ No audio output available, alarms will be silent")
+    return NullBackend()
+
+
+class AlarmPlayer:
+    """Plays the preloaded alarm sound on a dedicated thread.
+
+    trigger() only sets a flag, so callers never block. Triggers arriving
+    while the sound is already playing are coalesced into it instead of
+    queueing up back-to-back repeats.
+    """
+
+    def __init__(self, backend=None, sound_path=ALARM_SOUND):
+        self.backend = backend or create_backend()
+        try:
+            self.sound = load_sound(sound_path)
+        except (OSError, wave.Error) as e:
+            print(f"❌ Could not load {sound_path}: {e}")
+            self.sound = None
+        self._pending = threading.Event()
+        self._lock = threading.Lock()
+        self.playing = False
+        self.stats = {"triggered": 0, "played": 0, "coalesced": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def trigger(self):
+        with self._lock:
+            self.stats["triggered"] += 1
+            if self.playing or self._pending.is_set():
+                self.stats["coalesced"] += 1
+                return
+            self._pending.set()
+
+    def _worker(self):
+        while True:
+            self._pending.wait()
+            with self._lock:
+                self.playing = True
+                self._pending.clear()
+            try:
+                if self.sound is None:
+                    raise RuntimeError("no alarm sound loaded")
+                self.backend.play(self.sound)
+                self.stats["played"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"❌ Alarm playback failed: {e}")
+            finally:
+                with self._lock:
+                    self.playing = False
+
+    def snapshot(self):
+        return {**self.stats, "backend": self.backend.name, "playing": self.playing}
+
+
+_player = None
+_player_lock = threading.Lock()
+
+def get_alarm_player():
+    """Shared AlarmPlayer, started (and the sound decoded) on first use."""
+    global _player
+    with _player_lock:
+        if _player is None:
+            _player = AlarmPlayer()
+        return _player
+
+def peek_alarm_player():
+    """The AlarmPlayer if something already started it, else None (never starts it)."""
+    return _player
+
+def play_alarm():
+    """Non-blocking alarm sound, safe to call from the capture loop."""
+    get_alarm_player().trigger()
@@ -0,0 +1,666 @@
+"""Offline replay / benchmark of the detection pipeline.
+
+Feeds recorded videos or image sequences through the same stages as the
+server (detector -> tracker + liveness -> severity/alert decision -> JPEG
+encode) without a camera or display, and prints a JSON report with per-stage
+latency percentiles, fps, memory peak and decision outcomes.
+
+    python benchmark.py evidence/
+    python benchmark.py clips/match.mp4 clips/photo_shake.mp4 --output bench.json
+    python benchmark.py evidence/ --backend onnx   # compare fps per backend
+    python benchmark.py clips/warehouse.mp4 --detect-mode tiled   # small-fire recall vs cost
+    python benchmark.py --startup   # import / model-load time of each module
+    python benchmark.py evidence/ --color-check   # colour gate rejection rate and recall
+    python benchmark.py evidence/ --liveness-compare   # engines: cost per box, verdict agreement, and
+                                                       # every input image shaken / swayed as a photo
+    python benchmark.py --liveness-cost   # detection-thread liveness time per tick vs camera count
+    python benchmark.py --check-chaos [clips/match.mp4]   # farneback engine == the original calculate_chaos
+    python benchmark.py evidence/ --python-memory   # + Python heap peak, from a second untimed replay
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict, deque
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# --check-chaos: largest score difference tolerated between the batched and per-box paths
+CHAOS_TOLERANCE = 1e-4
+# --liveness-compare: a still photo moved rigidly in front of the camera,
+# frames per scenario, shake amplitude and sway amplitude / period (pixels, frames)
+RIGID_FRAMES = 40
+RIGID_SHAKE = 5
+RIGID_SWAY = (20, 30)
+# --liveness-cost: camera counts, frame size (h, w), fire box sides per camera
+# (pixels) and ticks timed per camera count
+LIVENESS_COST_CAMERAS = (1, 2, 4, 8, 16)
+LIVENESS_COST_FRAME = (720, 1280)
+LIVENESS_COST_BOXES = (96, 192, 320)
+LIVENESS_COST_TICKS = 30
+
+# Modules timed by --startup, each imported in a fresh interpreter
+STARTUP_MODULES = ("config", "utils", "database", "alert", "evidence", "detector", "pipeline", "server")
+# Should only show up once they are actually used
+HEAVY_MODULES = ("torch", "ultralytics", "twilio", "mysql", "winsound")
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter() - start
+loaded = None
+if {load_model}:
+    start = time.perf_counter()
+    {module}.get_detector()
+    loaded = time.perf_counter() - start
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps({{"import_s": imported, "model_load_s": loaded, "heavy_modules": heavy}}))
+"""
+
+
+def iter_frames(path, max_frames=None):
+    """Yields (frame, timestamp_seconds) from a video file, an image or a folder of images."""
+    if os.path.isdir(path):
+        files = sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+        paths = [os.path.join(path, f) for f in files]
+    elif path.lower().endswith(IMAGE_EXTENSIONS):
+        paths = [path]
+    else:
+        paths = None
+
+    count = 0
+    if paths is not None:
+        # Image sequences are replayed at a nominal 10 fps
+        for image_path in paths:
+            frame = cv2.imread(image_path)
+            if frame is None:
+                continue
+            yield frame, count / 10.0
+            count += 1
+            if max_frames and count >= max_frames:
+                return
+        return
+
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        yield frame, count / fps
+        count += 1
+        if max_frames and count >= max_frames:
+            break
+    cap.release()
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    arr = np.asarray(samples) * 1000.0  # ms
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p90_ms": round(float(np.percentile(arr, 90)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "max_ms": round(float(arr.max()), 3),
+    }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        # ru_maxrss is KB on Linux
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+    except ImportError:
+        return None
+
+
+def python_memory_peak(args):
+    """Python heap peak (bytes) over a second replay of the inputs.
+
+    tracemalloc slows every allocation, so it never runs during the timed
+    pass; this replay's timings and outcomes are thrown away.
+    """
+    tracemalloc.start()
+    try:
+        for path in args.inputs:
+            run_source(path, args, defaultdict(list), Counter())
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_startup(module, load_model=False):
+    script = STARTUP_SCRIPT.format(module=module, load_model=load_model, heavy=HEAVY_MODULES)
+    # API-only server: importing it must not open cameras or load the model
+    env = {**os.environ, "DETECTION_WORKER": "0"}
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result = {k: round(v, 3) if isinstance(v, float) else v for k, v in result.items()}
+    result["process_s"] = round(wall, 3)
+    return result
+
+
+def startup_report():
+    report = {name: measure_startup(name) for name in STARTUP_MODULES}
+    report["detector+model"] = measure_startup("detector", load_model=True)
+    return report
+
+
+class LivenessComparison:
+    """Runs every liveness engine on the same tracked boxes, next to the pipeline.
+
+    Each engine keeps its own state and per-track windows and is judged with
+    its own thresholds; verdicts are compared with farneback's (the
+    reference) once both are past 'pending'. Not part of the timed stages.
+    """
+
+    def __init__(self):
+        from liveness import ENGINES
+        self.engines = ENGINES
+        self.states = {engine: {} for engine in ENGINES}
+        self.windows = {engine: {} for engine in ENGINES}  # track_id -> (chaos, motion) deques
+        self.seconds = {engine: [] for engine in ENGINES}  # Per box
+        self.verdicts = {engine: Counter() for engine in ENGINES}
+        self.compared = Counter()
+        self.agree = Counter()
+        self.alarm_agree = Counter()
+
+    def observe(self, cam, gray, prev_gray, tracks):
+        from liveness import engine_thresholds, liveness_scores
+        from tracker import TRACK_HISTORY, judge
+        from utils import clip_box
+
+        if prev_gray is None:
+            for state in self.states.values():
+                state.clear()
+            return
+        visible = [(track, clip_box(*track.box, gray.shape)) for track in tracks]
+        visible = [(track, box) for track, box in visible if box[2] > box[0] and box[3] > box[1]]
+        tracks = [track for track, _ in visible]
+        boxes = [box for _, box in visible]
+        verdicts = defaultdict(dict)
+        for engine in self.engines:
+            start = time.perf_counter()
+            chaos, motion = liveness_scores(engine, gray, prev_gray, boxes, self.states[engine],
+                                            cam.quality.flow_size)
+            if boxes:
+                self.seconds[engine].append((time.perf_counter() - start) / len(boxes))
+            thresholds = engine_thresholds(engine, cam.camera_id)
+            for track, chaos_score, motion_score in zip(tracks, chaos, motion):
+                window = self.windows[engine].setdefault(
+                    track.track_id, (deque(maxlen=TRACK_HISTORY), deque(maxlen=TRACK_HISTORY)))
+                if np.isfinite(chaos_score) and np.isfinite(motion_score):
+                    window[0].append(chaos_score)
+                    window[1].append(motion_score)
+                verdict = judge(window[0], window[1], thresholds)
+                self.verdicts[engine][verdict] += 1
+                verdicts[track.track_id][engine] = verdict
+
+        for per_engine in verdicts.values():
+            reference = per_engine["farneback"]
+            if reference == "pending":
+                continue
+            for engine in self.engines:
+                if engine == "farneback" or per_engine[engine] == "pending":
+                    continue
+                self.compared[engine] += 1
+                self.agree[engine] += per_engine[engine] == reference
+                self.alarm_agree[engine] += (per_engine[engine] == "live") == (reference == "live")
+
+    def report(self):
+        report = {}
+        for engine in self.engines:
+            entry = {"per_box": percentiles(self.seconds[engine]), "verdicts": dict(self.verdicts[engine])}
+            if engine != "farneback":
+                compared = self.compared[engine]
+                entry["compared_to_farneback"] = compared
+                entry["verdict_agreement"] = round(self.agree[engine] / compared, 3) if compared else None
+                # Same live / not-live decision, i.e. the same alarm
+                entry["alarm_agreement"] = round(self.alarm_agree[engine] / compared, 3) if compared else None
+            report[engine] = entry
+        return report
+
+
+def rigid_photo_frames(photo, scenario, count=RIGID_FRAMES, seed=0):
+    """The photo shaken (random offset per frame) or swaying (smooth back and forth)."""
+    h, w = photo.shape[:2]
+    rng = np.random.default_rng(seed)
+    amplitude, period = RIGID_SWAY
+    for i in range(count):
+        if scenario == "shaken":
+            dx, dy = rng.uniform(-RIGID_SHAKE, RIGID_SHAKE, 2)
+        else:
+            dx = amplitude * np.sin(2 * np.pi * i / period)
+            dy = 0.3 * amplitude * np.sin(4 * np.pi * i / period)
+        shift = np.float32([[1, 0, dx], [0, 1, dy]])
+        yield cv2.warpAffine(photo, shift, (w, h), borderMode=cv2.BORDER_REFLECT)
+
+
+def rigid_photos(inputs):
+    """Every input image plus the first frame of every video, for the rigid check."""
+    for path in inputs:
+        if os.path.isdir(path) or path.lower().endswith(IMAGE_EXTENSIONS):
+            for frame, _ in iter_frames(path):
+                yield frame
+        else:
+            for frame, _ in iter_frames(path, 1):
+                yield frame
+
+
+def rigid_photo_check(photos):
+    """Verdicts of every engine on photos moved as one piece.
+
+    The box is fixed on the middle of each photo (where the detector would
+    keep finding the pictured fire) and judged like a track. Reports live
+    verdicts per engine and scenario summed over the photos, and
+    never_live for the engines that claim to ignore rigid motion
+    (liveness.RIGID_ENGINES); plain farneback is reported but makes no claim.
+    """
+    from liveness import ENGINES, RIGID_ENGINES, engine_thresholds, liveness_scores
+    from tracker import TRACK_HISTORY, judge
+
+    report = {"photos": 0}
+    for scenario in ("shaken", "swaying"):
+        report[scenario] = {engine: {"live": 0, "judged": 0, "photos_live": 0} for engine in ENGINES}
+    for photo in photos:
+        report["photos"] += 1
+        h, w = photo.shape[:2]
+        boxes = [(w // 4, h // 4, 3 * w // 4, 3 * h // 4)]
+        for scenario in ("shaken", "swaying"):
+            frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in rigid_photo_frames(photo, scenario)]
+            for engine in ENGINES:
+                state = {}
+                chaos_window, motion_window = deque(maxlen=TRACK_HISTORY), deque(maxlen=TRACK_HISTORY)
+                live = 0
+                for prev_gray, gray in zip(frames, frames[1:]):
+                    chaos, motion = liveness_scores(engine, gray, prev_gray, boxes, state)
+                    if np.isfinite(chaos[0]) and np.isfinite(motion[0]):
+                        chaos_window.append(chaos[0])
+                        motion_window.append(motion[0])
+                    live += judge(chaos_window, motion_window, engine_thresholds(engine)) == "live"
+                entry = report[scenario][engine]
+                entry["live"] += live
+                entry["judged"] += len(frames) - 1
+                entry["photos_live"] += live > 0
+    report["never_live"] = {engine: all(report[scenario][engine]["live"] == 0 for scenario in ("shaken", "swaying"))
+                            for engine in RIGID_ENGINES}
+    return report
+
+
+def run_source(path, args, timings, outcomes, comparison=None):
+    from detector import detect_labeled_batch, crop_window, shift_boxes
+    from pipeline import Camera, analyze_detections
+
+    # A Camera without its grabber started: same tracker, gate and caches as the server
+    cam = Camera(os.path.basename(path.rstrip("/")) or path, path, path)
+    last_alert = None
+    frames = 0
+
+    for frame, ts in iter_frames(path, args.max_frames):
+        t0 = time.perf_counter()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        window = cam.plan_detection(frame, gray)
+        t1 = time.perf_counter()
+        timings["gate"].append(t1 - t0)
+
+        detections = None
+        if window:
+            conf, imgsz, mode = cam.detector_options()
+            detections = detect_labeled_batch([crop_window(frame, window)], conf, imgsz, mode)[0]
+            detections = {label: shift_boxes(boxes, window) for label, boxes in detections.items()}
+            timings["detect"].append(time.perf_counter() - t1)
+            outcomes["detector_runs"] += 1
+            if cam.escalated:
+                outcomes["detector_runs_escalated"] += 1
+            if detections["fire"]:
+                outcomes["frames_with_boxes"] += 1
+            if detections["smoke"]:
+                outcomes["frames_with_smoke_boxes"] += 1
+        else:
+            outcomes["detector_skipped"] += 1
+
+        t2 = time.perf_counter()
+        prev_gray = cam.prev_gray
+        tracks = cam.update_tracks(detections["fire"] if detections else None, gray.shape)
+        smoke_tracks = cam.update_smoke(detections["smoke"] if detections else None, gray.shape)
+        annotated, summary = analyze_detections(frame, gray, cam.prev_gray, tracks, roi_cache=cam.roi_cache,
+                                                camera_id=cam.camera_id, zone_map=cam.zone_map,
+                                                smoke_tracks=smoke_tracks, flow_size=cam.quality.flow_size,
+                                                engine=cam.liveness_engine)
+        cam.prev_gray = gray
+        t3 = time.perf_counter()
+        timings["track_liveness_draw"].append(t3 - t2)
+        for stage, seconds in summary["timings"].items():
+            timings[stage].append(seconds)
+
+        for track in tracks:
+            outcomes[f"verdict_{track.verdict}"] += 1
+        if cam.pre_alarm:
+            outcomes["frames_smoke_prealarm"] += 1
+
+        # Same decision as the server: alert on a live track, respecting the cooldown (in video time)
+        if summary["detected"]:
+            outcomes["frames_fire"] += 1
+            outcomes[f"severity_{summary['max_severity']}"] += 1
+            if last_alert is None or ts - last_alert > args.cooldown:
+                outcomes["alerts"] += 1
+                last_alert = ts
+
+        cv2.imencode('.jpg', annotated)
+        t4 = time.perf_counter()
+        timings["encode"].append(t4 - t3)
+        timings["total"].append(t4 - t0)
+        # Same latency controller as the server (--set quality_control=0 for fixed settings)
+        cam.observe_latency(t4 - t0)
+        outcomes[f"quality_level_{cam.quality.level}"] += 1
+        if comparison is not None:
+            comparison.observe(cam, gray, prev_gray, tracks)
+        frames += 1
+
+    return frames
+
+
+def synthetic_frames(count=30, shape=(360, 480), seed=0):
+    """Noise texture drifting by a random offset per frame, for --check-chaos without inputs."""
+    rng = np.random.default_rng(seed)
+    texture = cv2.GaussianBlur(rng.integers(0, 255, (shape[0] + 40, shape[1] + 40), dtype=np.uint8), (5, 5), 0)
+    for i in range(count):
+        dx, dy = rng.integers(0, 40, 2)
+        gray = texture[dy:dy + shape[0], dx:dx + shape[1]]
+        yield cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR), i / 10.0
+
+
+def liveness_cost(args):
+    """Single-thread liveness cost per detection tick, per engine and camera count.
+
+    Liveness runs on the server's detection thread after the boxes come
+    back (see server.detection_loop), one camera after the other, so this
+    is the time a tick spends on it whatever INFERENCE_WORKERS is. Every
+    camera has LIVENESS_COST_BOXES on a drifting texture at
+    LIVENESS_COST_FRAME and its own ROI cache, like Camera.roi_cache.
+    """
+    from liveness import ENGINES, liveness_scores
+
+    h, w = LIVENESS_COST_FRAME
+    grays = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+             for frame, _ in synthetic_frames(LIVENESS_COST_TICKS + 1, (h, w))]
+    report = {"frame": [w, h], "boxes_per_camera": list(LIVENESS_COST_BOXES), "engines": {}}
+    for engine in ENGINES:
+        report["engines"][engine] = entry = {}
+        for cameras in LIVENESS_COST_CAMERAS:
+            boxes = []
+            for camera in range(cameras):
+                # Spread over the frame, different per camera so no ROI is shared
+                rng = np.random.default_rng(camera)
+                boxes.append([(x, y, x + side, y + side) for side in LIVENESS_COST_BOXES
+                              for x, y in [(int(rng.integers(0, w - side)), int(rng.integers(0, h - side)))]])
+            states = [{} for _ in range(cameras)]
+            seconds = []
+            for prev_gray, gray in zip(grays, grays[1:]):
+                start = time.perf_counter()
+                for camera in range(cameras):
+                    liveness_scores(engine, gray, prev_gray, boxes[camera], states[camera])
+                seconds.append(time.perf_counter() - start)
+            tick = percentiles(seconds[1:])  # First tick fills the caches
+            entry[str(cameras)] = {"tick_ms": tick["mean_ms"], "p90_ms": tick["p90_ms"],
+                                   "max_tick_fps": round(1000.0 / tick["mean_ms"], 1) if tick["mean_ms"] else None}
+    return report
+
+
+def baseline_chaos(curr_gray, prev_gray, x1, y1, x2, y2):
+    """Frozen copy of the original per-box utils.calculate_chaos, the --check-chaos reference.
+
+    Kept here so that a change to the farneback scoring in utils.py can't
+    move the reference along with it.
+    """
+    curr_roi = curr_gray[y1:y2, x1:x2]
+    prev_roi = prev_gray[y1:y2, x1:x2]
+    if curr_roi.shape != prev_roi.shape or curr_roi.size == 0:
+        return 0, 0
+    curr_small = cv2.resize(curr_roi, (64, 64))
+    prev_small = cv2.resize(prev_roi, (64, 64))
+    flow = cv2.calcOpticalFlowFarneback(prev_small, curr_small, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+    mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+    mask = mag > 1.0
+    valid_angles = ang[mask]
+    if len(valid_angles) < 10:
+        return 0, 0
+    return np.std(valid_angles), np.mean(mag[mask])
+
+
+def check_chaos(paths, args):
+    """The farneback engine's batched scores vs baseline_chaos on the same boxes.
+
+    Per frame pair, a fixed set of boxes (inside, overlapping, on the edges,
+    tiny) plus a few random ones is scored both ways, through
+    liveness.liveness_scores as the pipeline calls it, with and without the
+    ROI cache; every score must match within CHAOS_TOLERANCE.
+    """
+    from liveness import liveness_scores
+    from utils import clip_box
+
+    rng = np.random.default_rng(1)
+    sources = [iter_frames(path, args.max_frames) for path in paths] or [synthetic_frames()]
+    pairs = 0
+    worst = 0.0
+    failures = []
+    for index, frames in enumerate(sources):
+        prev_gray = None
+        roi_cache = {}
+        boxes = None
+        for frame, _ in frames:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            h, w = gray.shape
+            if boxes is None:
+                # Same boxes across frames so the ROI cache is actually hit
+                boxes = [(w // 4, h // 4, w // 2, h // 2), (w // 3, h // 3, 2 * w // 3, 2 * h // 3),
+                         (0, 0, w // 5, h // 5), (w - 60, h - 60, w, h), (10, 10, 14, 30)]
+            extra = []
+            for _ in range(3):
+                x1, y1 = int(rng.integers(0, w - 20)), int(rng.integers(0, h - 20))
+                x2, y2 = x1 + int(rng.integers(8, 200)), y1 + int(rng.integers(8, 200))
+                extra.append(clip_box(x1, y1, x2, y2, gray.shape))
+            if prev_gray is not None:
+                pairs += 1
+                expected = np.array([baseline_chaos(gray, prev_gray, *box) for box in boxes + extra], dtype=np.float64)
+                cached = liveness_scores("farneback", gray, prev_gray, boxes, roi_cache)
+                uncached = liveness_scores("farneback", gray, prev_gray, boxes + extra, {})
+                for name, (chaos, motion), count in (("cached", cached, len(boxes)),
+                                                    ("uncached", uncached, len(boxes) + len(extra))):
+                    diff = max(float(np.abs(chaos - expected[:count, 0]).max()),
+                               float(np.abs(motion - expected[:count, 1]).max()))
+                    worst = max(worst, diff)
+                    if diff > CHAOS_TOLERANCE:
+                        failures.append(f"{paths[index] if paths else 'synthetic'}#{pairs} {name}: {diff:.6f}")
+            prev_gray = gray
+    return {"frame_pairs": pairs, "max_abs_diff": worst, "tolerance": CHAOS_TOLERANCE,
+            "equivalent": pairs > 0 and not failures, "failures": failures[:20]}
+
+
+def inside_share(box, window):
+    """Share of a box's area that lies inside a window."""
+    iw = min(box[2], window[2]) - max(box[0], window[0])
+    ih = min(box[3], window[3]) - max(box[1], window[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    return iw * ih / float(max(1, (box[2] - box[0]) * (box[3] - box[1])))
+
+
+def color_check(paths, args):
+    """Colour gate vs the full-frame detector on every frame.
+
+    A frame where the detector finds fire counts as recalled when the gate
+    kept it and every fire box lies (mostly) inside the gate's window. The
+    periodic full pass is disabled, so only the colour rule is measured.
+    """
+    from config import settings
+    from detector import detect_fire_batch
+    from gating import ColorGate
+
+    gate = ColorGate(settings.get("color_min_area"), settings.get("color_crop"), float("inf"), enabled=True)
+    gate.last_pass_time = time.time()
+    conf = settings.get("min_confidence")
+    gate_seconds = []
+    fire_frames = kept = 0
+    missed = []
+    for path in paths:
+        for index, (frame, _) in enumerate(iter_frames(path, args.max_frames)):
+            start = time.perf_counter()
+            window = gate.window(frame)
+            gate_seconds.append(time.perf_counter() - start)
+            boxes = detect_fire_batch([frame], conf)[0]
+            if not boxes:
+                continue
+            fire_frames += 1
+            if window and all(inside_share(box, window) >= 0.5 for box in boxes):
+                kept += 1
+            else:
+                missed.append(f"{path}#{index}")
+    stats = gate.stats()
+    return {
+        "frames": stats["checked"],
+        "rejected": stats["rejected"],
+        "rejection_rate": stats["rejection_rate"],
+        "cropped": stats["cropped"],
+        "mean_crop_share": stats["mean_crop_share"],
+        "gate": percentiles(gate_seconds),
+        "fire_frames": fire_frames,
+        "recall": round(kept / fire_frames, 3) if fire_frames else None,
+        "missed": missed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded footage through the detection pipeline.")
+    parser.add_argument("inputs", nargs="*", help="Video files, images or folders of images (e.g. evidence/)")
+    parser.add_argument("--startup", action="store_true", help="Only measure import and model load times")
+    parser.add_argument("--max-frames", type=int, default=None, help="Stop each input after this many frames")
+    parser.add_argument("--detect-every", type=int, default=None, help="Override DETECT_EVERY")
+    parser.add_argument("--no-gate", action="store_true", help="Disable the motion gate")
+    parser.add_argument("--cooldown", type=float, default=None, help="Alarm cooldown in seconds of footage")
+    parser.add_argument("--backend", help="Detector backend (pytorch, onnx, onnx-int8, openvino)")
+    parser.add_argument("--detect-mode", choices=("full", "tiled", "zoom"), help="Override DETECT_MODE")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override any setting from config.py (repeatable)")
+    parser.add_argument("--color-check", action="store_true",
+                        help="Measure the colour gate's rejection rate and recall against the detector")
+    parser.add_argument("--liveness-compare", action="store_true",
+                        help="Also run every liveness engine on the tracked boxes: cost per box and agreement, "
+                             "plus every input image (first frame of videos) shaken / swayed as a photo")
+    parser.add_argument("--liveness-cost", action="store_true",
+                        help="Only time the detection-thread liveness per tick for 1-16 cameras (synthetic frames)")
+    parser.add_argument("--check-chaos", action="store_true",
+                        help="Only check that the farneback engine matches the original calculate_chaos (synthetic frames if no input)")
+    parser.add_argument("--python-memory", action="store_true",
+                        help="Replay the inputs a second time under tracemalloc for the Python heap peak (untimed)")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+    if not args.inputs and not (args.startup or args.check_chaos or args.liveness_cost):
+        parser.error("at least one input is required (or --startup / --check-chaos / --liveness-cost)")
+
+    if args.backend:
+        # Must be set before detector.py is imported
+        os.environ["DETECTOR_BACKEND"] = args.backend
+    if args.detect_mode:
+        os.environ["DETECT_MODE"] = args.detect_mode
+
+    if args.startup:
+        report = startup_report()
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text)
+        return report
+
+    if args.liveness_cost:
+        report = liveness_cost(args)
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text)
+        return report
+
+    if args.check_chaos:
+        report = check_chaos(args.inputs, args)
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text)
+        return report["equivalent"]
+
+    from config import settings
+    overrides = dict(item.split("=", 1) for item in args.set)
+    if args.detect_every is not None:
+        overrides["detect_every"] = args.detect_every
+    if args.no_gate:
+        overrides["motion_gate"] = False
+    settings.update(overrides)
+    if args.cooldown is None:
+        args.cooldown = settings.get("alarm_cooldown")
+
+    timings = defaultdict(list)
+    per_source = {}
+    comparison = LivenessComparison() if args.liveness_compare else None
+    start = time.perf_counter()
+
+    for path in args.inputs:
+        outcomes = Counter()
+        source_start = time.perf_counter()
+        frames = run_source(path, args, timings, outcomes, comparison)
+        elapsed = time.perf_counter() - source_start
+        per_source[path] = {
+            "frames": frames,
+            "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+            "outcomes": dict(outcomes),
+        }
+
+    elapsed = time.perf_counter() - start
+    # Read before the tracemalloc replay, which inflates it
+    rss_peak = peak_rss_mb()
+    python_peak = python_memory_peak(args) if args.python_memory else None
+
+    total_frames = sum(s["frames"] for s in per_source.values())
+    report = {
+        "backend": os.getenv("DETECTOR_BACKEND", "pytorch"),
+        "settings": settings.effective(),
+        "frames": total_frames,
+        "seconds": round(elapsed, 3),
+        "fps": round(total_frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "stages": {name: percentiles(samples) for name, samples in timings.items()},
+        "memory": {
+            "rss_peak_mb": rss_peak,
+            "python_peak_mb": round(python_peak / (1024 * 1024), 1) if python_peak is not None else None,
+        },
+        "sources": per_source,
+    }
+    if args.color_check:
+        report["color_gate"] = color_check(args.inputs, args)
+    if comparison is not None:
+        report["liveness_engines"] = comparison.report()
+        report["liveness_engines"]["rigid_photo"] = rigid_photo_check(rigid_photos(args.inputs))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
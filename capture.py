@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class StageCounters:
+    """Thread-safe event counters with a sliding-window fps per stage."""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._events = {}
+
+    def incr(self, name, n=1):
+        now = time.time()
+        with self._lock:
+            self._totals[name] = self._totals.get(name, 0) + n
+            events = self._events.setdefault(name, deque())
+            for _ in range(n):
+                events.append(now)
+
+    def fps(self, name):
+        now = time.time()
+        with self._lock:
+            events = self._events.get(name)
+            if not events:
+                return 0.0
+            while events and now - events[0] > self.window:
+                events.popleft()
+            return len(events) / self.window
+
+    def snapshot(self):
+        with self._lock:
+            names = list(self._totals)
+        stats = {}
+        for name in names:
+            stats[name] = self._totals[name]
+            stats[f"{name}_fps"] = round(self.fps(name), 2)
+        return stats
+
+
+class FrameGrabber(threading.Thread):
+    """Capture stage that always holds only the newest frame.
+
+    A dedicated thread drains the camera as fast as it delivers, so OpenCV's
+    internal buffer never fills up behind a slow model. The consumer gets
+    the latest frame on each read(); frames it never picked up are counted
+    as dropped. Detection latency is therefore bounded by one inference
+    time instead of growing with the backlog.
+    """
+
+    def __init__(self, source=0, width=None, height=None, counters=None, realtime=True):
+        super().__init__(daemon=True)
+        self.source = source
+        self.width = width
+        self.height = height
+        # Play recorded files back at their native fps, like a live camera
+        self.realtime = realtime
+        self.counters = counters or StageCounters()
+
+        self._cap = None
+        self._cond = threading.Condition()
+        self._frame = None
+        self._captured_at = None
+        self._seq = 0
+        self._consumed_seq = 0
+        self._paused = False
+        self._running = True
+        self._frame_interval = 0.0
+        self.finished = False  # True once a video file runs out of frames
+
+    def _open(self):
+        self._cap = cv2.VideoCapture(self.source)
+        # Ask the driver to keep as few frames as possible queued
+        self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if self.width and self.height:
+            self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.realtime and not self._is_live_source():
+            fps = self._cap.get(cv2.CAP_PROP_FPS)
+            self._frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+
+    def _release(self):
+        if self._cap is not None and self._cap.isOpened():
+            self._cap.release()
+        self._cap = None
+
+    def _is_live_source(self):
+        return isinstance(self.source, int) or str(self.source).startswith(("rtsp://", "http://", "https://"))
+
+    def run(self):
+        while self._running:
+            if self._paused:
+                if self._cap is not None:
+                    self._release()
+                    print("📷 Camera Resource Released (Privacy Mode)")
+                time.sleep(0.1)
+                continue
+
+            if self._cap is None or not self._cap.isOpened():
+                self._open()
+
+            read_start = time.time()
+            success, frame = self._cap.read()
+            if not success:
+                if not self._is_live_source():
+                    # End of a recorded file, nothing more to grab
+                    self.finished = True
+                    break
+                print("📷 Camera read failed, retrying...")
+                self._release()
+                time.sleep(1.0)
+                continue
+
+            self.counters.incr("captured")
+            with self._cond:
+                if self._seq != self._consumed_seq:
+                    # Previous frame was never picked up by inference
+                    self.counters.incr("dropped")
+                self._frame = frame
+                self._captured_at = time.time()
+                self._seq += 1
+                self._cond.notify_all()
+
+            if self._frame_interval:
+                time.sleep(max(0.0, self._frame_interval - (time.time() - read_start)))
+
+        self._release()
+        with self._cond:
+            self._cond.notify_all()
+
+    def read(self, timeout=1.0):
+        """Returns (success, frame, captured_at) for the newest unseen frame."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._seq != self._consumed_seq or not self._running or self.finished,
+                timeout,
+            )
+            if self._seq == self._consumed_seq:
+                return False, None, None
+            self._consumed_seq = self._seq
+            return True, self._frame, self._captured_at
+
+    def pause(self):
+        """Releases the camera until resume() is called (privacy mode)."""
+        self._paused = True
+
+    def resume(self):
+        if self._paused:
+            print("📷 Camera Resource Re-acquired")
+        self._paused = False
+
+    @property
+    def paused(self):
+        return self._paused
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+
+from dotenv import load_dotenv
+
+# Settings are read at import, so .env has to be loaded first
+load_dotenv()
+
+# Optional JSON file, e.g. {"min_confidence": 0.4, "cameras": {"lobby": {"detect_every": 1}}}
+CONFIG_PATH = os.getenv("CONFIG_PATH", "config.json")
+
+# Every tunable: name -> (type, default, min, max). Loaded as defaults < config
+# file < environment (upper-case name, e.g. MIN_CONFIDENCE=0.4). All of them
+# can be changed at runtime, globally or per camera, through POST /api/config.
+SETTINGS = {
+    # Detection
+    "confidence_threshold": (float, 0.35, 0.0, 1.0),  # Single-frame scripts (main.py, fire_detection.py)
+    "min_confidence": (float, 0.30, 0.0, 1.0),        # Boxes fed to the tracker, which confirms over time
+    "img_size": (int, 640, 160, 1920),
+    "detect_mode": (str, "full", None, None),
+    "detect_every": (int, 3, 1, 100),
+    # Liveness (tracker verdict)
+    "chaos_threshold": (float, 0.15, 0.0, 10.0),
+    "motion_threshold": (float, 0.3, 0.0, 100.0),
+    "liveness_engine": (str, "farneback", None, None),       # see liveness.ENGINES
+    "flicker_motion_threshold": (float, 2.0, 0.0, 255.0),    # flicker engine: mean grey-level change
+    "flicker_chaos_threshold": (float, 1.3, 0.0, 2.0),       # flicker engine: high-frequency share
+    # Motion gate
+    "motion_gate": (bool, True, None, None),
+    "motion_min_changed": (float, 0.002, 0.0, 1.0),
+    "motion_max_interval": (float, 2.0, 0.0, 3600.0),
+    # Flame-colour gate (off by default: smoke-only scenes then get a full pass every color_max_interval)
+    "color_gate": (bool, False, None, None),
+    "color_min_area": (float, 0.0005, 0.0, 1.0),   # Smallest flame-coloured blob, share of the frame
+    "color_crop": (bool, True, None, None),        # Detect on the blobs' region only
+    "color_max_interval": (float, 5.0, 0.0, 3600.0),
+    # Smoke pre-alarm (same model pass as fire, boxes also need min_confidence)
+    "smoke_confidence": (float, 0.30, 0.0, 1.0),
+    "smoke_min_hits": (int, 3, 1, 100),           # Detection passes a smoke track needs before the pre-alarm
+    "smoke_hold": (float, 10.0, 0.0, 3600.0),     # Seconds pre-alarm / escalation outlive the last smoke
+    "smoke_escalate": (bool, True, None, None),   # Detect more often / finer while smoke is around
+    "smoke_detect_every": (int, 1, 1, 100),
+    "smoke_detect_mode": (str, "tiled", None, None),
+    # Adaptive quality: trade img_size / frame-skip / flow size to hold the latency budget (seconds)
+    "quality_control": (bool, True, None, None),
+    "latency_budget": (float, 0.2, 0.0, 60.0),
+    # Alarms
+    "alarm_cooldown": (float, 60.0, 0.0, 86400.0),
+}
+CHOICES = {
+    "detect_mode": ("full", "tiled", "zoom"),
+    "smoke_detect_mode": ("full", "tiled", "zoom"),
+    "liveness_engine": ("farneback", "farneback_aligned", "lk", "flicker"),
+}
+
+
+def coerce(name, value):
+    """Validates one setting, converting strings from env / JSON. Raises ValueError."""
+    if name not in SETTINGS:
+        raise ValueError(f"Unknown setting '{name}'")
+    kind, _, low, high = SETTINGS[name]
+    if kind is bool:
+        if isinstance(value, str):
+            value = value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
+    try:
+        value = kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a {kind.__name__}")
+    if name in CHOICES and value not in CHOICES[name]:
+        raise ValueError(f"{name} must be one of {CHOICES[name]}")
+    if low is not None and not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+class Settings:
+    """Typed runtime settings with optional per-camera overrides.
+
+    Readers call get() on every use, so a change made through update() is
+    picked up on the next frame without reloading the model. `version` is
+    bumped on each change for components that cache derived values.
+    """
+
+    def __init__(self, values=None, cameras=None):
+        self._lock = threading.Lock()
+        self.values = {name: spec[1] for name, spec in SETTINGS.items()}
+        self.values.update(values or {})
+        self.cameras = {camera_id: dict(overrides) for camera_id, overrides in (cameras or {}).items()}
+        self.version = 0
+
+    def get(self, name, camera_id=None):
+        overrides = self.cameras.get(camera_id)
+        if overrides and name in overrides:
+            return overrides[name]
+        return self.values[name]
+
+    def effective(self, camera_id=None):
+        return {name: self.get(name, camera_id) for name in SETTINGS}
+
+    def update(self, changes, camera_id=None):
+        """Applies a dict of changes (all or nothing), returns the effective settings.
+
+        With a camera_id the values become overrides for that camera only;
+        None as a value drops the override again.
+        """
+        validated = {name: None if value is None and camera_id else coerce(name, value)
+                     for name, value in changes.items()}
+        with self._lock:
+            if camera_id:
+                overrides = self.cameras.setdefault(camera_id, {})
+                for name, value in validated.items():
+                    if value is None:
+                        overrides.pop(name, None)
+                    else:
+                        overrides[name] = value
+            else:
+                self.values.update(validated)
+            self.version += 1
+        return self.effective(camera_id)
+
+    def snapshot(self):
+        return {"version": self.version, "defaults": dict(self.values),
+                "cameras": {camera_id: dict(o) for camera_id, o in self.cameras.items()}}
+
+
+def load_settings(path=CONFIG_PATH):
+    """Reads the config file (if any) and the environment, once at startup."""
+    values, cameras = {}, {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            data = json.load(f)
+        cameras = {camera_id: {name: coerce(name, v) for name, v in overrides.items()}
+                   for camera_id, overrides in data.pop("cameras", {}).items()}
+        values = {name: coerce(name, value) for name, value in data.items()}
+        print(f"⚙️ Loaded settings from {path}")
+
+    for name in SETTINGS:
+        env_value = os.getenv(name.upper())
+        if env_value not in (None, ""):
+            values[name] = coerce(name, env_value)
+    return Settings(values, cameras)
+
+
+settings = load_settings()
@@ -1,33 +1,129 @@
-import mysql.connector
-from mysql.connector import Error
-from dotenv import load_dotenv
+import json
 import os
-from datetime import datetime
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from telemetry import db_write_seconds
 
 # Load environment variables
 load_dotenv()
 
+# "mysql" in production, "sqlite" as a local stand-in (tests, offline boxes)
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_USER = os.getenv("DB_USER", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_NAME = os.getenv("DB_NAME", "fire_detection_db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+SQLITE_PATH = os.getenv("SQLITE_PATH", "fire_events.db")
+
+# Event writer: batched inserts flushed on size or time
+EVENT_QUEUE_SIZE = 1000
+EVENT_BATCH_SIZE = 50
+EVENT_FLUSH_INTERVAL = 1.0   # seconds
+EVENT_MAX_RETRIES = 3
+EVENT_SPOOL_PATH = os.getenv("EVENT_SPOOL_PATH", "event_spool.jsonl")
+
+# Composite indexes behind the history API (/api/events, /api/events/stats)
+EVENT_INDEXES = {
+    "idx_events_timestamp": "(timestamp)",
+    "idx_events_zone_ts": "(zone, timestamp)",
+    "idx_events_severity_ts": "(severity, timestamp)",
+    "idx_events_type_ts": "(event_type, timestamp)",
+    # Covers the stats aggregates / percentile sample, no table lookups
+    "idx_events_ts_scores": "(timestamp, zone, confidence, chaos_score)",
+}
+# 'fire' = alarm, 'smoke' = pre-alarm (persistent smoke, see pipeline.Camera.update_smoke)
+EVENT_TYPES = ("fire", "smoke")
+STATS_CACHE_TTL = 10.0  # seconds
+# /api/events/stats window when no start is given (hours before end / now)
+STATS_DEFAULT_HOURS = float(os.getenv("STATS_DEFAULT_HOURS", "24"))
+STATS_PERCENTILES = (("p50", 50), ("p90", 90), ("p99", 99))
+# Rows read for the percentiles at most: larger windows use every k-th id
+STATS_SAMPLE_ROWS = 10000
+
+_pool = None
+_pool_lock = threading.Lock()
+
+INSERT_COLUMNS = ("(timestamp, confidence, chaos_score, severity, zone, image_path, alert_sent, "
+                  "latitude, longitude, location_url, event_type)")
+
+def _placeholder():
+    return "?" if DB_BACKEND == "sqlite" else "%s"
 
 def get_db_connection():
-    """Establishes a connection to the MySQL database."""
+    """Returns a pooled connection to the database (or a SQLite connection)."""
+    global _pool
+    if DB_BACKEND == "sqlite":
+        return sqlite3.connect(SQLITE_PATH, check_same_thread=False)
+    # Imported on first use, API / SQLite processes never load the MySQL driver
+    from mysql.connector import Error, pooling
     try:
-        connection = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME
-        )
-        return connection
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name="fire_pool",
+                    pool_size=DB_POOL_SIZE,
+                    host=DB_HOST,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    database=DB_NAME
+                )
+        return _pool.get_connection()
     except Error as e:
         print(f"Error connecting to MySQL: {e}")
         return None
 
+def _release(connection):
+    """Closes a connection whatever its state.
+
+    A pooled MySQL connection only goes back to the pool through close(),
+    also when the server dropped it, otherwise every outage leaks a slot
+    until the pool is exhausted.
+    """
+    try:
+        connection.close()
+    except Exception as e:
+        print(f"⚠️ Error releasing database connection: {e}")
+
 def init_db():
     """Initializes the database and creates the table if it doesn't exist."""
+    if DB_BACKEND == "sqlite":
+        connection = get_db_connection()
+        connection.execute("""
+        CREATE TABLE IF NOT EXISTS fire_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME NOT NULL,
+            confidence FLOAT NOT NULL,
+            chaos_score FLOAT NOT NULL,
+            severity TEXT NOT NULL CHECK (severity IN ('LOW', 'MEDIUM', 'HIGH')),
+            zone VARCHAR(50) NOT NULL,
+            image_path VARCHAR(255) NOT NULL,
+            alert_sent BOOLEAN NOT NULL,
+            latitude FLOAT,
+            longitude FLOAT,
+            location_url VARCHAR(255),
+            event_type VARCHAR(10) NOT NULL DEFAULT 'fire'
+        );
+        """)
+        # Tables created before smoke events existed
+        existing = {row[1] for row in connection.execute("PRAGMA table_info(fire_events)")}
+        if "event_type" not in existing:
+            connection.execute("ALTER TABLE fire_events ADD COLUMN event_type VARCHAR(10) NOT NULL DEFAULT 'fire'")
+        for name, columns in EVENT_INDEXES.items():
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON fire_events {columns}")
+        connection.commit()
+        connection.close()
+        print(f"Table 'fire_events' checked/created in {SQLITE_PATH}.")
+        return
+
+    import mysql.connector
+    from mysql.connector import Error
     try:
         # Connect to MySQL Server (without database specified to create it)
         connection = mysql.connector.connect(
@@ -60,53 +156,360 @@ def init_db():
                 alert_sent BOOLEAN NOT NULL,
                 latitude FLOAT,
                 longitude FLOAT,
-                location_url VARCHAR(255)
+                location_url VARCHAR(255),
+                event_type VARCHAR(10) NOT NULL DEFAULT 'fire'
             );
             """
             cursor.execute(create_table_query)
             print("Table 'fire_events' checked/created successfully.")
+
+            # Tables created before smoke events existed
+            cursor.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = %s AND table_name = 'fire_events'", (DB_NAME,))
+            if "event_type" not in {row[0] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE fire_events ADD COLUMN event_type VARCHAR(10) NOT NULL DEFAULT 'fire'")
+                print("Column 'event_type' added.")
+
+            # MySQL has no CREATE INDEX IF NOT EXISTS, add whatever is missing
+            cursor.execute(
+                "SELECT DISTINCT index_name FROM information_schema.statistics "
+                "WHERE table_schema = %s AND table_name = 'fire_events'", (DB_NAME,))
+            existing = {row[0] for row in cursor.fetchall()}
+            for name, columns in EVENT_INDEXES.items():
+                if name not in existing:
+                    cursor.execute(f"CREATE INDEX {name} ON fire_events {columns}")
+                    print(f"Index '{name}' created.")
             cursor.close()
             connection.close()
             
     except Error as e:
         print(f"Error initializing database: {e}")
 
-def log_detection(confidence, chaos_score, severity, zone, image_path, alert_sent, lat=None, lon=None, location_url=None):
-    """Inserts a new fire event record into the database."""
+def _event_row(confidence, chaos_score, severity, zone, image_path, alert_sent, lat=None, lon=None, location_url=None,
+               event_type="fire"):
+    timestamp = datetime.now()
+    # map severity to Enum values if needed (ensure uppercase)
+    severity = severity.upper()
+    if severity not in ['LOW', 'MEDIUM', 'HIGH']:
+        severity = 'HIGH' # Default fallback
+    zone = str(zone)[:50]  # zone VARCHAR(50)
+
+    # Convert numpy types to python native types
+    confidence = float(confidence)
+    chaos_score = float(chaos_score)
+    if lat: lat = float(lat)
+    if lon: lon = float(lon)
+
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"Unknown event type '{event_type}'")
+
+    return (timestamp, confidence, chaos_score, severity, zone, image_path, bool(alert_sent), lat, lon, location_url,
+            event_type)
+
+def insert_events(rows):
+    """Writes a batch of event rows with one executemany. Raises on failure."""
     connection = get_db_connection()
-    if connection:
-        try:
+    if connection is None:
+        raise ConnectionError("Database unavailable")
+    try:
+        with db_write_seconds.time(backend=DB_BACKEND):
             cursor = connection.cursor()
-            
-            query = """
-            INSERT INTO fire_events 
-            (timestamp, confidence, chaos_score, severity, zone, image_path, alert_sent, latitude, longitude, location_url)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            timestamp = datetime.now()
-            # map severity to Enum values if needed (ensure uppercase)
-            severity = severity.upper()
-            if severity not in ['LOW', 'MEDIUM', 'HIGH']:
-                severity = 'HIGH' # Default fallback
-            
-            # Convert numpy types to python native types
-            confidence = float(confidence)
-            chaos_score = float(chaos_score)
-            if lat: lat = float(lat)
-            if lon: lon = float(lon)
-
-            values = (timestamp, confidence, chaos_score, severity, zone, image_path, alert_sent, lat, lon, location_url)
-            
-            cursor.execute(query, values)
+            marks = ", ".join([_placeholder()] * 11)
+            cursor.executemany(f"INSERT INTO fire_events {INSERT_COLUMNS} VALUES ({marks})", rows)
             connection.commit()
-            print(f"✅ Fire event logged to database (ID: {cursor.lastrowid})")
-            
-        except Error as e:
-            print(f"❌ Failed to log to database: {e}")
-        finally:
-            if connection.is_connected():
-                cursor.close()
-                connection.close()
+            cursor.close()
+    finally:
+        _release(connection)  # Returns it to the pool for MySQL
+
+
+class EventWriter(threading.Thread):
+    """Persistent background writer for the fire_events table.
+
+    Events go into a bounded queue and are flushed with executemany once
+    EVENT_BATCH_SIZE rows are pending or EVENT_FLUSH_INTERVAL elapsed.
+    Failed batches are retried with exponential backoff; if the database
+    stays unreachable they are spooled to a local JSONL file and replayed
+    after the next successful flush, so nothing is lost and the caller never
+    waits on MySQL.
+    """
+
+    def __init__(self, batch_size=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL,
+                 max_retries=EVENT_MAX_RETRIES, spool_path=EVENT_SPOOL_PATH, queue_size=EVENT_QUEUE_SIZE):
+        super().__init__(daemon=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spool_path = spool_path
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._spool_lock = threading.Lock()
+        self._running = True
+        self.written = 0
+        self.spooled = 0
+
+    def submit(self, row):
+        """Queues one event row, never blocks the caller."""
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            print("⚠️ Event queue full, spooling to disk")
+            self._spool([row])
+
+    def run(self):
+        while self._running or not self.queue.empty():
+            batch = []
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, rows):
+        delay = 0.5
+        for attempt in range(self.max_retries):
+            try:
+                insert_events(rows)
+                self.written += len(rows)
+                print(f"✅ {len(rows)} fire event(s) logged to database")
+                self._replay_spool()
+                return
+            except Exception as e:
+                print(f"❌ Failed to log to database (attempt {attempt + 1}): {e}")
+                time.sleep(delay)
+                delay *= 2
+        self._spool(rows)
+
+    def _spool(self, rows):
+        with self._spool_lock:
+            with open(self.spool_path, "a") as f:
+                for row in rows:
+                    record = list(row)
+                    record[0] = record[0].isoformat()
+                    f.write(json.dumps(record) + "\n")
+        self.spooled += len(rows)
+        print(f"💾 {len(rows)} fire event(s) spooled to {self.spool_path}")
+
+    def _replay_spool(self):
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return
+            with open(self.spool_path) as f:
+                rows = []
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        record[0] = datetime.fromisoformat(record[0])
+                        if len(record) == 10:
+                            record.append("fire")  # Spooled before event_type existed
+                        rows.append(tuple(record))
+            try:
+                for i in range(0, len(rows), self.batch_size):
+                    insert_events(rows[i:i + self.batch_size])
+            except Exception as e:
+                # Keep the rest of the spool for the next successful flush
+                with open(self.spool_path, "w") as f:
+                    for row in rows[i:]:
+                        record = list(row)
+                        record[0] = record[0].isoformat()
+                        f.write(json.dumps(record) + "\n")
+                print(f"❌ Spool replay interrupted: {e}")
+                return
+            os.remove(self.spool_path)
+        self.written += len(rows)
+        print(f"✅ Replayed {len(rows)} spooled fire event(s)")
+
+    def flush(self, timeout=None):
+        """Blocks until every queued event has been written or spooled."""
+        if timeout is None:
+            self.queue.join()
+            return True
+        end = time.time() + timeout
+        while self.queue.unfinished_tasks and time.time() < end:
+            time.sleep(0.05)
+        return not self.queue.unfinished_tasks
+
+    def stop(self):
+        self._running = False
+        self.join(timeout=self.flush_interval * 2 + 1)
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "written": self.written, "spooled": self.spooled}
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_event_writer():
+    """Shared EventWriter, started on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = EventWriter()
+            _writer.start()
+        return _writer
+
+def peek_event_writer():
+    """The EventWriter if something already started it, else None (never starts it)."""
+    return _writer
+
+def log_detection(confidence, chaos_score, severity, zone, image_path, alert_sent, lat=None, lon=None, location_url=None,
+                  event_type="fire"):
+    """Queues a new fire (or smoke pre-alarm) event record for the background database writer."""
+    row = _event_row(confidence, chaos_score, severity, zone, image_path, alert_sent, lat, lon, location_url,
+                     event_type)
+    get_event_writer().submit(row)
+
+
+EVENT_COLUMNS = ["id", "timestamp", "confidence", "chaos_score", "severity", "zone",
+                 "image_path", "alert_sent", "latitude", "longitude", "location_url", "event_type"]
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def cached(key, ttl, compute):
+    """Tiny TTL cache for read queries that many dashboards ask at once."""
+    now = time.time()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+    value = compute()
+    with _cache_lock:
+        _cache[key] = (now + ttl, value)
+    return value
+
+def _as_datetime(value):
+    # SQLite hands timestamps back as text, MySQL as datetime
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+def _run_query(query, params):
+    connection = get_db_connection()
+    if connection is None:
+        raise ConnectionError("Database unavailable")
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query.replace("%s", _placeholder()), params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    finally:
+        _release(connection)
+
+def _filters(start=None, end=None, zone=None, severity=None, event_type=None):
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("timestamp >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append("timestamp < %s")
+        params.append(end)
+    if zone:
+        clauses.append("zone = %s")
+        params.append(zone)
+    if severity:
+        clauses.append("severity = %s")
+        params.append(severity.upper())
+    if event_type:
+        clauses.append("event_type = %s")
+        params.append(event_type)
+    return clauses, params
+
+def encode_cursor(timestamp, event_id):
+    return f"{_as_datetime(timestamp).isoformat()}|{event_id}"
+
+def decode_cursor(cursor):
+    timestamp, event_id = cursor.rsplit("|", 1)
+    return datetime.fromisoformat(timestamp), int(event_id)
+
+def query_events(start=None, end=None, zone=None, severity=None, limit=50, cursor=None, event_type=None):
+    """Newest-first page of fire events with keyset pagination.
+
+    `cursor` is the next_cursor of the previous page; seeking on
+    (timestamp, id) keeps every page an index range scan, however deep.
+    Returns {"events": [...], "next_cursor": str or None}.
+    """
+    clauses, params = _filters(start, end, zone, severity, event_type)
+    if cursor:
+        ts, event_id = decode_cursor(cursor)
+        clauses.append("(timestamp < %s OR (timestamp = %s AND id < %s))")
+        params.extend([ts, ts, event_id])
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    query = (f"SELECT {', '.join(EVENT_COLUMNS)} FROM fire_events {where} "
+             f"ORDER BY timestamp DESC, id DESC LIMIT %s")
+    rows = _run_query(query, params + [limit + 1])
+
+    events = []
+    for row in rows[:limit]:
+        event = dict(zip(EVENT_COLUMNS, row))
+        event["timestamp"] = _as_datetime(event["timestamp"]).isoformat()
+        event["alert_sent"] = bool(event["alert_sent"])
+        events.append(event)
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[1], last[0])
+    return {"events": events, "next_cursor": next_cursor}
+
+def _percentiles(values):
+    if not values:
+        return None
+    import numpy as np
+    arr = np.asarray(values, dtype=float)
+    return {p: round(float(np.percentile(arr, q)), 4) for p, q in STATS_PERCENTILES}
+
+def event_stats(start=None, end=None, zone=None, severity=None, event_type=None):
+    """Per-zone/per-hour counts and confidence/chaos percentiles (TTL cached).
+
+    Without a start only the last STATS_DEFAULT_HOURS (before end, or now)
+    are aggregated. Counts and averages are computed in SQL, percentiles
+    from a bounded sample (see STATS_SAMPLE_ROWS).
+    """
+    def compute():
+        window_start = start
+        if window_start is None:
+            window_start = (end or datetime.now()) - timedelta(hours=STATS_DEFAULT_HOURS)
+        clauses, params = _filters(window_start, end, zone, severity, event_type)
+        where = f"WHERE {' AND '.join(clauses)}"
+        if DB_BACKEND == "sqlite":
+            hour = "strftime('%Y-%m-%d %H:00:00', timestamp)"
+        else:
+            hour = "DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00')"
+
+        buckets = _run_query(
+            f"SELECT zone, {hour} AS hour, COUNT(*) FROM fire_events {where} "
+            f"GROUP BY zone, hour ORDER BY hour", params)
+        total, avg_conf, avg_chaos = _run_query(
+            f"SELECT COUNT(*), AVG(confidence), AVG(chaos_score) FROM fire_events {where}", params)[0]
 
+        # Percentiles from at most ~STATS_SAMPLE_ROWS rows: exact on small
+        # windows, every k-th id (filtered on the index) on large ones
+        step = max(1, -(-total // STATS_SAMPLE_ROWS))
+        sample_where = f"{where} AND id % {step} = 0" if step > 1 else where
+        scores = _run_query(f"SELECT confidence, chaos_score FROM fire_events {sample_where}", params)
+        confidence = _percentiles([r[0] for r in scores])
+        chaos_score = _percentiles([r[1] for r in scores])
+        if confidence and chaos_score:
+            confidence["mean"] = round(float(avg_conf), 4)
+            chaos_score["mean"] = round(float(avg_chaos), 4)
+        return {
+            "total": total,
+            "start": _as_datetime(window_start).isoformat(),
+            "end": _as_datetime(end).isoformat() if end is not None else None,
+            "buckets": [{"zone": z, "hour": str(h), "count": c} for z, h, c in buckets],
+            "sampled_rows": len(scores),
+            "confidence": confidence,
+            "chaos_score": chaos_score,
+        }
 
+    key = ("stats", start, end, zone, severity, event_type)
+    return cached(key, STATS_CACHE_TTL, compute)
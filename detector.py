@@ -1,19 +1,291 @@
-from ultralytics import YOLO
+import os
+import threading
+import time
 
-model = YOLO("best_v2.pt")
-CONFIDENCE_THRESHOLD = 0.35
+import numpy as np
 
-def detect_fire(frame):
-    results = model(frame, imgsz=640, conf=0.35)
-    fire_boxes = []
+from config import settings
 
-    for box in results[0].boxes:
-        conf = float(box.conf[0])
-        cls = int(box.cls[0])
-        label = model.names[cls]
+# Inference backend, selected by configuration:
+#   pytorch     - best_v2.pt through PyTorch (default)
+#   onnx        - best_v2.onnx through ONNX Runtime
+#   onnx-int8   - dynamically INT8-quantized ONNX model
+#   openvino    - best_v2_openvino_model/ through OpenVINO
+# Exported files are produced (and validated) by export_model.py.
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "pytorch")
+MODEL_PATH = os.getenv("MODEL_PATH", "best_v2.pt")
+# Startup defaults, the live values come from config.settings
+CONFIDENCE_THRESHOLD = settings.get("confidence_threshold")
+IMG_SIZE = settings.get("img_size")
 
-        if label.lower() == "fire" and conf > CONFIDENCE_THRESHOLD:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            fire_boxes.append((x1, y1, x2, y2, conf))
+# How a frame is fed to the model:
+#   full   - whole frame resized to IMG_SIZE (default, cheapest)
+#   tiled  - overlapping IMG_SIZE tiles at native resolution plus the full
+#            frame, all in one batch, boxes merged across tiles
+#   zoom   - coarse full-frame pass, then native-resolution crops around the
+#            candidate boxes only (small fires at a fraction of tiled cost)
+DETECT_MODE = settings.get("detect_mode")
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+# Coarse-pass confidence that makes a region worth zooming into
+ZOOM_CANDIDATE_CONF = float(os.getenv("ZOOM_CANDIDATE_CONF", "0.15"))
+MAX_ZOOM_REGIONS = int(os.getenv("MAX_ZOOM_REGIONS", "4"))
+# Boxes overlapping more than this (intersection over the smaller box) are merged
+MERGE_OVERLAP = 0.5
+DETECT_MODES = ("full", "tiled", "zoom")  # Same as config.CHOICES
+# Classes of the model (data.yaml) that are kept; smoke drives the pre-alarm
+DETECT_LABELS = ("fire", "smoke")
 
-    return fire_boxes
+BACKENDS = ("pytorch", "onnx", "onnx-int8", "openvino")
+
+
+def model_path_for(backend, base_path=MODEL_PATH):
+    """Where the exported model of a backend lives, next to the .pt file."""
+    stem = os.path.splitext(base_path)[0]
+    if backend == "pytorch":
+        return base_path
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    if backend == "onnx-int8":
+        return f"{stem}_int8.onnx"
+    if backend == "openvino":
+        return f"{stem}_openvino_model"
+    raise ValueError(f"Unknown detector backend '{backend}', expected one of {BACKENDS}")
+
+
+def tile_grid(width, height, tile=IMG_SIZE, overlap=TILE_OVERLAP):
+    """(x1, y1, x2, y2) windows of size `tile` covering the frame with some overlap."""
+    def starts(length):
+        if length <= tile:
+            return [0]
+        step = max(1, int(tile * (1 - overlap)))
+        points = list(range(0, length - tile, step))
+        points.append(length - tile)  # Last tile flush with the edge
+        return points
+
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def zoom_region(box, width, height, size=IMG_SIZE):
+    """Native-resolution window of at least `size` pixels centred on a candidate box."""
+    x1, y1, x2, y2 = box[:4]
+    side_w = min(width, max(size, 2 * (x2 - x1)))
+    side_h = min(height, max(size, 2 * (y2 - y1)))
+    cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+    left = min(max(0, cx - side_w // 2), width - side_w)
+    top = min(max(0, cy - side_h // 2), height - side_h)
+    return left, top, left + side_w, top + side_h
+
+
+def merge_boxes(boxes, overlap=MERGE_OVERLAP):
+    """Greedy NMS across tiles / passes, highest confidence wins.
+
+    Uses intersection over the smaller box rather than IoU, so the fragment of
+    a flame cut by a tile edge is folded into the full box.
+    """
+    kept = []
+    for box in sorted(boxes, key=lambda b: b[4], reverse=True):
+        x1, y1, x2, y2 = box[:4]
+        area = max(1, (x2 - x1) * (y2 - y1))
+        duplicate = False
+        for k in kept:
+            iw = min(x2, k[2]) - max(x1, k[0])
+            ih = min(y2, k[3]) - max(y1, k[1])
+            if iw <= 0 or ih <= 0:
+                continue
+            smaller = min(area, max(1, (k[2] - k[0]) * (k[3] - k[1])))
+            if iw * ih / smaller > overlap:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(box)
+    return kept
+
+
+class FireDetector:
+    """Single entry point to the fire model, whatever runtime executes it.
+
+    Ultralytics loads .pt, .onnx and OpenVINO exports through the same YOLO
+    class, so all backends share the predict and post-processing code.
+    `mode` picks full-frame, tiled or zoom-in inference (see DETECT_MODE).
+    """
+
+    def __init__(self, backend=DETECTOR_BACKEND, model_path=None, imgsz=IMG_SIZE, mode=DETECT_MODE):
+        if mode not in DETECT_MODES:
+            raise ValueError(f"Unknown detect mode '{mode}', expected one of {DETECT_MODES}")
+        self.backend = backend
+        self.model_path = model_path or model_path_for(backend)
+        self.imgsz = imgsz
+        self.mode = mode
+        if backend != "pytorch" and not os.path.exists(self.model_path):
+            raise FileNotFoundError(
+                f"{self.model_path} not found, run: python export_model.py --backend {backend}")
+        # Imported here: ultralytics pulls in torch, which alone takes seconds
+        from ultralytics import YOLO
+        self.model = YOLO(self.model_path, task="detect")
+        self.names = self.model.names
+
+    def warm_up(self):
+        """One dummy inference so the first real frame doesn't pay for lazy init / graph compile."""
+        start = time.perf_counter()
+        self.detect_batch([np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)], conf=0.99)
+        return time.perf_counter() - start
+
+    def _labeled_boxes(self, result, conf_threshold, offset=(0, 0)):
+        """Boxes of one result per label: {"fire": [...], "smoke": [...]}."""
+        boxes = {label: [] for label in DETECT_LABELS}
+        ox, oy = offset
+
+        for box in result.boxes:
+            conf = float(box.conf[0])
+            cls = int(box.cls[0])
+            label = self.names[cls].lower()
+
+            if label in boxes and conf > conf_threshold:
+                x1, y1, x2, y2 = map(int, box.xyxy[0])
+                boxes[label].append((x1 + ox, y1 + oy, x2 + ox, y2 + oy, conf))
+
+        return boxes
+
+    def detect(self, frame, conf=CONFIDENCE_THRESHOLD):
+        return self.detect_batch([frame], conf)[0]
+
+    def detect_batch(self, frames, conf=CONFIDENCE_THRESHOLD, imgsz=None, mode=None):
+        """Runs one batched model call over several frames (one per camera).
+
+        imgsz / mode override the detector's own for this call (runtime tuning).
+        Returns a list of fire box lists, in the same order as `frames`.
+        """
+        return [boxes["fire"] for boxes in self.detect_labeled(frames, conf, imgsz, mode)]
+
+    def detect_labeled(self, frames, conf=CONFIDENCE_THRESHOLD, imgsz=None, mode=None):
+        """Same as detect_batch, but keeps every class: a {label: boxes} dict per frame.
+
+        Smoke comes out of the same forward pass as fire, so it costs nothing extra.
+        """
+        if not frames:
+            return []
+        imgsz = imgsz or self.imgsz
+        mode = mode or self.mode
+        if mode == "tiled":
+            return self._detect_tiled(frames, conf, imgsz)
+        if mode == "zoom":
+            return self._detect_zoom(frames, conf, imgsz)
+        return self._predict_regions(frames, [[None] for _ in frames], conf, imgsz)
+
+    def _predict_regions(self, frames, regions, conf, imgsz):
+        """One model call over crops of several frames, boxes mapped back per frame.
+
+        regions[i] lists (x1, y1, x2, y2) windows of frames[i]; None is the
+        whole frame.
+        """
+        crops, owners = [], []
+        for index, (frame, windows) in enumerate(zip(frames, regions)):
+            for window in windows:
+                if window is None:
+                    crops.append(frame)
+                    owners.append((index, (0, 0)))
+                else:
+                    x1, y1, x2, y2 = window
+                    crops.append(frame[y1:y2, x1:x2])
+                    owners.append((index, (x1, y1)))
+
+        boxes = [{label: [] for label in DETECT_LABELS} for _ in frames]
+        if crops:
+            results = self.model(crops, imgsz=imgsz, conf=conf, verbose=False)
+            for (index, offset), result in zip(owners, results):
+                for label, found in self._labeled_boxes(result, conf, offset).items():
+                    boxes[index][label].extend(found)
+        return boxes
+
+    def _detect_tiled(self, frames, conf, imgsz):
+        # Full frame catches fires larger than a tile, tiles catch the small ones
+        regions = []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            tiles = tile_grid(w, h, imgsz)
+            regions.append([None] + tiles if len(tiles) > 1 else [None])
+        return [{label: merge_boxes(found) for label, found in boxes.items()}
+                for boxes in self._predict_regions(frames, regions, conf, imgsz)]
+
+    def _detect_zoom(self, frames, conf, imgsz):
+        coarse_conf = min(conf, ZOOM_CANDIDATE_CONF)
+        coarse = self._predict_regions(frames, [[None] for _ in frames], coarse_conf, imgsz)
+
+        regions = []
+        for frame, found in zip(frames, coarse):
+            h, w = frame.shape[:2]
+            if w <= imgsz and h <= imgsz:
+                regions.append([])  # Coarse pass already ran at full resolution
+                continue
+            # Smoke candidates are zoomed too, a faint plume is usually small at first
+            candidates = [box for boxes in found.values() for box in boxes]
+            candidates = sorted(candidates, key=lambda b: b[4], reverse=True)[:MAX_ZOOM_REGIONS]
+            windows = merge_boxes([zoom_region(b, w, h, imgsz) + (b[4],) for b in candidates])
+            regions.append([window[:4] for window in windows])
+        zoomed = self._predict_regions(frames, regions, conf, imgsz)
+
+        merged = []
+        for coarse_boxes, zoom_boxes in zip(coarse, zoomed):
+            merged.append({label: merge_boxes(zoom_boxes[label] + [b for b in coarse_boxes[label] if b[4] > conf])
+                           for label in DETECT_LABELS})
+        return merged
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+def get_detector():
+    """Shared FireDetector, loaded and warmed up on first use (one per process)."""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            start = time.perf_counter()
+            detector = FireDetector()
+            warm_up = detector.warm_up()
+            print(f"🧠 {detector.backend} model loaded in {time.perf_counter() - start:.2f}s "
+                  f"(warm-up {warm_up * 1000:.0f} ms)")
+            _detector = detector
+        return _detector
+
+def __getattr__(name):
+    # `detector` / `model` used to be created at import, keep them reachable lazily
+    if name == "detector":
+        return get_detector()
+    if name == "model":
+        return get_detector().model
+    raise AttributeError(f"module 'detector' has no attribute '{name}'")
+
+def crop_window(frame, window):
+    """View of frame inside an (x1, y1, x2, y2) window (the whole frame for None)."""
+    if window is None:
+        return frame
+    x1, y1, x2, y2 = window
+    return frame[y1:y2, x1:x2]
+
+def shift_boxes(boxes, window):
+    """Maps boxes found in crop_window(frame, window) back to frame coordinates."""
+    if not window or (window[0] == 0 and window[1] == 0):
+        return boxes
+    dx, dy = window[:2]
+    return [(x1 + dx, y1 + dy, x2 + dx, y2 + dy, conf) for x1, y1, x2, y2, conf in boxes]
+
+def detect_fire(frame, color_gate=None):
+    """Fire boxes of one frame. With a gating.ColorGate the model only runs on
+    flame-coloured regions, frames without any return [] straight away."""
+    window = color_gate.window(frame) if color_gate is not None else None
+    if color_gate is not None and window is None:
+        return []
+    boxes = get_detector().detect(crop_window(frame, window), settings.get("confidence_threshold"))
+    return shift_boxes(boxes, window)
+
+def detect_fire_batch(frames, conf=None, imgsz=None, mode=None):
+    if conf is None:
+        conf = settings.get("confidence_threshold")
+    return get_detector().detect_batch(frames, conf, imgsz, mode)
+
+def detect_labeled_batch(frames, conf=None, imgsz=None, mode=None):
+    """Fire and smoke boxes per frame, see FireDetector.detect_labeled."""
+    if conf is None:
+        conf = settings.get("confidence_threshold")
+    return get_detector().detect_labeled(frames, conf, imgsz, mode)
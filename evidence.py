@@ -0,0 +1,270 @@
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+EVIDENCE_DIR = os.getenv("EVIDENCE_DIR", "evidence")
+# Pre/post-event frames saved as a short clip next to the still image
+EVIDENCE_CLIPS = os.getenv("EVIDENCE_CLIPS", "1") == "1"
+EVIDENCE_PRE_FRAMES = int(os.getenv("EVIDENCE_PRE_FRAMES", "20"))
+EVIDENCE_POST_FRAMES = int(os.getenv("EVIDENCE_POST_FRAMES", "20"))
+# A clip still waiting for post-event frames is written with what it has after
+# this many seconds without a new frame (camera switched off or stalled)
+EVIDENCE_CLIP_TIMEOUT = float(os.getenv("EVIDENCE_CLIP_TIMEOUT", "10"))
+# Retention: whichever limit is hit first (0 disables it)
+EVIDENCE_MAX_AGE_DAYS = float(os.getenv("EVIDENCE_MAX_AGE_DAYS", "30"))
+EVIDENCE_MAX_MB = float(os.getenv("EVIDENCE_MAX_MB", "2048"))
+RETENTION_SWEEP_INTERVAL = 60  # seconds
+WORKER_POLL_INTERVAL = 1.0  # seconds, how often stalled clips are checked
+# JPEG quality drops towards the minimum while the write queue backs up
+JPEG_QUALITY = 90
+JPEG_MIN_QUALITY = 60
+EVIDENCE_QUEUE_SIZE = 64
+
+
+class EvidenceStore:
+    """Background writer for alarm evidence (still images and short clips).
+
+    save_event() only reserves a file name and queues the work, so disk I/O
+    never stalls detection. Names carry the camera id and a millisecond
+    timestamp plus a counter, so simultaneous alerts never overwrite each
+    other. Every processed frame goes through record() as the JPEG the
+    stream already encoded, into a per-camera ring buffer; an event writes
+    the frames before it plus the next few after it as a clip, or whatever
+    it collected once the camera stops delivering frames for
+    EVIDENCE_CLIP_TIMEOUT. Old files are pruned by age and total size.
+    """
+
+    def __init__(self, directory=EVIDENCE_DIR, clips=EVIDENCE_CLIPS, pre_frames=EVIDENCE_PRE_FRAMES,
+                 post_frames=EVIDENCE_POST_FRAMES, max_age_days=EVIDENCE_MAX_AGE_DAYS, max_mb=EVIDENCE_MAX_MB,
+                 clip_timeout=EVIDENCE_CLIP_TIMEOUT):
+        self.directory = directory
+        self.clips = clips
+        self.pre_frames = pre_frames
+        self.post_frames = post_frames
+        self.clip_timeout = clip_timeout
+        self.max_age_days = max_age_days
+        self.max_mb = max_mb
+        os.makedirs(directory, exist_ok=True)
+
+        self.queue = queue.Queue(maxsize=EVIDENCE_QUEUE_SIZE)
+        self._rings = {}    # camera_id -> deque of (timestamp, jpeg bytes)
+        self._pending = {}  # camera_id -> list of clips still collecting post-event frames
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._last_sweep = 0
+        self.stats = {"images": 0, "clips": 0, "clips_incomplete": 0, "dropped": 0, "pruned": 0}
+
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _new_name(self, camera_id, extension):
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", str(camera_id))
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        return os.path.join(self.directory, f"fire_{safe_id}_{timestamp}_{counter:04d}.{extension}")
+
+    def _enqueue(self, job):
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except queue.Full:
+            self.stats["dropped"] += 1
+            print("⚠️ Evidence queue full, write dropped")
+            return False
+
+    def record(self, camera_id, jpeg):
+        """Feeds one processed frame (encoded JPEG bytes) into the camera's pre-event ring buffer."""
+        if not self.clips:
+            return
+        now = time.time()
+        with self._lock:
+            ring = self._rings.get(camera_id)
+            if ring is None:
+                ring = self._rings[camera_id] = deque(maxlen=self.pre_frames)
+            ring.append((now, jpeg))
+
+            pending = self._pending.get(camera_id)
+            if not pending:
+                return
+            done = []
+            for clip in pending:
+                clip["frames"].append((now, jpeg))
+                clip["updated"] = now
+                if len(clip["frames"]) >= clip["target"]:
+                    done.append(clip)
+            for clip in done:
+                pending.remove(clip)
+        for clip in done:
+            self._enqueue(("clip", clip["path"], clip["frames"], None))
+
+    def finish_clips(self, camera_id=None, idle=0.0):
+        """Writes pending clips with the frames they have so far.
+
+        Only clips without a new frame for `idle` seconds, of one camera or
+        of all of them; called when a camera is switched off and by the
+        worker for stalled ones. Returns the number of clips queued.
+        """
+        now = time.time()
+        finished = []
+        with self._lock:
+            for cam_id, pending in self._pending.items():
+                if camera_id is not None and cam_id != camera_id:
+                    continue
+                stale = [clip for clip in pending if now - clip["updated"] >= idle]
+                for clip in stale:
+                    pending.remove(clip)
+                finished.extend(stale)
+        for clip in finished:
+            self.stats["clips_incomplete"] += 1
+            print(f"⚠️ Evidence clip {os.path.basename(clip['path'])} cut short "
+                  f"({len(clip['frames'])}/{clip['target']} frames)")
+            self._enqueue(("clip", clip["path"], clip["frames"], None))
+        return len(finished)
+
+    def save_event(self, camera_id, frame, clip=True):
+        """Queues the still image (and clip) of an alarm.
+
+        Returns {"image_path", "clip_path", "ready"}; `ready` is a
+        threading.Event set once the still image is on disk (e.g. for the
+        email attachment).
+        """
+        image_path = self._new_name(camera_id, "jpg")
+        ready = threading.Event()
+        if not self._enqueue(("image", image_path, frame, ready)):
+            ready.set()
+
+        clip_path = None
+        if self.clips and clip:
+            clip_path = self._new_name(camera_id, "avi")
+            fallback = []
+            if not self._rings.get(camera_id):
+                # Nothing recorded yet, the alarm frame itself keeps the clip from being empty
+                ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                fallback = [(time.time(), buffer.tobytes())] if ok else []
+            with self._lock:
+                pre = list(self._rings.get(camera_id, ())) or fallback
+                self._pending.setdefault(camera_id, []).append({
+                    "path": clip_path,
+                    "frames": pre,
+                    "target": len(pre) + self.post_frames,
+                    "updated": time.time(),
+                })
+        return {"image_path": image_path, "clip_path": clip_path, "ready": ready}
+
+    def _jpeg_quality(self):
+        # Trade quality for speed/size while the writer is behind
+        backlog = self.queue.qsize() / float(self.queue.maxsize)
+        return int(JPEG_QUALITY - (JPEG_QUALITY - JPEG_MIN_QUALITY) * min(1.0, backlog * 2))
+
+    def _write_image(self, path, frame):
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self._jpeg_quality()])
+        if ok:
+            with open(path, "wb") as f:
+                f.write(buffer.tobytes())
+            self.stats["images"] += 1
+
+    def _write_clip(self, path, frames):
+        # Frames are the stream's JPEGs, decoded here on the writer thread
+        images = []
+        for timestamp, jpeg in frames:
+            image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is not None:
+                images.append((timestamp, image))
+        if not images:
+            return
+        duration = images[-1][0] - images[0][0]
+        fps = (len(images) - 1) / duration if duration > 0 else 10.0
+        h, w = images[0][1].shape[:2]
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), min(60.0, max(1.0, fps)), (w, h))
+        for _, image in images:
+            if image.shape[:2] == (h, w):
+                writer.write(image)
+        writer.release()
+        self.stats["clips"] += 1
+
+    def _worker(self):
+        while True:
+            if self.clip_timeout > 0:
+                self.finish_clips(idle=self.clip_timeout)
+            try:
+                kind, path, payload, ready = self.queue.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                if time.time() - self._last_sweep > RETENTION_SWEEP_INTERVAL:
+                    self.enforce_retention()
+                continue
+            try:
+                if kind == "image":
+                    self._write_image(path, payload)
+                else:
+                    self._write_clip(path, payload)
+            except Exception as e:
+                print(f"❌ Failed to write evidence {path}: {e}")
+            finally:
+                if ready is not None:
+                    ready.set()
+                self.queue.task_done()
+
+            if time.time() - self._last_sweep > RETENTION_SWEEP_INTERVAL:
+                self.enforce_retention()
+
+    def enforce_retention(self):
+        """Deletes evidence older than max_age_days, then oldest-first above max_mb."""
+        self._last_sweep = time.time()
+        try:
+            entries = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if os.path.isfile(path) and name.startswith("fire_"):
+                    st = os.stat(path)
+                    entries.append((st.st_mtime, st.st_size, path))
+        except OSError as e:
+            print(f"❌ Evidence retention failed: {e}")
+            return
+
+        entries.sort()
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            too_old = self.max_age_days and now - mtime > self.max_age_days * 86400
+            too_big = self.max_mb and total > self.max_mb * 1024 * 1024
+            if not (too_old or too_big):
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.stats["pruned"] += 1
+            except OSError:
+                pass
+
+    def flush(self):
+        self.queue.join()
+
+    def snapshot(self):
+        with self._lock:
+            collecting = sum(len(pending) for pending in self._pending.values())
+        return {**self.stats, "queued": self.queue.qsize(), "clips_collecting": collecting}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_evidence_store():
+    """Shared EvidenceStore, started on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EvidenceStore()
+        return _store
+
+def peek_evidence_store():
+    """The EvidenceStore if something already started it, else None (never starts it)."""
+    return _store
@@ -0,0 +1,137 @@
+"""Export best_v2.pt for CPU serving and validate it against PyTorch.
+
+    python export_model.py --backend onnx
+    python export_model.py --backend onnx-int8 --backend openvino --samples evidence/
+
+Each exported model is run on the sample images next to the PyTorch model.
+Every PyTorch box must have a counterpart with IoU >= --iou and a confidence
+within --conf-tol, otherwise the export is reported as failed. Mean fps per
+backend is printed so the gain of each runtime is visible.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import cv2
+
+from detector import BACKENDS, CONFIDENCE_THRESHOLD, IMG_SIZE, MODEL_PATH, FireDetector, model_path_for
+from tracker import iou
+
+
+def export(backend, base_path=MODEL_PATH, imgsz=IMG_SIZE):
+    from ultralytics import YOLO
+
+    target = model_path_for(backend, base_path)
+    if backend == "pytorch":
+        return target
+
+    model = YOLO(base_path)
+    if backend == "onnx":
+        # Dynamic axes so the server can batch several cameras in one call
+        exported = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    elif backend == "onnx-int8":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        fp32_path = model_path_for("onnx", base_path)
+        if not os.path.exists(fp32_path):
+            export("onnx", base_path, imgsz)
+        quantize_dynamic(fp32_path, target, weight_type=QuantType.QUInt8)
+        exported = target
+    elif backend == "openvino":
+        exported = model.export(format="openvino", imgsz=imgsz, dynamic=True)
+    else:
+        raise ValueError(f"Unknown backend '{backend}'")
+
+    if os.path.abspath(str(exported)) != os.path.abspath(target):
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        shutil.move(str(exported), target)
+    print(f"✅ Exported {backend} model to {target}")
+    return target
+
+
+def load_samples(path, limit):
+    files = sorted(f for f in os.listdir(path) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    frames = [cv2.imread(os.path.join(path, f)) for f in files[:limit]]
+    return [f for f in frames if f is not None]
+
+
+def time_detector(detector, frames, conf, repeats):
+    detector.detect(frames[0], conf)  # Warm-up
+    start = time.perf_counter()
+    outputs = []
+    for _ in range(repeats):
+        outputs = [detector.detect(frame, conf) for frame in frames]
+    elapsed = time.perf_counter() - start
+    fps = (len(frames) * repeats) / elapsed if elapsed > 0 else 0.0
+    return outputs, fps
+
+
+def compare_boxes(reference, candidate, iou_threshold, conf_tol):
+    """True when every reference box has a matching candidate box (and vice versa)."""
+    if len(reference) != len(candidate):
+        return False
+    unmatched = list(candidate)
+    for ref in reference:
+        match = None
+        for cand in unmatched:
+            if iou(ref[:4], cand[:4]) >= iou_threshold and abs(ref[4] - cand[4]) <= conf_tol:
+                match = cand
+                break
+        if match is None:
+            return False
+        unmatched.remove(match)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and validate fire model backends.")
+    parser.add_argument("--backend", action="append", choices=[b for b in BACKENDS if b != "pytorch"],
+                        help="Backend to export (repeatable), default: onnx")
+    parser.add_argument("--model", default=MODEL_PATH, help="PyTorch weights to export")
+    parser.add_argument("--samples", default="evidence", help="Folder of validation images")
+    parser.add_argument("--limit", type=int, default=20, help="Max validation images")
+    parser.add_argument("--repeats", type=int, default=3, help="Timing passes over the samples")
+    parser.add_argument("--iou", type=float, default=0.9, help="Min IoU between matched boxes")
+    parser.add_argument("--conf-tol", type=float, default=0.05, help="Max confidence difference")
+    parser.add_argument("--skip-export", action="store_true", help="Only validate existing exports")
+    args = parser.parse_args(argv)
+
+    backends = args.backend or ["onnx"]
+    frames = load_samples(args.samples, args.limit)
+    if not frames:
+        print(f"❌ No validation images found in {args.samples}")
+        return False
+
+    reference_detector = FireDetector("pytorch", args.model)
+    reference, reference_fps = time_detector(reference_detector, frames, CONFIDENCE_THRESHOLD, args.repeats)
+    report = {"pytorch": {"fps": round(reference_fps, 2)}}
+    all_ok = True
+
+    for backend in backends:
+        path = model_path_for(backend, args.model) if args.skip_export else export(backend, args.model)
+        candidate_detector = FireDetector(backend, path)
+        outputs, fps = time_detector(candidate_detector, frames, CONFIDENCE_THRESHOLD, args.repeats)
+        mismatches = [i for i, (ref, cand) in enumerate(zip(reference, outputs))
+                      if not compare_boxes(ref, cand, args.iou, args.conf_tol)]
+        ok = not mismatches
+        all_ok = all_ok and ok
+        report[backend] = {
+            "path": path,
+            "fps": round(fps, 2),
+            "speedup": round(fps / reference_fps, 2) if reference_fps else None,
+            "matches_pytorch": ok,
+            "mismatched_images": mismatches,
+        }
+        print(f"{'✅' if ok else '❌'} {backend}: {fps:.1f} fps "
+              f"({report[backend]['speedup']}x vs PyTorch), {len(mismatches)} mismatched image(s)")
+
+    print(json.dumps(report, indent=2))
+    return all_ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -1,49 +1,52 @@
 import cv2
 import os
 import time
-import winsound
-from datetime import datetime
-from ultralytics import YOLO
-
-# Load Fire Detection Model
-model = YOLO("best_v2.pt")
+from audio import play_alarm
+from capture import FrameGrabber
+from utils import save_fire_image
+# Shared fire model (backend selected by DETECTOR_BACKEND)
+from detector import detect_labeled_batch
+from config import settings
 
 # Create evidence folder if not exists
 if not os.path.exists("evidence"):
     os.makedirs("evidence")
 
-CONFIDENCE_THRESHOLD = 0.60
-ALARM_COOLDOWN = 5  # seconds between alarms
+# confidence_threshold / alarm_cooldown come from config.py
 last_alarm_time = 0
 
-def play_alarm():
-    # Play alarm sound asynchronously (no freeze)
-    winsound.PlaySound("alarm.wav", winsound.SND_FILENAME | winsound.SND_ASYNC)
-
 def start_camera():
     global last_alarm_time
 
-    cap = cv2.VideoCapture(0)
+    grabber = FrameGrabber(0)
+    grabber.start()
     fire_detected_last_frame = False
 
     while True:
-        ret, frame = cap.read()
+        # Newest frame only, older ones are dropped while the model runs
+        ret, frame, _ = grabber.read()
         if not ret:
-            break
+            if grabber.finished or not grabber.is_alive():
+                break
+            continue
 
-        results = model(frame)
+        confidence_threshold = settings.get("confidence_threshold")
+        detections = detect_labeled_batch([frame], conf=confidence_threshold)[0]
+        fire_boxes = detections["fire"]
         fire_detected = False
 
-        for box in results[0].boxes:
-            conf = float(box.conf[0])
-            cls = int(box.cls[0])
-            label = model.names[cls]
+        # Smoke is only drawn here, the server applies the pre-alarm persistence rules
+        for (x1, y1, x2, y2, conf) in detections["smoke"]:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (180, 180, 180), 2)
+            cv2.putText(frame, f"SMOKE {conf:.2f}",
+                        (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                        (180, 180, 180), 2)
 
-            if label.lower() == "fire" and conf > CONFIDENCE_THRESHOLD:
+        for (x1, y1, x2, y2, conf) in fire_boxes:
+            if conf > confidence_threshold:
                 fire_detected = True
 
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-
                 # Draw bounding box
                 cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
                 cv2.putText(frame, f"FIRE {conf:.2f}",
@@ -60,22 +63,24 @@ def start_camera():
             current_time = time.time()
 
             # Alarm + save only if cooldown passed
-            if current_time - last_alarm_time > ALARM_COOLDOWN:
+            if current_time - last_alarm_time > settings.get("alarm_cooldown"):
                 last_alarm_time = current_time
 
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"evidence/fire_{timestamp}.jpg"
-                cv2.imwrite(filename, frame)
+                # Queued on the background evidence writer (unique per-camera name)
+                filename = save_fire_image(frame)
                 print(f"[ALERT] Fire detected! Image saved: {filename}")
 
                 play_alarm()
 
         cv2.imshow("🔥 Fire Detection System", frame)
 
+        grabber.counters.incr("processed")
+
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
-    cap.release()
+    print(f"Pipeline stats: {grabber.counters.snapshot()}")
+    grabber.stop()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+import time
+
+import cv2
+import numpy as np
+
+from config import settings
+
+# Motion gate: only call the detector when the scene changed
+MOTION_GATE_ENABLED = settings.get("motion_gate")
+# Per-pixel intensity change (0-255) that counts as "changed"
+MOTION_PIXEL_THRESHOLD = 25
+# Fraction of changed pixels needed to run the detector
+MOTION_MIN_CHANGED = settings.get("motion_min_changed")
+# Re-scan at least this often (seconds) even on a static scene
+MOTION_MAX_INTERVAL = settings.get("motion_max_interval")
+# Gate works on a frame downscaled by this factor
+MOTION_DOWNSCALE = 4
+
+# Colour gate: only call the detector when flame-coloured blobs are present
+COLOR_GATE_ENABLED = settings.get("color_gate")
+# Smallest blob worth a detector pass, as a fraction of the frame
+COLOR_MIN_AREA = settings.get("color_min_area")
+# Run the detector on the blobs' bounding region only
+COLOR_CROP = settings.get("color_crop")
+# Full-frame pass at least this often (seconds), e.g. for smoke without visible flame
+COLOR_MAX_INTERVAL = settings.get("color_max_interval")
+COLOR_DOWNSCALE = 4
+# Flame pixels, OpenCV HSV (H is 0-179): red to yellow hue, saturated and bright...
+FLAME_HUE_MAX = 35
+FLAME_HUE_WRAP = 170  # Reds just below 360 degrees
+FLAME_MIN_SATURATION = 60
+FLAME_MIN_VALUE = 150
+# ...and in YCrCb redder than blue (Cr > Cb) with the luma above the blue chroma (Y > Cb)
+FLAME_MIN_CR = 135
+# Crop around the blobs: padding (share of the region size) and smallest side (share of the frame)
+COLOR_CROP_PADDING = 0.5
+COLOR_CROP_MIN_SIDE = 0.5
+# Crops larger than this share of the frame aren't worth it, the full frame is used
+COLOR_CROP_MAX_AREA = 0.6
+
+
+class _MaskedGate:
+    """Shared by the gates: an optional full-size mask of pixels to leave out (excluded zones)."""
+
+    def __init__(self):
+        self.ignore_mask = None
+        self._small_ignore = (None, None)
+
+    def _small_ignore_mask(self, shape):
+        # Downscaled once per mask / resolution
+        mask, cached = self._small_ignore
+        if mask is not self.ignore_mask or cached is None or cached.shape != shape:
+            small = cv2.resize(self.ignore_mask.astype(np.uint8), (shape[1], shape[0]),
+                               interpolation=cv2.INTER_NEAREST)
+            cached = small.astype(bool)
+            self._small_ignore = (self.ignore_mask, cached)
+        return cached
+
+
+class MotionGate(_MaskedGate):
+    """Cheap frame-difference gate in front of the detector.
+
+    The grayscale frame is downscaled and blurred, then compared with the one
+    the detector last ran on. YOLO only runs when enough pixels changed since
+    then, or when max_interval seconds passed, so a static room costs almost
+    nothing while changes are still picked up within one frame.
+    """
+
+    def __init__(self, min_changed=MOTION_MIN_CHANGED, max_interval=MOTION_MAX_INTERVAL,
+                 pixel_threshold=MOTION_PIXEL_THRESHOLD, enabled=MOTION_GATE_ENABLED):
+        super().__init__()
+        self.min_changed = min_changed
+        self.max_interval = max_interval
+        self.pixel_threshold = pixel_threshold
+        self.enabled = enabled
+        self.reference = None
+        self.last_pass_time = 0
+        self.checked = 0
+        self.skipped = 0
+        self.changed_ratio = 0.0
+
+    def _small(self, gray):
+        h, w = gray.shape[:2]
+        small = cv2.resize(gray, (max(1, w // MOTION_DOWNSCALE), max(1, h // MOTION_DOWNSCALE)),
+                           interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def should_detect(self, gray):
+        """True when the detector should run on this frame."""
+        self.checked += 1
+        if not self.enabled:
+            return True
+
+        small = self._small(gray)
+        now = time.time()
+        if self.reference is None or self.reference.shape != small.shape:
+            changed = True
+            self.changed_ratio = 1.0
+        else:
+            diff = cv2.absdiff(small, self.reference)
+            changed_pixels = diff > self.pixel_threshold
+            watched = diff.size
+            if self.ignore_mask is not None:
+                # Flicker of a TV / window in an excluded zone must not wake the detector
+                ignore = self._small_ignore_mask(small.shape)
+                changed_pixels &= ~ignore
+                watched = max(1, diff.size - int(np.count_nonzero(ignore)))
+            self.changed_ratio = float(np.count_nonzero(changed_pixels)) / watched
+            changed = self.changed_ratio >= self.min_changed
+
+        if changed or now - self.last_pass_time >= self.max_interval:
+            self.reference = small
+            self.last_pass_time = now
+            return True
+
+        self.skipped += 1
+        return False
+
+    def reset(self):
+        self.reference = None
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skipped / self.checked, 3) if self.checked else 0.0,
+            "changed_ratio": round(self.changed_ratio, 4),
+        }
+
+
+def flame_mask(small_bgr):
+    """Bool mask of flame-coloured pixels (HSV and YCrCb rules, vectorized)."""
+    hsv = cv2.cvtColor(small_bgr, cv2.COLOR_BGR2HSV)
+    hue, sat, val = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    mask = (hue <= FLAME_HUE_MAX) | (hue >= FLAME_HUE_WRAP)
+    mask &= (sat >= FLAME_MIN_SATURATION) & (val >= FLAME_MIN_VALUE)
+
+    ycrcb = cv2.cvtColor(small_bgr, cv2.COLOR_BGR2YCrCb)
+    y, cr, cb = ycrcb[..., 0], ycrcb[..., 1], ycrcb[..., 2]
+    mask &= (cr > cb) & (y > cb) & (cr >= FLAME_MIN_CR)
+    return mask
+
+
+class ColorGate(_MaskedGate):
+    """Flame-colour pre-filter in front of the detector.
+
+    A downscaled copy of the frame is checked for flame-coloured blobs. No
+    blob: the detector is skipped (except for a full pass every
+    max_interval seconds). Blobs: with `crop`, the detector only looks at
+    their padded bounding region. Grey smoke has no flame colour, so cameras
+    escalated by smoke bypass this gate (see pipeline.Camera).
+    """
+
+    def __init__(self, min_area=COLOR_MIN_AREA, crop=COLOR_CROP, max_interval=COLOR_MAX_INTERVAL,
+                 enabled=COLOR_GATE_ENABLED):
+        super().__init__()
+        self.min_area = min_area
+        self.crop = crop
+        self.max_interval = max_interval
+        self.enabled = enabled
+        self.last_pass_time = 0
+        self.checked = 0
+        self.rejected = 0
+        self.cropped = 0
+        self.crop_area = 0.0  # Sum of cropped frame shares, for the mean
+        self.last_seconds = 0.0
+
+    def candidates(self, frame):
+        """(x1, y1, x2, y2) boxes of the flame-coloured blobs, in full-frame pixels."""
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (max(1, w // COLOR_DOWNSCALE), max(1, h // COLOR_DOWNSCALE)),
+                           interpolation=cv2.INTER_AREA)
+        mask = flame_mask(small)
+        if self.ignore_mask is not None:
+            mask &= ~self._small_ignore_mask(mask.shape)
+        if not mask.any():
+            return []
+        # Opening drops single-pixel speckle (reflections, compression noise)
+        mask = cv2.morphologyEx(mask.astype(np.uint8), cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        min_pixels = max(2, self.min_area * mask.size)
+        scale_x, scale_y = w / mask.shape[1], h / mask.shape[0]
+        blobs = []
+        for x, y, bw, bh, area in stats[1:count]:
+            if area >= min_pixels:
+                blobs.append((int(x * scale_x), int(y * scale_y),
+                              int((x + bw) * scale_x), int((y + bh) * scale_y)))
+        return blobs
+
+    def window(self, frame):
+        """(x1, y1, x2, y2) of the frame the detector should see, None to skip it."""
+        h, w = frame.shape[:2]
+        full = (0, 0, w, h)
+        self.checked += 1
+        if not self.enabled:
+            return full
+
+        start = time.perf_counter()
+        blobs = self.candidates(frame)
+        self.last_seconds = time.perf_counter() - start
+        now = time.time()
+        if not blobs:
+            if now - self.last_pass_time >= self.max_interval:
+                self.last_pass_time = now
+                return full
+            self.rejected += 1
+            return None
+        self.last_pass_time = now
+        if not self.crop:
+            return full
+
+        x1, y1 = min(b[0] for b in blobs), min(b[1] for b in blobs)
+        x2, y2 = max(b[2] for b in blobs), max(b[3] for b in blobs)
+        pad = int(COLOR_CROP_PADDING * max(x2 - x1, y2 - y1))
+        side = int(COLOR_CROP_MIN_SIDE * min(w, h))
+        cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+        half_w = max(side, x2 - x1 + 2 * pad) // 2
+        half_h = max(side, y2 - y1 + 2 * pad) // 2
+        x1, x2 = max(0, cx - half_w), min(w, cx + half_w)
+        y1, y2 = max(0, cy - half_h), min(h, cy + half_h)
+        share = (x2 - x1) * (y2 - y1) / float(w * h)
+        if share > COLOR_CROP_MAX_AREA:
+            return full
+        self.cropped += 1
+        self.crop_area += share
+        return (x1, y1, x2, y2)
+
+    def reset(self):
+        self.last_pass_time = 0
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "checked": self.checked,
+            "rejected": self.rejected,
+            "cropped": self.cropped,
+            "rejection_rate": round(self.rejected / self.checked, 3) if self.checked else 0.0,
+            "mean_crop_share": round(self.crop_area / self.cropped, 3) if self.cropped else None,
+            "last_ms": round(self.last_seconds * 1000, 3),
+        }
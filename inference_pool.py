@@ -0,0 +1,298 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Detector processes; 0 runs inference inside the web process (default)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+# Torch / OpenMP threads per worker, default splits the cores between workers
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+# Frame slots per camera ring
+RING_SLOTS = 2
+# Seconds to wait for a worker before the batch is carried by the trackers
+RESULT_TIMEOUT = 10.0
+# How often a waiting collect() checks that the workers are still alive
+WORKER_CHECK_INTERVAL = 0.25
+# Model load + warm-up allowance for each worker at startup
+STARTUP_TIMEOUT = 120.0
+
+
+class FrameRing:
+    """Fixed slots of one camera's frames in shared memory.
+
+    The web process copies a frame into a free slot and only sends the slot
+    index and shape over the task queue, so a 1280x720 frame costs one memcpy
+    instead of pickling 2.7 MB per hop. A slot is busy until its result is
+    back.
+    """
+
+    def __init__(self, frame_bytes, slots=RING_SLOTS):
+        self.slot_bytes = frame_bytes
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(create=True, size=frame_bytes * slots)
+        self.busy = set()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, frame):
+        """Copies frame into a free slot, returns the slot index (None if all are busy)."""
+        for slot in range(self.slots):
+            if slot not in self.busy:
+                view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf,
+                                  offset=slot * self.slot_bytes)
+                view[...] = frame
+                self.busy.add(slot)
+                return slot
+        return None
+
+    def release(self, slot):
+        self.busy.discard(slot)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _worker_main(worker_id, tasks, results, threads):
+    # Runs in a spawned process: cap the math libraries before torch is imported
+    if threads:
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+        os.environ["MKL_NUM_THREADS"] = str(threads)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    from detector import get_detector
+
+    get_detector()  # Load + warm up before taking work
+    results.put(("ready", worker_id, None, None))
+    attached = {}  # shm name -> SharedMemory
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, options, frames = task
+        # Lets the pool fail this task at once if the process dies on it
+        results.put(("taken", worker_id, task_id, None))
+        start = time.perf_counter()
+        try:
+            images = []
+            for shm_name, offset, shape in frames:
+                shm = attached.get(shm_name)
+                if shm is None:
+                    shm = attached[shm_name] = shared_memory.SharedMemory(name=shm_name)
+                images.append(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset))
+            conf, imgsz, mode = options
+            boxes = get_detector().detect_labeled(images, conf, imgsz, mode)
+            del images  # Drop the views before the slots are reused
+            results.put((task_id, worker_id, boxes, time.perf_counter() - start))
+        except Exception as e:
+            results.put((task_id, worker_id, None, repr(e)))
+
+    for shm in attached.values():
+        shm.close()
+
+
+class InferencePool:
+    """Detector worker processes fed through per-camera shared-memory rings.
+
+    submit(groups) splits every group of frames sharing the same detector
+    options across the workers and returns at once; collect(ticket) waits
+    for that submission's boxes per camera. The caller can submit the next
+    tick before post-processing the previous one, so the workers infer
+    while tracking, liveness, drawing and encoding run in the web process
+    (which keeps their per-track state; see server.detection_loop for what
+    liveness costs there). RING_SLOTS = 2 covers one tick in
+    flight plus the one being staged. A worker that dies is restarted and
+    the tasks it had taken fail right away instead of timing out.
+    """
+
+    def __init__(self, workers=INFERENCE_WORKERS, threads=INFERENCE_THREADS):
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // max(1, workers))
+        self.context = mp.get_context("spawn")  # Torch is not fork-safe
+        self.tasks = self.context.Queue()
+        self.results = self.context.Queue()
+        self.rings = {}
+        self.processes = {}
+        self._task_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._outstanding = set()  # Submitted task ids not collected / given up yet
+        self._early = {}           # task_id -> result of another ticket, read while collecting
+        self._taken = {}           # task_id -> worker_id working on it
+        self._lost = set()         # Tasks whose worker died
+        self.stats = {"tasks": 0, "frames": 0, "errors": 0, "timeouts": 0, "restarts": 0, "ring_full": 0,
+                      "lost": 0}
+        for worker_id in range(workers):
+            self._spawn(worker_id)
+        self._wait_ready()
+
+    def _spawn(self, worker_id):
+        process = self.context.Process(target=_worker_main, daemon=True, name=f"inference-{worker_id}",
+                                       args=(worker_id, self.tasks, self.results, self.threads))
+        process.start()
+        self.processes[worker_id] = process
+
+    def _wait_ready(self):
+        # First frames would otherwise time out while the models are still loading
+        ready = 0
+        deadline = time.time() + STARTUP_TIMEOUT
+        while ready < self.workers and time.time() < deadline:
+            try:
+                message = self.results.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self.processes.values()):
+                    break
+                continue
+            if message[0] == "ready":
+                ready += 1
+        if ready < self.workers:
+            print(f"⚠️ Only {ready}/{self.workers} inference worker(s) ready")
+
+    def _check_workers(self):
+        for worker_id, process in list(self.processes.items()):
+            if not process.is_alive():
+                lost = {task_id for task_id, owner in self._taken.items() if owner == worker_id}
+                print(f"⚠️ Inference worker {worker_id} died (exit {process.exitcode}), restarting"
+                      + (f", {len(lost)} task(s) lost" if lost else ""))
+                self.stats["restarts"] += 1
+                self.stats["lost"] += len(lost)
+                for task_id in lost:
+                    del self._taken[task_id]
+                self._lost |= lost & self._outstanding
+                self._spawn(worker_id)
+
+    def _ring(self, camera_id, frame):
+        ring = self.rings.get(camera_id)
+        if ring is None or ring.slot_bytes < frame.nbytes:
+            if ring is not None:
+                if ring.busy:
+                    return None  # A frame in flight still reads the old ring, carry this one
+                ring.close()
+            ring = self.rings[camera_id] = FrameRing(frame.nbytes)
+        return ring
+
+    def submit(self, groups):
+        """groups: {(conf, imgsz, mode): [(camera_id, frame), ...]}.
+
+        Copies the frames into the rings and queues the tasks without
+        waiting; returns the ticket to hand to collect().
+        """
+        with self._lock:
+            self._check_workers()
+            ticket = {}
+            for options, members in groups.items():
+                staged = []
+                for camera_id, frame in members:
+                    frame = np.ascontiguousarray(frame, dtype=np.uint8)
+                    ring = self._ring(camera_id, frame)
+                    slot = ring.write(frame) if ring is not None else None
+                    if slot is None:
+                        self.stats["ring_full"] += 1
+                        continue
+                    staged.append((camera_id, ring, slot, frame.shape))
+
+                # Spread the group over the workers, each one still batches its share
+                chunk = max(1, -(-len(staged) // max(1, self.workers)))
+                for i in range(0, len(staged), chunk):
+                    part = staged[i:i + chunk]
+                    task_id = next(self._task_ids)
+                    frames = [(ring.name, slot * ring.slot_bytes, shape) for _, ring, slot, shape in part]
+                    self.tasks.put((task_id, options, frames))
+                    ticket[task_id] = part
+                    self._outstanding.add(task_id)
+                    self.stats["tasks"] += 1
+            return ticket
+
+    def _finish(self, task_id, part):
+        self._outstanding.discard(task_id)
+        self._taken.pop(task_id, None)
+        self._lost.discard(task_id)
+        for _, ring, slot, _ in part:
+            ring.release(slot)
+
+    def collect(self, ticket, timeout=RESULT_TIMEOUT):
+        """Waits for a submit()'s results.
+
+        Returns ({camera_id: {label: boxes}}, {camera_id: seconds}). Cameras
+        whose frame couldn't be processed (worker error, death or timeout)
+        are missing from the result, their tracker carries them.
+        """
+        with self._lock:
+            pending = dict(ticket)
+            boxes, timings = {}, {}
+            deadline = time.time() + timeout
+            while pending:
+                for task_id in [t for t in pending if t in self._lost]:
+                    self._finish(task_id, pending.pop(task_id))
+                    self.stats["errors"] += 1
+                message = next((self._early.pop(t) for t in pending if t in self._early), None)
+                if message is None:
+                    if not pending:
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        print(f"⚠️ {len(pending)} inference task(s) timed out")
+                        break
+                    try:
+                        message = self.results.get(timeout=min(WORKER_CHECK_INTERVAL, remaining))
+                    except queue.Empty:
+                        self._check_workers()
+                        continue
+
+                task_id, worker_id, result, info = message
+                if task_id == "ready":
+                    continue
+                if task_id == "taken":
+                    if result in self._outstanding:
+                        self._taken[result] = worker_id
+                    continue
+                part = pending.pop(task_id, None)
+                if part is None:
+                    if task_id in self._outstanding:
+                        self._early[task_id] = message  # Belongs to a ticket collected later
+                    continue  # Else a late answer to a timed-out task
+                self._finish(task_id, part)
+                if result is None:
+                    self.stats["errors"] += 1
+                    print(f"❌ Inference worker {worker_id} failed: {info}")
+                    continue
+                for (camera_id, _, _, _), camera_boxes in zip(part, result):
+                    boxes[camera_id] = camera_boxes
+                    timings[camera_id] = info
+                self.stats["frames"] += len(part)
+
+            # Free the slots of timed-out tasks too: a late worker may read a newer
+            # frame, but its answer is dropped anyway
+            for task_id, part in pending.items():
+                self._finish(task_id, part)
+            return boxes, timings
+
+    def detect(self, groups):
+        """submit() + collect() in one call, for callers that don't overlap ticks."""
+        return self.collect(self.submit(groups))
+
+    def snapshot(self):
+        return {**self.stats, "workers": self.workers, "threads_per_worker": self.threads,
+                "alive": sum(p.is_alive() for p in self.processes.values())}
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes.values():
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
@@ -0,0 +1,285 @@
+from collections import deque
+
+import cv2
+import numpy as np
+
+from config import settings
+from utils import FLOW_SIZE, calculate_chaos_batch
+
+# How a track's liveness samples are measured:
+#   farneback         - dense optical flow per ROI, spread of the flow angles (default)
+#   farneback_aligned - the same flow once the box's global shift is taken
+#                       out (align_previous), so a shaken / swaying photo
+#                       leaves nothing to score; costs more per box
+#   lk                - pyramidal Lucas-Kanade on aligned corners inside the
+#                       ROI, circular spread of the motion directions (a
+#                       fraction of the cost)
+#   flicker           - temporal high-frequency energy of the intensity over
+#                       the last frames once the box's global shift is taken
+#                       out, flames flicker, moved photos only translate
+# Every engine returns (chaos, motion) per box, judged by tracker.Track.verdict.
+LIVENESS_ENGINE = settings.get("liveness_engine")
+ENGINES = ("farneback", "farneback_aligned", "lk", "flicker")  # Same as config.CHOICES
+# Engines that take out rigid motion, i.e. a moved photo must never be live
+# (benchmark.py --liveness-compare checks it)
+RIGID_ENGINES = ("farneback_aligned", "lk", "flicker")
+
+# Lucas-Kanade: corners per ROI, tracking window and pyramid levels
+LK_MAX_CORNERS = 40
+LK_MIN_POINTS = 5
+LK_WINDOW = 9
+LK_LEVELS = 2
+# Aligned engines: pixels (at FLOW_SIZE) past the border filled in by the
+# alignment that the flow window still smears into
+ALIGN_BORDER = 5
+# farneback_aligned: moving pixels (out of FLOW_SIZE x FLOW_SIZE) below which
+# a frame has no significant motion, and the texture (minimum eigenvalue of
+# the gradients) a pixel needs for its flow to count; flat or saturated
+# areas give flow in random directions
+ALIGNED_MIN_PIXELS = 64
+ALIGNED_MIN_TEXTURE = 0.0005
+# Flicker: frames kept per camera, at 1/FLICKER_DOWNSCALE of the resolution
+FLICKER_FRAMES = 8
+FLICKER_DOWNSCALE = 4
+# Flicker: blur (sigma, downscaled pixels) against sub-pixel alignment residue
+FLICKER_BLUR = 0.8
+
+
+def engine_thresholds(engine, camera_id=None):
+    """Verdict thresholds for an engine; flicker scores are intensities, not flow."""
+    if engine == "flicker":
+        return {"motion": settings.get("flicker_motion_threshold", camera_id),
+                "chaos": settings.get("flicker_chaos_threshold", camera_id)}
+    return {"motion": settings.get("motion_threshold", camera_id),
+            "chaos": settings.get("chaos_threshold", camera_id)}
+
+
+def circular_spread(angles):
+    """Circular standard deviation (radians) of a set of directions.
+
+    Derived from the circular variance 1 - R: 0 when every vector points the
+    same way, large when they point everywhere, and unlike np.std it doesn't
+    jump when the directions straddle 0 / 2*pi. For concentrated directions
+    it matches the linear std, so chaos_threshold keeps its meaning.
+    """
+    resultant = np.hypot(np.cos(angles).mean(), np.sin(angles).mean())
+    return float(np.sqrt(-2.0 * np.log(max(resultant, 1e-3))))
+
+
+_HANNING = {}
+
+
+def align_previous(prev_small, curr_small):
+    """Shifts prev_small onto curr_small by the ROI's global (rigid) motion.
+
+    A photo or screen waved in front of the camera moves as one piece; once
+    that shift is taken out only the motion inside the box is left, which is
+    what tells a flame from a moved picture. Returns (aligned, margin) where
+    margin is the (x, y) border width in pixels to ignore: what came from
+    outside the ROI plus ALIGN_BORDER.
+    """
+    size = curr_small.shape[::-1]
+    window = _HANNING.get(size)
+    if window is None:
+        window = _HANNING[size] = cv2.createHanningWindow(size, cv2.CV_32F)
+    # Float copies (phaseCorrelate may apply the window in place)
+    (dx, dy), _ = cv2.phaseCorrelate(np.float32(prev_small), np.float32(curr_small), window)
+    shift = np.float32([[1, 0, dx], [0, 1, dy]])
+    aligned = cv2.warpAffine(prev_small, shift, size, borderMode=cv2.BORDER_REPLICATE)
+    pad = int(round(ALIGN_BORDER * min(size) / float(FLOW_SIZE)))
+    limit = min(size) // 4
+    return aligned, (min(int(np.ceil(abs(dx))) + pad, limit), min(int(np.ceil(abs(dy))) + pad, limit))
+
+
+def aligned_rois(curr_gray, prev_gray, box, prev_rois, next_rois, flow_size):
+    """(aligned previous ROI, current ROI, margin) for one box, resized to flow_size.
+
+    Resized with INTER_AREA: a plain resize of a large box aliases, and the
+    aliasing changes with every sub-pixel shift, which no alignment removes.
+    Current ROIs go to next_rois, keyed by box, for the next frame.
+    """
+    x1, y1, x2, y2 = box[:4]
+    key = (x1, y1, x2, y2)
+    prev_small = prev_rois.get(key)
+    if prev_small is None or prev_small.shape[0] != flow_size:
+        prev_small = cv2.resize(prev_gray[y1:y2, x1:x2], (flow_size, flow_size), interpolation=cv2.INTER_AREA)
+    curr_small = cv2.resize(curr_gray[y1:y2, x1:x2], (flow_size, flow_size), interpolation=cv2.INTER_AREA)
+    next_rois[key] = curr_small
+    prev_small, margin = align_previous(prev_small, curr_small)
+    return prev_small, curr_small, margin
+
+
+def aligned_flow_scores(curr_gray, prev_gray, boxes, roi_cache=None, flow_size=FLOW_SIZE):
+    """Dense-flow liveness once the box's global shift is taken out.
+
+    Same inputs, outputs and scale as utils.calculate_chaos_batch, which
+    stays the reference farneback scorer. Only pixels away from the aligned
+    border, with texture and more than 1 px of flow count; chaos is their
+    circular spread, motion their mean flow.
+    """
+    n = len(boxes)
+    chaos_scores = np.zeros(n, dtype=np.float64)
+    magnitude_scores = np.zeros(n, dtype=np.float64)
+    prev_rois = roi_cache if roi_cache is not None else {}
+    next_rois = {}
+    scale = FLOW_SIZE / float(flow_size)
+
+    for i, box in enumerate(boxes):
+        x1, y1, x2, y2 = box[:4]
+        if curr_gray[y1:y2, x1:x2].size == 0:
+            continue
+        prev_small, curr_small, (mx, my) = aligned_rois(curr_gray, prev_gray, box, prev_rois, next_rois, flow_size)
+        flow = cv2.calcOpticalFlowFarneback(prev_small, curr_small, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+        mag *= scale
+
+        moving = (mag > 1.0) & (cv2.cornerMinEigenVal(curr_small, 5) > ALIGNED_MIN_TEXTURE)
+        moving[:, :mx] = moving[:, flow_size - mx:] = False
+        moving[:my] = moving[flow_size - my:] = False
+        if np.count_nonzero(moving) < ALIGNED_MIN_PIXELS / scale ** 2:
+            continue
+        chaos_scores[i] = circular_spread(ang[moving])
+        magnitude_scores[i] = float(mag[moving].mean())
+
+    if roi_cache is not None:
+        roi_cache.clear()
+        roi_cache.update(next_rois)
+    return chaos_scores, magnitude_scores
+
+
+def lk_scores(curr_gray, prev_gray, boxes, roi_cache=None, flow_size=FLOW_SIZE):
+    """Liveness from sparse corners tracked with pyramidal Lucas-Kanade.
+
+    Same inputs, outputs and ROI cache as utils.calculate_chaos_batch, with
+    the ROIs aligned first (aligned_rois), so a moved photo leaves its
+    corners in place; motion is the mean displacement of the moving
+    corners on the FLOW_SIZE scale, chaos their circular spread.
+    """
+    n = len(boxes)
+    chaos_scores = np.zeros(n, dtype=np.float64)
+    magnitude_scores = np.zeros(n, dtype=np.float64)
+    prev_rois = roi_cache if roi_cache is not None else {}
+    next_rois = {}
+    scale = FLOW_SIZE / float(flow_size)
+
+    for i, box in enumerate(boxes):
+        x1, y1, x2, y2 = box[:4]
+        curr_roi = curr_gray[y1:y2, x1:x2]
+        if curr_roi.size == 0:
+            continue
+
+        prev_small, curr_small, (mx, my) = aligned_rois(curr_gray, prev_gray, box, prev_rois, next_rois, flow_size)
+        corners = cv2.goodFeaturesToTrack(prev_small, LK_MAX_CORNERS, 0.01, 3)
+        if corners is not None:
+            # Not in the border the alignment filled in
+            x, y = corners[:, 0, 0], corners[:, 0, 1]
+            corners = corners[(x >= mx) & (x < flow_size - mx) & (y >= my) & (y < flow_size - my)]
+        if corners is None or len(corners) < LK_MIN_POINTS:
+            continue
+        moved, found, _ = cv2.calcOpticalFlowPyrLK(prev_small, curr_small, corners, None,
+                                                   winSize=(LK_WINDOW, LK_WINDOW), maxLevel=LK_LEVELS)
+        found = found.reshape(-1).astype(bool)
+        vectors = (moved - corners).reshape(-1, 2)[found] * scale
+        mag = np.hypot(vectors[:, 0], vectors[:, 1])
+
+        # Same "significant motion" rule as the dense flow: > 1 px, enough points
+        moving = mag > 1.0
+        if np.count_nonzero(moving) < LK_MIN_POINTS:
+            continue
+        chaos_scores[i] = circular_spread(np.arctan2(vectors[moving, 1], vectors[moving, 0]))
+        magnitude_scores[i] = float(mag[moving].mean())
+
+    if roi_cache is not None:
+        roi_cache.clear()
+        roi_cache.update(next_rois)
+    return chaos_scores, magnitude_scores
+
+
+def align_history(rois):
+    """Aligns a box's buffered ROIs (oldest first) onto the newest one.
+
+    The shift between consecutive ROIs is measured with phase correlation
+    and chained backwards, so a photo shaken or swayed in front of the camera
+    ends up still. Returns (aligned stack, largest shift in pixels).
+    """
+    size = rois[-1].shape[::-1]
+    if min(size) < 8:
+        return np.stack(rois), 0.0  # Too few pixels to measure a shift
+    window = cv2.createHanningWindow(size, cv2.CV_32F)
+    aligned = [rois[-1]]
+    total = np.zeros(2)
+    largest = 0.0
+    for k in range(len(rois) - 2, -1, -1):
+        # Copies: phaseCorrelate may apply the window in place
+        (dx, dy), _ = cv2.phaseCorrelate(rois[k + 1].copy(), rois[k].copy(), window)
+        total += (dx, dy)
+        largest = max(largest, float(np.abs(total).max()))
+        shift = np.float32([[1, 0, -total[0]], [0, 1, -total[1]]])
+        aligned.append(cv2.warpAffine(rois[k], shift, size, borderMode=cv2.BORDER_REPLICATE))
+    aligned.reverse()
+    return np.stack(aligned), largest
+
+
+def flicker_scores(curr_gray, boxes, state):
+    """Liveness from the intensity flicker over the last FLICKER_FRAMES frames.
+
+    The camera's downscaled frames are kept in `state`, so it has to be
+    called on every frame (with or without boxes). Per box the buffered ROIs
+    are first aligned (align_history) and lightly blurred, then: motion is
+    the mean absolute frame-to-frame change (grey levels), chaos the share of
+    it that is high-frequency (mean |second difference| / mean |first
+    difference|, 0-2). A moved photo is left with little change once
+    aligned, flames score around 1.5. Until three frames are buffered the
+    scores are NaN (no sample yet).
+    """
+    n = len(boxes)
+    chaos_scores = np.zeros(n, dtype=np.float64)
+    magnitude_scores = np.zeros(n, dtype=np.float64)
+
+    h, w = curr_gray.shape[:2]
+    small = cv2.resize(curr_gray, (max(1, w // FLICKER_DOWNSCALE), max(1, h // FLICKER_DOWNSCALE)),
+                       interpolation=cv2.INTER_AREA)
+    history = state.get("flicker")
+    if history is None or (history and history[-1].shape != small.shape):
+        history = deque(maxlen=FLICKER_FRAMES)
+    history.append(small)
+    state.clear()  # Drop whatever another engine cached
+    state["flicker"] = history
+    if n == 0:
+        return chaos_scores, magnitude_scores
+    if len(history) < 3:
+        return np.full(n, np.nan), np.full(n, np.nan)
+
+    for i, box in enumerate(boxes):
+        x1, y1, x2, y2 = (v // FLICKER_DOWNSCALE for v in box[:4])
+        x2, y2 = max(x2, x1 + 1), max(y2, y1 + 1)
+        rois = [frame[y1:y2, x1:x2].astype(np.float32) for frame in history]
+        if rois[-1].size == 0:
+            continue
+        roi, shift = align_history(rois)
+        roi = np.stack([cv2.GaussianBlur(frame, (0, 0), FLICKER_BLUR) for frame in roi])
+        # Drop the border the alignment filled in
+        margin = min(int(np.ceil(shift)) + 1, min(roi.shape[1:]) // 4)
+        if margin:
+            roi = roi[:, margin:-margin, margin:-margin]
+        first = np.abs(np.diff(roi, axis=0)).mean()
+        if first <= 0:
+            continue
+        second = np.abs(np.diff(roi, n=2, axis=0)).mean()
+        chaos_scores[i] = second / first
+        magnitude_scores[i] = first
+    return chaos_scores, magnitude_scores
+
+
+def liveness_scores(engine, curr_gray, prev_gray, boxes, state, flow_size=FLOW_SIZE):
+    """(chaos, motion) arrays for the boxes with the chosen engine.
+
+    state is a dict kept per camera between frames (the camera's roi_cache).
+    """
+    if engine == "flicker":
+        return flicker_scores(curr_gray, boxes, state)
+    if engine == "lk":
+        return lk_scores(curr_gray, prev_gray, boxes, state, flow_size)
+    if engine == "farneback_aligned":
+        return aligned_flow_scores(curr_gray, prev_gray, boxes, state, flow_size)
+    return calculate_chaos_batch(curr_gray, prev_gray, boxes, state, flow_size)
@@ -1,52 +1,66 @@
 import cv2
 import time
-import numpy as np
 from detector import detect_fire
-from alert import play_alarm, send_email_alert
-from utils import save_fire_image, calculate_chaos, MIN_MOTION_PIXELS, CHAOS_THRESHOLD
+from alert import get_alert_dispatcher
+from evidence import get_evidence_store
+from utils import clip_box
+from liveness import engine_thresholds, liveness_scores
+from capture import FrameGrabber
+from config import settings
+from gating import ColorGate
+from stream import encode_jpeg
+from pipeline import SEVERITY_RANK
+from zones import ZoneMap
 
-ALARM_COOLDOWN = 60
 last_alarm_time = 0
-
-ALARM_COOLDOWN = 60
-last_alarm_time = 0
-
 prev_gray = None
 
 
-
 def main():
     global last_alarm_time, prev_gray
 
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+    # Grab frames on a separate thread so detection never lags behind the camera
+    grabber = FrameGrabber(0, 1280, 720)
+    grabber.start()
+    # Skips the model on frames without flame colours when color_gate is on
+    color_gate = ColorGate()
+    # Liveness engine (farneback, lk or flicker) state, kept across frames
+    engine = settings.get("liveness_engine")
+    liveness_state = {}
+    # Severity per zone from the area on fire, same as the server (see zones.py)
+    zone_map = ZoneMap.from_config("cam1", "Camera 1")
 
     print("System Started. Press 'q' to exit.")
 
     while True:
-        ret, frame = cap.read()
+        ret, frame, _ = grabber.read()
         if not ret:
-            break
+            if grabber.finished or not grabber.is_alive():
+                break
+            continue
         
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         
         # Detect Fire
-        fire_boxes = detect_fire(frame)
+        fire_boxes = detect_fire(frame, color_gate)
+        # Excluded / unwatched areas never raise an alarm, as in the server
+        fire_boxes = zone_map.filter_boxes(fire_boxes, gray.shape)
 
         detected_real_fire = False
+        live_boxes = []
 
-        if prev_gray is not None and fire_boxes:
-            for (x1, y1, x2, y2, conf) in fire_boxes:
-                # Ensure ROI is valid
-                h, w = gray.shape
-                x1 = max(0, x1); y1 = max(0, y1)
-                x2 = min(w, x2); y2 = min(h, y2)
-                
-                chaos, motion_mag = calculate_chaos(gray, prev_gray, x1, y1, x2, y2)
+        if prev_gray is not None:
+            # Ensure ROIs are valid, then score every box in one batched call
+            # (every frame: the flicker engine keeps a frame history)
+            clipped = [clip_box(x1, y1, x2, y2, gray.shape) for (x1, y1, x2, y2, _) in fire_boxes]
+            chaos_scores, motion_scores = liveness_scores(engine, gray, prev_gray, clipped, liveness_state)
+            thresholds = engine_thresholds(engine)
+
+            for i, (x1, y1, x2, y2) in enumerate(clipped):
+                chaos, motion_mag = chaos_scores[i], motion_scores[i]
                 
                 # Logic:
-                # 1. Matches: Chaos > Threshold (0.15), Motion > Min (20)
+                # 1. Matches: Chaos > chaos_threshold, Motion > motion_threshold (see config.py)
                 # 2. Shaking Photo: Chaos < Threshold, Motion > Min
                 # 3. Static Photo: Motion < Min
 
@@ -55,12 +69,12 @@ def main():
                 
                 # Check magnitude (Motion) first
                 # We use motion_mag (average flow magnitude) as a proxy for movement intensity
-                if motion_mag < 0.2:
+                if motion_mag < thresholds["motion"]:
                    label = "Static"
                    color = (255, 0, 0) # Blue
                 
                 # If motion is present but coherent (Low Chaos), it's likely shaking
-                elif chaos < CHAOS_THRESHOLD:
+                elif chaos < thresholds["chaos"]:
                     label = "Shaking Detected"
                     color = (255, 165, 0) # Orange
                 
@@ -69,6 +83,7 @@ def main():
                     label = "REAL FIRE"
                     color = (0, 255, 0) # Green
                     detected_real_fire = True
+                    live_boxes.append((x1, y1, x2, y2))
 
                 # Draw info
                 cv2.rectangle(frame, (x1, y1), (x2, y2), color, 3)
@@ -79,25 +94,34 @@ def main():
 
         if detected_real_fire:
             current_time = time.time()
-            if current_time - last_alarm_time > ALARM_COOLDOWN:
+            if current_time - last_alarm_time > settings.get("alarm_cooldown"):
                 last_alarm_time = current_time
-                play_alarm()
-                # Run in thread or async to avoid lag, but for now direct call
+                # Sound + email go through the dispatcher's workers, the video loop never waits
                 try: 
-                    image_path = save_fire_image(frame)
-                    send_email_alert(image_path)
+                    # Worst zone on fire, so the dispatcher can merge repeats and catch escalations
+                    zones = zone_map.aggregate(live_boxes, gray.shape)
+                    zone = max(zones, key=lambda name: SEVERITY_RANK[zones[name]["severity"]])
+                    evidence = get_evidence_store().save_event("cam1", frame)
+                    get_alert_dispatcher().dispatch(
+                        {"camera_id": "cam1", "zone": zone, "severity": zones[zone]["severity"],
+                         "image_path": evidence["image_path"], "evidence_ready": evidence["ready"]},
+                        channels=("sound", "email"))
                 except Exception as e:
                     print(f"Alert Error: {e}")
 
             cv2.putText(frame, "!!! FIRE ALARM !!!", (50, 50),
                         cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
 
+        get_evidence_store().record("cam1", encode_jpeg(frame))
         cv2.imshow("Advanced Fire Liveness Detector", frame)
 
+        grabber.counters.incr("processed")
+
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
-    cap.release()
+    print(f"Pipeline stats: {grabber.counters.snapshot()}")
+    grabber.stop()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -0,0 +1,437 @@
+import functools
+import os
+import time
+
+import cv2
+import numpy as np
+
+from capture import FrameGrabber, StageCounters
+from config import settings
+from stream import FrameBuffer
+from utils import FLOW_SIZE, clip_box
+from liveness import engine_thresholds, liveness_scores
+from tracker import FireTracker
+from gating import ColorGate, MotionGate
+from quality import QualityController
+from telemetry import is_enabled, log
+from zones import ZoneMap
+
+# Cameras to watch, comma separated. Each entry is either a bare source or
+# "name=source", where source is a USB index, an RTSP/HTTP URL or a video file.
+# e.g. CAMERA_SOURCES="0,lobby=rtsp://10.0.0.5/stream,test=clips/match.mp4"
+CAMERA_SOURCES = os.getenv("CAMERA_SOURCES", "0")
+# Capture resolution, raise it (e.g. 1280x720) together with DETECT_MODE=tiled/zoom
+CAMERA_WIDTH = int(os.getenv("CAMERA_WIDTH", "640"))
+CAMERA_HEIGHT = int(os.getenv("CAMERA_HEIGHT", "480"))
+# Run the detector on every k-th frame, the tracker carries boxes in between.
+# Startup defaults, cameras read the live (possibly per-camera) values from settings.
+DETECT_EVERY = settings.get("detect_every")
+MIN_CONFIDENCE = settings.get("min_confidence")
+
+SEVERITY_RANK = {"None": 0, "Low": 1, "Medium": 2, "High": 3}
+SEVERITY_COLORS = {"Low": (0, 255, 0), "Medium": (0, 165, 255), "High": (0, 0, 255)}  # BGR
+SMOKE_COLOR = (180, 180, 180)
+
+
+def new_status(location):
+    return {
+        "detected": False,
+        "confidence": 0.0,
+        "timestamp": None,
+        "location": location,
+        "severity": "None",
+        "count": 0,
+        "zones": {},
+        "smoke": False,  # Pre-alarm: persistent smoke, possibly before any flame is visible
+        "smoke_confidence": 0.0,
+        "escalated": False,
+        "message": "System Normal",
+        "camera_active": True
+    }
+
+
+class Camera:
+    """Everything the server keeps per stream: capture, output buffer and status."""
+
+    def __init__(self, camera_id, source, zone):
+        self.camera_id = camera_id
+        self.source = source
+        self.zone = zone  # Default zone name (fire_events.zone) when no polygons are set
+        self.zone_map = ZoneMap.from_config(camera_id, zone)  # See zones.py / ZONES_PATH
+        self.counters = StageCounters()
+        self.grabber = FrameGrabber(source, CAMERA_WIDTH, CAMERA_HEIGHT, counters=self.counters)
+        self.frame_buffer = FrameBuffer()
+        self.status = new_status(zone)
+        self.active = True
+        self.prev_gray = None
+        self.roi_cache = {}  # Liveness engine state (previous ROIs / frame history), see liveness.py
+        self.liveness_engine = None
+        self.tracker = FireTracker()
+        self.smoke_tracker = FireTracker()  # Association only, smoke has no liveness verdict
+        self.motion_gate = MotionGate()
+        self.color_gate = ColorGate()
+        self.quality = QualityController()  # Latency budget, see quality.py
+        self.frames_since_detection = settings.get("detect_every", camera_id)  # Detect on the first frame
+        self.smoke_seen_at = 0       # Last smoke box, drives the escalation
+        self.smoke_confirmed_at = 0  # Last confirmed smoke track, drives the pre-alarm
+        self.was_escalated = False
+        self.last_alarm_time = 0
+        self.last_smoke_event_time = 0
+        self.last_placeholder_time = 0
+        self.settings_version = None
+        self.apply_settings()
+
+    def setting(self, name):
+        return settings.get(name, self.camera_id)
+
+    def apply_settings(self):
+        """Pushes the current (per-camera) settings into the tracker and motion gate."""
+        if self.settings_version == settings.version:
+            return
+        self.settings_version = settings.version
+        engine = self.setting("liveness_engine")
+        if engine != self.liveness_engine:
+            # Samples of another engine are in other units, restart the windows
+            if self.liveness_engine is not None:
+                for track in self.tracker.tracks:
+                    track.chaos.clear()
+                    track.motion.clear()
+            self.roi_cache.clear()
+            self.liveness_engine = engine
+        self.tracker.thresholds.update(engine_thresholds(engine, self.camera_id))
+        self.motion_gate.enabled = self.setting("motion_gate")
+        self.motion_gate.min_changed = self.setting("motion_min_changed")
+        self.motion_gate.max_interval = self.setting("motion_max_interval")
+        self.color_gate.enabled = self.setting("color_gate")
+        self.color_gate.min_area = self.setting("color_min_area")
+        self.color_gate.crop = self.setting("color_crop")
+        self.color_gate.max_interval = self.setting("color_max_interval")
+        self.quality.enabled = self.setting("quality_control")
+        self.quality.budget = self.setting("latency_budget")
+
+    @property
+    def escalated(self):
+        """Smoke seen in the last smoke_hold seconds: detection runs more often and finer."""
+        return self.setting("smoke_escalate") and time.time() - self.smoke_seen_at < self.setting("smoke_hold")
+
+    @property
+    def pre_alarm(self):
+        return time.time() - self.smoke_confirmed_at < self.setting("smoke_hold")
+
+    def detector_options(self):
+        """(conf, imgsz, mode) for the detector, cameras sharing them are batched together."""
+        mode = self.setting("smoke_detect_mode") if self.escalated else self.setting("detect_mode")
+        return self.setting("min_confidence"), self.quality.img_size(self.setting("img_size")), mode
+
+    def start(self):
+        self.grabber.start()
+
+    def needs_detection(self, gray):
+        self.apply_settings()
+        self.motion_gate.ignore_mask = self.zone_map.ignore_mask(gray.shape)
+        escalated = self.escalated
+        if escalated != self.was_escalated:
+            self.was_escalated = escalated
+            print(f"💨 {self.camera_id}: detection {'escalated (smoke)' if escalated else 'back to normal'}")
+            log("info", "smoke_escalation", camera=self.camera_id, active=escalated)
+
+        detect_every = self.quality.detect_every(self.setting("detect_every"))
+        if escalated:
+            detect_every = min(detect_every, self.setting("smoke_detect_every"))
+        if self.frames_since_detection < detect_every:
+            return False
+        if escalated:
+            return True  # Slow, diffuse smoke can stay under the motion gate threshold
+        # Nothing changed since the last detector pass, keep carrying tracks
+        return self.motion_gate.should_detect(gray)
+
+    def detection_window(self, frame):
+        """(x1, y1, x2, y2) of the frame to run the detector on, None to skip it (colour gate)."""
+        if self.escalated:
+            h, w = frame.shape[:2]
+            return (0, 0, w, h)  # Smoke has no flame colour
+        self.color_gate.ignore_mask = self.motion_gate.ignore_mask
+        return self.color_gate.window(frame)
+
+    def plan_detection(self, frame, gray):
+        """Window to run the detector on for this frame, None to carry the tracks.
+
+        Frames between passes are counted here, when the pass is scheduled,
+        so a pass still in flight (inference workers) already counts.
+        """
+        window = self.detection_window(frame) if self.needs_detection(gray) else None
+        self.frames_since_detection = 1 if window else self.frames_since_detection + 1
+        return window
+
+    def update_tracks(self, boxes, shape=None):
+        """Feeds a detection pass to the tracker, or carries tracks if boxes is None.
+
+        Boxes in excluded zones (given the frame shape) never reach the
+        tracker, so they cost no liveness work.
+        """
+        if boxes is None:
+            return self.tracker.carry()
+        min_confidence = self.setting("min_confidence")
+        boxes = [box for box in boxes if box[4] > min_confidence]
+        if shape is not None:
+            boxes = self.zone_map.filter_boxes(boxes, shape)
+        return self.tracker.update(boxes)
+
+    def update_smoke(self, boxes, shape=None):
+        """Same as update_tracks for the smoke boxes, returns the confirmed smoke tracks.
+
+        Smoke is confirmed once a track was matched on smoke_min_hits
+        detection passes. Any smoke box (confirmed or not) escalates the
+        camera for smoke_hold seconds, so the confirmation comes quickly.
+        """
+        if boxes is None:
+            tracks = self.smoke_tracker.carry()
+        else:
+            min_confidence = self.setting("smoke_confidence")
+            boxes = [box for box in boxes if box[4] > min_confidence]
+            if shape is not None:
+                boxes = self.zone_map.filter_boxes(boxes, shape)
+            if boxes:
+                self.smoke_seen_at = time.time()
+            tracks = self.smoke_tracker.update(boxes)
+
+        min_hits = self.setting("smoke_min_hits")
+        confirmed = [track for track in tracks if track.hits >= min_hits]
+        if confirmed:
+            self.smoke_confirmed_at = time.time()
+        return confirmed
+
+    def observe_latency(self, latency):
+        """Feeds the quality controller, logs when it moves to another operating point."""
+        self.apply_settings()
+        step = self.quality.observe(latency)
+        if step:
+            point = self.quality_point()
+            print(f"🎚️ {self.camera_id}: quality {'lowered' if step > 0 else 'raised'} to level {point['level']} "
+                  f"(img_size {point['img_size']}, detect_every {point['detect_every']}, flow {point['flow_size']})")
+            log("info", "quality_change", camera=self.camera_id, operating_point=point)
+
+    def quality_point(self):
+        return self.quality.snapshot(self.setting("img_size"), self.setting("detect_every"))
+
+    def reset_tracking(self):
+        self.tracker.reset()
+        self.smoke_tracker.reset()
+        self.smoke_seen_at = 0
+        self.smoke_confirmed_at = 0
+
+    def snapshot(self):
+        return {
+            **self.status,
+            "camera_id": self.camera_id,
+            "pipeline": self.counters.snapshot(),
+            "motion_gate": self.motion_gate.stats(),
+            "color_gate": self.color_gate.stats(),
+            "quality": self.quality_point(),
+            "settings": settings.effective(self.camera_id),
+        }
+
+
+def parse_camera_sources(spec):
+    """Turns the CAMERA_SOURCES string into a list of (camera_id, source, zone)."""
+    cameras = []
+    for i, entry in enumerate(e.strip() for e in spec.split(",") if e.strip()):
+        if "=" in entry and not entry.split("=", 1)[0].isdigit() and "://" not in entry.split("=", 1)[0]:
+            camera_id, source = entry.split("=", 1)
+            zone = camera_id
+        else:
+            camera_id, source = f"cam{i + 1}", entry
+            zone = f"Camera {i + 1}"
+        if source.isdigit():
+            source = int(source)  # USB camera index
+        cameras.append((camera_id, source, zone))
+    return cameras
+
+
+def load_cameras(spec=None):
+    cameras = {}
+    for camera_id, source, zone in parse_camera_sources(spec or CAMERA_SOURCES):
+        cameras[camera_id] = Camera(camera_id, source, zone)
+    return cameras
+
+
+def analyze_detections(frame, gray, prev_gray, tracks, roi_cache=None, camera_id=None, zone_map=None,
+                       smoke_tracks=(), flow_size=FLOW_SIZE, engine="farneback"):
+    """Severity, liveness evidence and drawing for one frame's fire tracks.
+
+    Each track gets this frame's chaos/motion sample; whether it counts as a
+    real fire is decided from its rolling window (see tracker.Track.verdict),
+    so a single flickering box can neither raise nor cancel an alarm.
+    Confirmed smoke tracks are only drawn and summarized (pre-alarm).
+    `engine` picks how the samples are measured (see liveness.py).
+    Returns the annotated frame and a summary dict of the live tracks
+    (including the liveness / draw time in seconds under "timings").
+    """
+    detected_in_frame = False
+    max_conf = 0.0
+    max_severity = "None"
+    max_chaos = 0.0
+    live_count = 0
+
+    t0 = time.perf_counter()
+    # Tracks carried out of the frame get no sample and aren't drawn
+    visible = []
+    for track in tracks:
+        x1, y1, x2, y2 = clip_box(*track.box, gray.shape)
+        if x2 > x1 and y2 > y1:
+            visible.append((track, (x1, y1, x2, y2)))
+    clipped = [box for _, box in visible]
+
+    # Liveness for every box of the frame in one batched call
+    if prev_gray is not None:
+        state = roi_cache if roi_cache is not None else {}
+        chaos_scores, motion_scores = liveness_scores(engine, gray, prev_gray, clipped, state, flow_size)
+        debug = is_enabled("debug")  # Once per frame, the fields below aren't built otherwise
+        for (track, _), chaos, motion_mag in zip(visible, chaos_scores, motion_scores):
+            track.add_liveness(chaos, motion_mag)
+            if debug:
+                log("debug", "liveness", camera=camera_id, track=track.track_id,
+                    chaos=round(float(chaos), 4), chaos_threshold=track.thresholds["chaos"],
+                    motion=round(float(motion_mag), 4), motion_threshold=track.thresholds["motion"])
+    elif roi_cache is not None:
+        roi_cache.clear()
+    t1 = time.perf_counter()
+
+    # Verdicts first: severity is aggregated over all live boxes of a zone
+    judged = []
+    live_boxes = []
+    for track, box in visible:
+        judged.append((track, box, track.verdict))
+        if judged[-1][2] == "live":
+            live_boxes.append(box)
+
+    # Overlapping boxes merged per zone, severity from the zone's calibrated area
+    # (m²) when known, else from the share of the zone on fire
+    zone_map = zone_map or ZoneMap(camera_id or "frame")
+    zones = zone_map.aggregate(live_boxes, gray.shape)
+    worst_zone = None
+    for name, entry in zones.items():
+        if SEVERITY_RANK[entry["severity"]] > SEVERITY_RANK[max_severity]:
+            max_severity = entry["severity"]
+            worst_zone = name
+
+    # Overlay for transparent drawing
+    overlay = frame.copy()
+
+    for track, (x1, y1, x2, y2), verdict in judged:
+        conf = track.mean_conf
+
+        # Filter out static images or shaking photos, judged over the track window
+        # Static = low motion, shaking = organized motion (low chaos but high motion)
+        if verdict == "pending":
+            severity = "Analyzing"
+            color = (0, 255, 255) # Yellow
+        elif verdict == "static":
+            severity = "Static (Fake)"
+            color = (255, 0, 0) # Blue
+            conf = 0.0 # Suppress confidence
+        elif verdict == "shaking":
+            severity = "Shaking (Fake)"
+            color = (255, 165, 0) # Orange
+            conf = 0.0
+        else:
+            # Real Fire! Coloured by the severity of its zone
+            zone = zones.get(zone_map.zone_at((x1, y1, x2, y2), gray.shape))
+            severity = zone["severity"] if zone else "Low"
+            color = SEVERITY_COLORS[severity]
+            detected_in_frame = True
+            live_count += 1
+            max_conf = max(max_conf, conf)
+            max_chaos = max(max_chaos, track.mean_chaos)
+
+        # DRAWING: Semi-transparent Fill
+        # Draw filled box on overlay
+        cv2.rectangle(overlay, (x1, y1), (x2, y2), color, -1)
+
+        # Text Label with Background
+        label_text = f"#{track.track_id} {severity.upper()} {conf:.2f}"
+        t_size = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
+        cv2.rectangle(frame, (x1, y1 - t_size[1] - 10), (x1 + t_size[0] + 10, y1), color, -1)
+        cv2.putText(frame, label_text, (x1 + 5, y1 - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+        # Draw Border on original frame (to keep edges sharp)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+
+    # Apply transparency
+    if detected_in_frame:
+        alpha = 0.35
+        frame = cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0)
+
+    # Smoke: outline only, it is a pre-alarm and often covers half the frame
+    smoke_conf = 0.0
+    smoke_zone = None
+    for track in smoke_tracks:
+        x1, y1, x2, y2 = clip_box(*track.box, gray.shape)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        if track.mean_conf > smoke_conf:
+            smoke_conf = track.mean_conf
+            smoke_zone = zone_map.zone_at((x1, y1, x2, y2), gray.shape)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), SMOKE_COLOR, 2)
+        cv2.putText(frame, f"#{track.track_id} SMOKE {track.mean_conf:.2f}", (x1 + 5, y1 + 20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, SMOKE_COLOR, 2)
+
+    summary = {
+        "detected": detected_in_frame,
+        "max_conf": max_conf,
+        "max_severity": max_severity,
+        "max_chaos": max_chaos,
+        "count": live_count,
+        "tracks": len(tracks),
+        "zone": worst_zone,  # Written to fire_events.zone
+        "zones": zones,
+        "smoke_count": len(smoke_tracks),
+        "smoke_conf": smoke_conf,
+        "smoke_zone": smoke_zone,
+        "timings": {"liveness": t1 - t0, "draw": time.perf_counter() - t1},
+    }
+    return frame, summary
+
+
+@functools.lru_cache(maxsize=None)
+def placeholder_jpeg(text="CAMERA OFF"):
+    # Static image, encoded once per process
+    blank_frame = np.zeros((CAMERA_HEIGHT, CAMERA_WIDTH, 3), dtype=np.uint8)
+    cv2.putText(blank_frame, text, (CAMERA_WIDTH // 2 - 120, CAMERA_HEIGHT // 2),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (100, 100, 100), 2)
+    ret, buffer = cv2.imencode('.jpg', blank_frame)
+    return buffer.tobytes()
+
+
+def collect_batch(cameras):
+    """Gathers the newest unseen frame of every active camera (non-blocking).
+
+    Returns (cam, frame, gray, captured_at, window) tuples; window is the
+    (x1, y1, x2, y2) region to run YOLO on, or None on frames where the
+    tracker carries the boxes instead (frame-skip, motion or colour gate).
+    """
+    batch = []
+    now = time.time()
+    for cam in cameras.values():
+        if not cam.active:
+            cam.grabber.pause()
+            cam.prev_gray = None
+            cam.roi_cache.clear()
+            cam.reset_tracking()
+            cam.motion_gate.reset()
+            cam.color_gate.reset()
+            # Keep viewers of a disabled camera on a placeholder
+            if now - cam.last_placeholder_time > 0.5:
+                cam.frame_buffer.publish(placeholder_jpeg(), cam.status)
+                cam.last_placeholder_time = now
+            continue
+
+        cam.grabber.resume()
+        success, frame, captured_at = cam.grabber.read(timeout=0)
+        if success:
+            # Grayscale feeds both the motion gate and optical flow
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            window = cam.plan_detection(frame, gray)
+            batch.append((cam, frame, gray, captured_at, window))
+    return batch
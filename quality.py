@@ -0,0 +1,127 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from config import settings
+
+# Startup defaults, cameras push their live (per-camera) values
+QUALITY_CONTROL = settings.get("quality_control")
+LATENCY_BUDGET = settings.get("latency_budget")
+
+# Operating points from best to cheapest, each one gives up a little more:
+# (share of img_size, extra frames between detector passes, optical flow side)
+QUALITY_LEVELS = (
+    (1.0, 0, 64),
+    (1.0, 0, 48),
+    (0.8, 0, 48),
+    (0.8, 1, 32),
+    (0.6, 1, 32),
+    (0.5, 2, 32),
+    (0.5, 4, 32),
+)
+# Latency percentile held against the budget
+QUALITY_PERCENTILE = 90
+# Frames measured at an operating point before it is judged
+QUALITY_MIN_SAMPLES = 15
+QUALITY_WINDOW = 60
+# Hysteresis: step down as soon as the budget is exceeded, step back up only
+# once latency stayed under RECOVER_RATIO x budget for RECOVER_HOLD seconds
+RECOVER_RATIO = 0.6
+RECOVER_HOLD = 5.0
+
+
+class QualityController:
+    """Trades detection quality for latency to hold a per-camera budget.
+
+    observe() is fed the end-to-end latency of every processed frame. When
+    the p90 over the current operating point exceeds the budget, the next
+    cheaper level of QUALITY_LEVELS is taken (smaller inference size, more
+    frame-skip, smaller flow ROIs); when there is enough headroom for long
+    enough, one level is given back. Samples restart on every change so a
+    level is only judged on its own frames.
+    """
+
+    def __init__(self, budget=LATENCY_BUDGET, enabled=QUALITY_CONTROL, levels=QUALITY_LEVELS):
+        self.budget = budget
+        self.enabled = enabled
+        self.levels = levels
+        self.level = 0
+        self.samples = deque(maxlen=QUALITY_WINDOW)
+        self.headroom_since = None
+        self.changes = 0
+        self.last_change = None
+        self.last_change_latency = None  # p90 that triggered the last change
+
+    @property
+    def operating_point(self):
+        return self.levels[self.level if self.enabled else 0]
+
+    def img_size(self, base):
+        # YOLO wants a multiple of 32
+        return max(160, int(base * self.operating_point[0]) // 32 * 32)
+
+    def detect_every(self, base):
+        return base + self.operating_point[1]
+
+    @property
+    def flow_size(self):
+        return self.operating_point[2]
+
+    def latency(self):
+        if not self.samples:
+            return None
+        return float(np.percentile(self.samples, QUALITY_PERCENTILE))
+
+    def observe(self, latency):
+        """Records one frame's latency, returns +1 / -1 when the level changed (else 0)."""
+        if not self.enabled or self.budget <= 0:
+            if self.level:
+                self._set_level(0)
+            return 0
+        self.samples.append(latency)
+        if len(self.samples) < QUALITY_MIN_SAMPLES:
+            return 0
+
+        current = self.latency()
+        if current > self.budget:
+            self.headroom_since = None
+            if self.level < len(self.levels) - 1:
+                self._set_level(self.level + 1, current)
+                return 1
+            return 0
+
+        if current < self.budget * RECOVER_RATIO and self.level > 0:
+            now = time.time()
+            if self.headroom_since is None:
+                self.headroom_since = now
+            elif now - self.headroom_since >= RECOVER_HOLD:
+                self._set_level(self.level - 1, current)
+                return -1
+        else:
+            self.headroom_since = None
+        return 0
+
+    def _set_level(self, level, latency=None):
+        self.level = level
+        self.last_change_latency = latency
+        self.samples.clear()
+        self.headroom_since = None
+        self.changes += 1
+        self.last_change = time.time()
+
+    def snapshot(self, base_img_size, base_detect_every):
+        latency = self.latency()
+        return {
+            "enabled": self.enabled,
+            "budget_ms": round(self.budget * 1000, 1),
+            "level": self.level,
+            "max_level": len(self.levels) - 1,
+            "img_size": self.img_size(base_img_size),
+            "detect_every": self.detect_every(base_detect_every),
+            "flow_size": self.flow_size,
+            f"p{QUALITY_PERCENTILE}_ms": round(latency * 1000, 1) if latency is not None else None,
+            "changes": self.changes,
+            "last_change": self.last_change,
+            "last_change_ms": round(self.last_change_latency * 1000, 1) if self.last_change_latency else None,
+        }
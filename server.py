@@ -1,270 +1,512 @@
-import cv2
 import time
-import json
-from flask import Flask, Response, jsonify, request
+from flask import Flask, Response, jsonify, request, abort
+from datetime import datetime
 from flask_cors import CORS
-from ultralytics import YOLO
+import hmac
 import threading
 import os
-import numpy as np
 
 # Import Alert Logic
-from alert import play_alarm, send_email_alert, make_call_alert
-from utils import save_fire_image, calculate_chaos, CHAOS_THRESHOLD, MIN_MOTION_PIXELS
-from database import init_db, log_detection
+from alert import get_alert_dispatcher, peek_alert_dispatcher
+from evidence import get_evidence_store, peek_evidence_store
+from audio import peek_alarm_player
+from database import init_db, log_detection, peek_event_writer, query_events, event_stats
+from stream import mjpeg_stream, encode_jpeg
+from detector import detect_labeled_batch, get_detector, crop_window, shift_boxes
+from inference_pool import InferencePool, INFERENCE_WORKERS
+from status_stream import StatusBroadcaster, SSE_HEADERS
+from pipeline import load_cameras, analyze_detections, collect_batch, new_status, SEVERITY_RANK
+from config import settings
+from telemetry import registry, stage_seconds, detections_total, alarms_total, prealarms_total, log
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for React frontend
-
-# Load the new trained model
-model = YOLO("best_v2.pt")
+# Enable CORS for React frontend, except on /api/config: a page open in the
+# operator's browser must not be able to change detection settings
+CORS(app, resources={r"^/(?!api/config).*": {"origins": "*"}})
 
 # Global variables
 current_location = None # {lat: ..., lon: ...}
-last_alarm_time = 0
-ALARM_COOLDOWN = 60
 camera_active = True
+# Required in the X-Admin-Token header of POST /api/config; when empty, config
+# writes are only accepted from this machine (loopback)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+LOOPBACK_ADDRESSES = ("127.0.0.1", "::1", "::ffff:127.0.0.1")
+# 0 = API-only process (history, config...): no cameras opened, no model loaded
+DETECTION_WORKER = os.getenv("DETECTION_WORKER", "1") == "1"
+
+# One entry per stream (see CAMERA_SOURCES in pipeline.py)
+cameras = load_cameras()
+default_camera_id = next(iter(cameras))
+
+# Aggregated view over all cameras (what the dashboard polls)
+fire_status = new_status(cameras[default_camera_id].zone)
+
+# Pushes fire_status / per-camera changes to /api/stream subscribers
+status_broadcaster = StatusBroadcaster()
+# Fields that change every frame without being a state change
+VOLATILE_FIELDS = ("timestamp", "latency_ms", "zones")
+# Fields that jitter every frame: only a move to another step is a change
+QUANTIZED_FIELDS = {"confidence": 0.05, "smoke_confidence": 0.05}
+
+worker_thread = None
+worker_lock = threading.Lock()
+# Detector processes when INFERENCE_WORKERS > 0 (created by the detection worker)
+inference_pool = None
+
+def trigger_alert(cam, frame, max_severity, max_conf, max_chaos, zone=None):
+    print(f"🔥 Alert Triggered! Camera: {cam.camera_id} Severity: {max_severity}")
+    alarms_total.inc(camera=cam.camera_id, severity=max_severity)
+    zone = zone or cam.zone
+    
+    # Generate Google Maps URL
+    loc_url = "GPS Unavailable"
+    if current_location:
+        loc_url = f"https://maps.google.com/?q={current_location['lat']},{current_location['lon']}"
+
+    # Still image + pre/post-event clip, written in the background
+    evidence = get_evidence_store().save_event(cam.camera_id, frame)
+    img_path = evidence["image_path"]
+    
+    # Sound + Email + Voice Call, delivered by the dispatcher's worker pool.
+    # Returns False when it repeats the ongoing incident of this camera and zone.
+    alert_sent = get_alert_dispatcher().dispatch({
+        "camera_id": cam.camera_id,
+        "zone": zone,
+        "severity": max_severity,
+        "confidence": float(max_conf),
+        "image_path": img_path,
+        "evidence_ready": evidence["ready"],
+        "location": current_location,
+        "location_url": loc_url,
+    })
+    
+    # Log to MySQL Database
+    lat = current_location['lat'] if current_location else None
+    lon = current_location['lon'] if current_location else None
+    
+    # We map max_severity to LOW/MEDIUM/HIGH for ENUM compatibility
+    db_severity = "HIGH"
+    if max_severity.lower() == "medium": db_severity = "MEDIUM"
+    if max_severity.lower() == "low": db_severity = "LOW"
+
+    # Queued for the background event writer (batched, never blocks the loop)
+    log_detection(
+        max_conf, 
+        max_chaos, # Chaos of the box that passed the liveness check
+        db_severity, 
+        zone, 
+        img_path, 
+        alert_sent,
+        lat, 
+        lon, 
+        loc_url
+    )
+
+def record_smoke_event(cam, frame, conf, zone=None):
+    """Pre-alarm: evidence + a 'smoke' row in fire_events, no sound or calls."""
+    print(f"💨 Smoke pre-alarm! Camera: {cam.camera_id} Confidence: {conf:.2f}")
+    prealarms_total.inc(camera=cam.camera_id)
+    log("warning", "smoke_prealarm", camera=cam.camera_id, confidence=round(float(conf), 3), zone=zone)
+    img_path = get_evidence_store().save_event(cam.camera_id, frame, clip=False)["image_path"]
+
+    lat = current_location['lat'] if current_location else None
+    lon = current_location['lon'] if current_location else None
+    loc_url = f"https://maps.google.com/?q={lat},{lon}" if current_location else "GPS Unavailable"
+    log_detection(conf, 0.0, "LOW", zone or cam.zone, img_path, False, lat, lon, loc_url, event_type="smoke")
 
-fire_status = {
-    "detected": False,
-    "confidence": 0.0,
-    "timestamp": None,
-    "location": "Camera 1 (Main)",
-    "severity": "None",
-    "count": 0,
-    "message": "System Normal",
-    "camera_active": True
-}
-
-def generate_frames():
-    global fire_status, last_alarm_time, current_location, camera_active
-    cap = cv2.VideoCapture(0)
+def process_camera_frame(cam, frame, gray, captured_at, detections):
+    # detections ({label: boxes}) is None on frames where the detector was skipped
+    with stage_seconds.time(stage="track", camera=cam.camera_id):
+        tracks = cam.update_tracks(detections["fire"] if detections else None, gray.shape)
+        smoke_tracks = cam.update_smoke(detections["smoke"] if detections else None, gray.shape)
+    frame, summary = analyze_detections(frame, gray, cam.prev_gray, tracks, roi_cache=cam.roi_cache,
+                                        camera_id=cam.camera_id, zone_map=cam.zone_map, smoke_tracks=smoke_tracks,
+                                        flow_size=cam.quality.flow_size,
+                                        engine=cam.liveness_engine)
+    for stage, seconds in summary["timings"].items():
+        stage_seconds.observe(seconds, stage=stage, camera=cam.camera_id)
+    status = cam.status
+
+    # Update camera status
+    if summary["detected"]:
+        detections_total.inc(camera=cam.camera_id)
+        max_severity = summary["max_severity"]
+        status["detected"] = True
+        status["confidence"] = float(summary["max_conf"])
+        status["timestamp"] = time.time()
+        status["severity"] = max_severity
+        status["count"] = summary["count"]
+        status["zones"] = summary["zones"]
+        
+        if max_severity == "High":
+            status["message"] = f"CRITICAL: {summary['count']} FIRE(S) DETECTED!"
+        else:
+             status["message"] = f"Warning: {summary['count']} Fire(s) Visible"
+
+        # Alert Logic
+        current_time = time.time()
+        if current_time - cam.last_alarm_time > cam.setting("alarm_cooldown"):
+            trigger_alert(cam, frame, max_severity, summary["max_conf"], summary["max_chaos"], summary["zone"])
+            cam.last_alarm_time = current_time
+    elif status["detected"]:
+        # No live track left (tracks already outlive short detector misses)
+        status["detected"] = False
+        status["confidence"] = 0.0
+        status["severity"] = "None"
+        status["count"] = 0
+        status["zones"] = {}
+        status["message"] = "System Normal"
+
+    # Smoke pre-alarm, held for smoke_hold seconds after the last confirmed smoke
+    if cam.pre_alarm:
+        if summary["smoke_count"]:
+            status["smoke_confidence"] = float(summary["smoke_conf"])
+        if not status["detected"]:
+            status["message"] = "Pre-alarm: smoke detected"
+        if not status["smoke"] or time.time() - cam.last_smoke_event_time > cam.setting("alarm_cooldown"):
+            record_smoke_event(cam, frame, status["smoke_confidence"], summary["smoke_zone"])
+            cam.last_smoke_event_time = time.time()
+        status["smoke"] = True
+    elif status["smoke"]:
+        status["smoke"] = False
+        status["smoke_confidence"] = 0.0
+        if not status["detected"]:
+            status["message"] = "System Normal"
+    status["escalated"] = cam.escalated
+
+    # Encode frame once and hand it to every subscriber, and to the evidence ring
+    with stage_seconds.time(stage="encode", camera=cam.camera_id):
+        jpeg = encode_jpeg(frame)
+        cam.frame_buffer.publish(jpeg, status, frame)
+    get_evidence_store().record(cam.camera_id, jpeg)
     
-    prev_gray = None # Initialize previous frame for optical flow
+    # Update prev_gray
+    cam.prev_gray = gray
+
+    cam.counters.incr("processed")
+    latency = time.time() - captured_at
+    stage_seconds.observe(latency, stage="total", camera=cam.camera_id)
+    status["latency_ms"] = round(latency * 1000, 1)
+    cam.observe_latency(latency)
 
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+def refresh_fire_status():
+    """Folds the per-camera statuses into the global fire_status."""
+    active = [cam for cam in cameras.values() if cam.status["detected"]]
+    smoky = [cam for cam in cameras.values() if cam.status["smoke"]]
+    if active:
+        worst = max(active, key=lambda cam: (SEVERITY_RANK.get(cam.status["severity"], 0), cam.status["confidence"]))
+        fire_status.update({k: v for k, v in worst.status.items() if k != "camera_active"})
+        fire_status["count"] = sum(cam.status["count"] for cam in active)
+    else:
+        fire_status.update({
+            "detected": False,
+            "confidence": 0.0,
+            "severity": "None",
+            "count": 0,
+            "zones": {},
+            "message": "Pre-alarm: smoke detected" if smoky else "System Normal",
+        })
+        if smoky:
+            fire_status["location"] = max(smoky, key=lambda cam: cam.status["smoke_confidence"]).zone
+    fire_status["smoke"] = bool(smoky)
+    fire_status["smoke_confidence"] = max((cam.status["smoke_confidence"] for cam in smoky), default=0.0)
+    fire_status["escalated"] = any(cam.status["escalated"] for cam in cameras.values())
 
+def publish_status():
+    """Emits stream events for whatever changed since the last tick."""
+    status_broadcaster.publish("status", dict(fire_status), ignore=VOLATILE_FIELDS, quantize=QUANTIZED_FIELDS)
+    for cam in cameras.values():
+        payload = {**cam.status, "camera_id": cam.camera_id}
+        status_broadcaster.publish("camera", payload, key=f"camera:{cam.camera_id}", ignore=VOLATILE_FIELDS,
+                                   quantize=QUANTIZED_FIELDS)
+
+def run_detector_groups(groups):
+    """Runs every group of frames sharing detector options, returns ({label: boxes}, seconds) per camera."""
+    if inference_pool is not None:
+        return inference_pool.detect(groups)
+    results, timings = {}, {}
+    for (conf, imgsz, mode), members in groups.items():
+        start = time.perf_counter()
+        boxes = detect_labeled_batch([frame for _, frame in members], conf, imgsz, mode)
+        elapsed = time.perf_counter() - start
+        for (camera_id, _), camera_boxes in zip(members, boxes):
+            results[camera_id] = camera_boxes
+            timings[camera_id] = elapsed
+    return results, timings
+
+def detection_loop():
+    global inference_pool
+    # Load + warm up the model before the cameras start filling buffers,
+    # either here or in the worker processes
+    if INFERENCE_WORKERS > 0:
+        inference_pool = InferencePool(INFERENCE_WORKERS)
+        print(f"🧠 {INFERENCE_WORKERS} inference worker process(es) started")
+    else:
+        get_detector()
+
+    # Capture runs on one thread per camera and only ever keeps the newest frame
+    for cam in cameras.values():
+        cam.start()
+
+    # With inference workers the loop is pipelined: tick N+1 is submitted before
+    # tick N is post-processed, so the workers infer while this thread tracks,
+    # draws and encodes. In-process inference stays in lockstep.
+    # Liveness stays on this thread too: it scores the tracker's boxes (coasted
+    # ones included) against each camera's previous frame and ROI cache, state
+    # the workers don't have. benchmark.py --liveness-cost (3 boxes per 720p
+    # camera, one core): farneback ~1 ms per box, 4 cameras 13 ms, 8 cameras
+    # 28 ms, 16 cameras 64 ms a tick; lk about a third of that. Past ~8 cameras
+    # it bounds the tick rate whatever INFERENCE_WORKERS is.
+    in_flight = None  # (batch, ticket) submitted to the pool, not post-processed yet
     while True:
-        if not camera_active:
-            if cap.isOpened():
-                cap.release()
-                print("📷 Camera Resource Released (Privacy Mode)")
-            
-            # If camera is off, yield a placeholder (black frame)
-            blank_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(blank_frame, "CAMERA OFF", (200, 240), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (100, 100, 100), 2)
-            ret, buffer = cv2.imencode('.jpg', blank_frame)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.5)
+        # Newest frame of every active camera, stale ones are skipped
+        batch = collect_batch(cameras)
+        if not batch and in_flight is None:
+            time.sleep(0.005)
             continue
-            
-        if not cap.isOpened():
-             print("📷 Camera Resource Re-acquired")
-             cap.open(0)
-             cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-             cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-        success, frame = cap.read()
-        if not success:
-            break
-        
-        # Run detection
-        results = model(frame, verbose=False, conf=0.30)
-        
-        # Convert to grayscale for optical flow
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        detected_in_frame = False
-        detections_list = []
-        max_conf = 0.0
-        max_conf = 0.0
-        max_severity = "None"
-        max_chaos = 0.0
-        
-        # Overlay for transparent drawing
-        overlay = frame.copy()
-        
-        for result in results:
-            for box in result.boxes:
-                cls = int(box.cls[0])
-                conf = float(box.conf[0])
-                label = model.names[cls]
-                
-                if label.lower() == "fire" and conf > 0.30:
-                    detected_in_frame = True
-                    max_conf = max(max_conf, conf)
-                    
-                    # Calculate Area
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    box_area = (x2 - x1) * (y2 - y1)
-                    frame_area = frame.shape[0] * frame.shape[1]
-                    coverage_pct = (box_area / frame_area) * 100
-                    
-                    # Determine Severity
-                    severity = "Low"
-                    color = (0, 255, 0) # Green for small
-                    
-                    if coverage_pct > 15.0:
-                        severity = "High"
-                        if max_severity != "High": max_severity = "High"
-                        color = (0, 0, 255) # Red for danger
-                    elif coverage_pct > 2.0:
-                        severity = "Medium"
-                        if max_severity == "None" or max_severity == "Low": max_severity = "Medium"
-                        color = (0, 165, 255) # Orange
-                    elif max_severity == "None":
-                         max_severity = "Low"
-
-                    if prev_gray is not None:
-                         # Perform Liveness/Chaos Check
-                         # Ensure coords are within bounds
-                         h, w = gray.shape
-                         cx1, cy1 = max(0, x1), max(0, y1)
-                         cx2, cy2 = min(w, x2), min(h, y2)
-                         
-                         chaos, motion_mag = calculate_chaos(gray, prev_gray, cx1, cy1, cx2, cy2)
-                         
-                         print(f"DEBUG: Chaos={chaos:.4f} (Thresh={CHAOS_THRESHOLD}), Motion={motion_mag:.4f} (Thresh=0.3)")
-
-                         # Filter out static images or shaking photos
-                         # If it's static (low motion) OR organized motion (low chaos but high motion = shaking)
-                         if motion_mag < 0.3:
-                             severity = "Static (Fake)"
-                             color = (255, 0, 0) # Blue
-                             # Don't mark as detected_in_frame if it's static
-                             detected_in_frame = False 
-                             conf = 0.0 # Suppress confidence
-                         elif chaos < CHAOS_THRESHOLD:
-                             severity = "Shaking (Fake)"
-                             color = (255, 165, 0) # Orange
-                             detected_in_frame = False
-                             conf = 0.0
-                         else:
-                             # Real Fire!
-                             detected_in_frame = True
-                             max_chaos = chaos
-
-                    # If first frame or check passed (if we set detected_in_frame = True above)
-                    # Note: We rely on detected_in_frame flag primarily
-                    if severity in ["Static (Fake)", "Shaking (Fake)"]:
-                         # It was detected by YOLO but rejected by Liveness
-                         pass 
-                    else:
-                        # Re-evaluate severity based on coverage IF it is real
-                        pass # kept previous severity logic but we need to ensure detected_in_frame matches
-
-                    detections_list.append({"severity": severity, "conf": conf})
-
-                    # DRAWING: Semi-transparent Fill
-                    # Draw filled box on overlay
-                    cv2.rectangle(overlay, (x1, y1), (x2, y2), color, -1) 
-                    
-                    # Text Label with Background
-                    label_text = f"{severity.upper()} {conf:.2f}"
-                    t_size = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
-                    cv2.rectangle(frame, (x1, y1 - t_size[1] - 10), (x1 + t_size[0] + 10, y1), color, -1)
-                    cv2.putText(frame, label_text, (x1 + 5, y1 - 5), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                                
-                    # Draw Border on original frame (to keep edges sharp)
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-
-        # Apply transparency
-        if detected_in_frame:
-            alpha = 0.35
-            frame = cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0)
-
-        # Update global status
-        if detected_in_frame:
-            fire_status["detected"] = True
-            fire_status["confidence"] = float(max_conf)
-            fire_status["timestamp"] = time.time()
-            fire_status["severity"] = max_severity
-            fire_status["count"] = len(detections_list)
-            
-            if max_severity == "High":
-                fire_status["message"] = f"CRITICAL: {len(detections_list)} FIRE(S) DETECTED!"
+
+        submitted = None
+        if batch:
+            # One batched model call per detector setting (usually just one) for the
+            # streams due for detection, results routed back per camera.
+            # The others are carried by their tracker.
+            # The colour gate may have narrowed a frame down to its flame-coloured region.
+            groups = {}
+            picked_at = time.time()
+            for cam, frame, _, captured_at, window in batch:
+                # Capture stage: age of the frame when the worker picked it up
+                stage_seconds.observe(picked_at - captured_at, stage="capture", camera=cam.camera_id)
+                if window:
+                    groups.setdefault(cam.detector_options(), []).append((cam.camera_id, crop_window(frame, window)))
+            if inference_pool is not None:
+                submitted = (batch, inference_pool.submit(groups))
             else:
-                 fire_status["message"] = f"Warning: {len(detections_list)} Fire(s) Visible"
-
-            # Alert Logic
-            current_time = time.time()
-            if current_time - last_alarm_time > ALARM_COOLDOWN:
-                print(f"🔥 Alert Triggered! Severity: {max_severity}")
-                
-                # Generate Google Maps URL
-                loc_url = "GPS Unavailable"
-                if current_location:
-                    loc_url = f"https://maps.google.com/?q={current_location['lat']},{current_location['lon']}"
-
-                threading.Thread(target=play_alarm, daemon=True).start()
-                img_path = save_fire_image(frame)
-                
-                # Send Notifications (Email + Voice Call)
-                threading.Thread(target=send_email_alert, args=(img_path, current_location), daemon=True).start()
-                threading.Thread(target=make_call_alert, args=(max_severity, loc_url), daemon=True).start()
-                
-                # Log to MySQL Database
-                print("DEBUG: Triggering Database Log...")
-                lat = current_location['lat'] if current_location else None
-                lon = current_location['lon'] if current_location else None
-                
-                # We map max_severity to LOW/MEDIUM/HIGH for ENUM compatibility
-                db_severity = "HIGH"
-                if max_severity.lower() == "medium": db_severity = "MEDIUM"
-                if max_severity.lower() == "low": db_severity = "LOW"
-
-                # Calculate chaos for the FIRST detected box just for logging (approximate)
-                # In reality we iterate multiple boxes, but we'll log the "event"
-                # We can use the last calculated chaos from the loop above if available, 
-                # but 'chaos' variable scope might be inside loop. 
-                # Let's assume high chaos if it triggered 'High/Real Fire'.
-                # To be precise, we should have captured specific chaos of the triggering box.
-                # For now, we will log the chaos of the last processed box or a default high value.
-                log_chaos = max_chaos # Use actual captured chaos
-                
-                threading.Thread(target=log_detection, args=(
-                    max_conf, 
-                    log_chaos, 
-                    db_severity, 
-                    "Camera 1", 
-                    img_path, 
-                    True, # Alert Sent
-                    lat, 
-                    lon, 
-                    loc_url
-                ), daemon=True).start()
-
-                last_alarm_time = current_time
-        else:
-            if fire_status["timestamp"] and (time.time() - fire_status["timestamp"] > 3):
-                fire_status["detected"] = False
-                fire_status["confidence"] = 0.0
-                fire_status["severity"] = "None"
-                fire_status["count"] = 0
-                fire_status["message"] = "System Normal"
-
-        # Encode frame
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-        
-        # Update prev_gray
-        prev_gray = gray.copy()
+                finish_batch(batch, *run_detector_groups(groups))
+
+        if in_flight is not None:
+            previous, ticket = in_flight
+            finish_batch(previous, *inference_pool.collect(ticket))
+        in_flight = submitted
+
+def finish_batch(batch, results, timings):
+    """Post-processing of one tick: tracking, liveness, alarms, encoding, status."""
+    for camera_id, elapsed in timings.items():
+        stage_seconds.observe(elapsed, stage="inference", camera=camera_id)
+
+    # A camera missing from results (worker timeout) is carried like a skipped frame
+    for cam, frame, gray, captured_at, window in batch:
+        if not cam.active:
+            continue  # Switched off while this tick was in flight
+        detections = results.get(cam.camera_id) if window else None
+        if detections:
+            detections = {label: shift_boxes(boxes, window) for label, boxes in detections.items()}
+        process_camera_frame(cam, frame, gray, captured_at, detections)
 
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+    refresh_fire_status()
+    publish_status()
+
+def start_detection_worker():
+    """Starts the background capture/detection worker (only once per process)."""
+    global worker_thread
+    if not DETECTION_WORKER:
+        return
+    with worker_lock:
+        if worker_thread is None or not worker_thread.is_alive():
+            worker_thread = threading.Thread(target=detection_loop, daemon=True)
+            worker_thread.start()
+
+def get_camera(camera_id):
+    cam = cameras.get(camera_id)
+    if cam is None:
+        abort(404)
+    return cam
+
+def generate_frames(camera_id=None, width=None, quality=None, max_fps=None):
+    start_detection_worker()
+    return mjpeg_stream(get_camera(camera_id or default_camera_id).frame_buffer, width, quality, max_fps)
+
+@app.before_request
+def ensure_worker():
+    # Detection must run even when nobody is watching the feed
+    start_detection_worker()
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/video_feed/<camera_id>')
+def video_feed(camera_id=None):
+    # Optional ?width=320&quality=60&fps=5 for remote / low-bandwidth dashboards
+    try:
+        width = int(request.args['width']) if 'width' in request.args else None
+        quality = int(request.args['quality']) if 'quality' in request.args else None
+        max_fps = float(request.args['fps']) if 'fps' in request.args else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "width, quality and fps must be numbers"}), 400
+    return Response(generate_frames(camera_id, width, quality, max_fps),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+def motion_gate_summary():
+    checked = sum(cam.motion_gate.checked for cam in cameras.values())
+    skipped = sum(cam.motion_gate.skipped for cam in cameras.values())
+    return {
+        "checked": checked,
+        "skipped": skipped,
+        "skip_rate": round(skipped / checked, 3) if checked else 0.0,
+    }
+
+def color_gate_summary():
+    checked = sum(cam.color_gate.checked for cam in cameras.values())
+    rejected = sum(cam.color_gate.rejected for cam in cameras.values())
+    return {
+        "checked": checked,
+        "rejected": rejected,
+        "cropped": sum(cam.color_gate.cropped for cam in cameras.values()),
+        "rejection_rate": round(rejected / checked, 3) if checked else 0.0,
+    }
+
+def subsystem_stats(subsystem, method="snapshot"):
+    # None until the subsystem was started by the pipeline, the status API never starts one
+    return getattr(subsystem, method)() if subsystem is not None else None
 
 @app.route('/api/status')
 def get_status():
-    return jsonify(fire_status)
+    return jsonify({
+        **fire_status,
+        "motion_gate": motion_gate_summary(),
+        "color_gate": color_gate_summary(),
+        "event_writer": subsystem_stats(peek_event_writer(), "stats"),
+        "alerts": subsystem_stats(peek_alert_dispatcher()),
+        "evidence": subsystem_stats(peek_evidence_store()),
+        "audio": subsystem_stats(peek_alarm_player()),
+        "inference_pool": inference_pool.snapshot() if inference_pool else None,
+        # Operating point the latency controller picked per camera (see quality.py)
+        "quality": {cam.camera_id: cam.quality_point() for cam in cameras.values()},
+        "cameras": {cam.camera_id: cam.snapshot() for cam in cameras.values()}
+    })
+
+def collect_runtime_metrics():
+    """Gauges read from the existing stats at scrape time."""
+    frames, fps, gate_skipped, color_rejected, quality = [], [], [], [], []
+    for cam in cameras.values():
+        stats = cam.counters.snapshot()
+        for stage in ("captured", "dropped", "processed"):
+            labels = {"camera": cam.camera_id, "stage": stage}
+            frames.append((labels, stats.get(stage, 0)))
+            fps.append((labels, stats.get(f"{stage}_fps", 0.0)))
+        gate_skipped.append(({"camera": cam.camera_id}, cam.motion_gate.skipped))
+        color_rejected.append(({"camera": cam.camera_id, "outcome": "rejected"}, cam.color_gate.rejected))
+        color_rejected.append(({"camera": cam.camera_id, "outcome": "cropped"}, cam.color_gate.cropped))
+        quality.append(({"camera": cam.camera_id}, cam.quality.level))
+
+    # Subsystems nobody started yet report zeros rather than being started here
+    alerts = subsystem_stats(peek_alert_dispatcher()) or {
+        "sent": {}, "queued": 0, "incidents": 0, "deduplicated": 0, "rate_limited": 0, "dropped": 0, "failed": 0}
+    writer = subsystem_stats(peek_event_writer(), "stats") or {"queued": 0, "written": 0, "spooled": 0}
+    evidence = subsystem_stats(peek_evidence_store()) or {"queued": 0}
+    return [
+        ("flaresense_frames_total", "Frames per camera and stage", "counter", frames),
+        ("flaresense_fps", "Sliding-window fps per camera and stage", "gauge", fps),
+        ("flaresense_motion_gate_skipped_total", "Frames where the motion gate skipped the detector",
+         "counter", gate_skipped),
+        ("flaresense_quality_level", "Operating point of the latency controller (0 = full quality)",
+         "gauge", quality),
+        ("flaresense_color_gate_frames_total", "Frames the colour gate kept off the detector or cropped",
+         "counter", color_rejected),
+        ("flaresense_alerts_sent_total", "Alerts delivered per channel", "counter",
+         [({"channel": channel}, count) for channel, count in alerts["sent"].items()]),
+        ("flaresense_alert_incidents_total", "Incidents by dispatcher outcome", "counter",
+         [({"outcome": k}, alerts[k]) for k in ("incidents", "deduplicated", "rate_limited", "dropped", "failed")]),
+        ("flaresense_events_written_total", "fire_events rows written (including spool replays)", "counter",
+         [({}, writer["written"])]),
+        ("flaresense_events_spooled_total", "fire_events rows spooled to disk", "counter",
+         [({}, writer["spooled"])]),
+        ("flaresense_queue_depth", "Items waiting in background queues", "gauge",
+         [({"queue": "events"}, writer["queued"]), ({"queue": "alerts"}, alerts["queued"]),
+          ({"queue": "evidence"}, evidence["queued"])]),
+    ]
+
+registry.add_collector(collect_runtime_metrics)
+
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stream')
+def stream_status():
+    # Server-Sent Events: pushed on change, EventSource resumes via Last-Event-ID
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(status_broadcaster.subscribe(last_event_id),
+                    mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/api/status/<camera_id>')
+def get_camera_status(camera_id):
+    return jsonify(get_camera(camera_id).snapshot())
+
+def parse_time_arg(name):
+    # Accepts ISO 8601 ("2026-01-28T11:49:00") or a unix timestamp
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value))
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+def history_filters():
+    return {
+        "start": parse_time_arg('start'),
+        "end": parse_time_arg('end'),
+        "zone": request.args.get('zone'),
+        "severity": request.args.get('severity'),
+        "event_type": request.args.get('event_type'),  # fire or smoke
+    }
+
+@app.route('/api/events')
+def get_events():
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        page = query_events(limit=limit, cursor=request.args.get('cursor'), **history_filters())
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except ConnectionError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    return jsonify(page)
+
+@app.route('/api/events/stats')
+def get_event_stats():
+    try:
+        stats = event_stats(**history_filters())
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except ConnectionError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    return jsonify(stats)
+
+@app.route('/api/config')
+def get_config():
+    return jsonify({**settings.snapshot(),
+                    "effective": {cam.camera_id: settings.effective(cam.camera_id) for cam in cameras.values()}})
+
+@app.route('/api/config', methods=['POST'])
+def update_config():
+    # Hot-swaps thresholds / inference size / frame-skip / gating, no restart or model reload.
+    # Body: {"settings": {"min_confidence": 0.4, ...}, "camera_id": "lobby"} (camera_id optional)
+    if ADMIN_TOKEN:
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+            return jsonify({"status": "error", "message": "admin token required"}), 403
+    elif request.remote_addr not in LOOPBACK_ADDRESSES:
+        return jsonify({"status": "error",
+                        "message": "set ADMIN_TOKEN to change settings from another host"}), 403
+    data = request.json
+    if not data or not isinstance(data.get('settings'), dict):
+        return jsonify({"status": "error", "message": "expected {\"settings\": {...}}"}), 400
+    camera_id = data.get('camera_id')
+    if camera_id:
+        get_camera(camera_id)
+    try:
+        effective = settings.update(data['settings'], camera_id)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    print(f"⚙️ Settings updated ({camera_id or 'all'}): {data['settings']}")
+    return jsonify({"status": "success", "camera_id": camera_id, "settings": effective})
 
 @app.route('/api/location', methods=['POST'])
 def update_location():
@@ -280,11 +522,22 @@ def update_location():
 def toggle_camera():
     global camera_active
     data = request.json
-    if 'active' in data:
-        camera_active = data['active']
+    if data and 'active' in data:
+        # Optional "camera_id" toggles a single stream, otherwise all of them
+        camera_id = data.get('camera_id')
+        targets = [get_camera(camera_id)] if camera_id else list(cameras.values())
+        for cam in targets:
+            cam.active = data['active']
+            cam.status['camera_active'] = cam.active
+            store = peek_evidence_store()
+            if not cam.active and store is not None:
+                # No post-event frames will come, write its clips with what they have
+                store.finish_clips(cam.camera_id)
+        camera_active = any(cam.active for cam in cameras.values())
         fire_status['camera_active'] = camera_active
-        status_msg = "ON" if camera_active else "OFF"
-        print(f"📷 Camera toggled {status_msg}")
+        publish_status()
+        status_msg = "ON" if data['active'] else "OFF"
+        print(f"📷 Camera toggled {status_msg} ({camera_id or 'all'})")
         return jsonify({"status": "success", "camera_active": camera_active})
     return jsonify({"status": "error"}), 400
 
@@ -294,4 +547,5 @@ if __name__ == '__main__':
     # Initialize Database
     init_db()
     # Run server
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
+    # Werkzeug's debugger must never face the network, FLASK_DEBUG=1 for development only
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv("FLASK_DEBUG", "0") == "1", threaded=True)
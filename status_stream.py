@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15.0
+# Events kept for clients resuming with Last-Event-ID
+EVENT_HISTORY = 256
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Don't let a reverse proxy buffer the stream
+}
+
+
+def _quantized(value, step):
+    if not step or isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return round(value / step)
+
+
+class StatusBroadcaster:
+    """Pushes status changes to Server-Sent Events subscribers.
+
+    publish() is called on every pipeline tick but only records an event when
+    the significant part of the payload changed, so idle dashboards cost
+    nothing but a heartbeat. Each event has an increasing id prefixed with
+    this process' epoch; a reconnecting client sends Last-Event-ID and gets
+    the events it missed replayed, or the full current state when the id is
+    from another process (server restart) or otherwise unknown.
+    """
+
+    def __init__(self, history=EVENT_HISTORY, heartbeat=HEARTBEAT_INTERVAL):
+        self.heartbeat = heartbeat
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._latest = {}      # key -> (event_id, event, data) for new subscribers
+        self._signatures = {}  # key -> last published signature
+        self._next_id = 1
+        # Ids of a previous process must not be mistaken for ours
+        self.epoch = f"{os.getpid():x}{int(time.time() * 1000):x}"
+
+    def publish(self, event, payload, key=None, ignore=(), quantize=None):
+        """Records payload as a new event if it differs from the last one for key.
+
+        Fields listed in `ignore` (timestamps, latency...) don't count as a change.
+        Fields in `quantize` ({name: step}) only count once they move to another
+        step, so per-frame jitter isn't a change but a real one still is; the
+        event carries the exact value. Returns True when an event was emitted.
+        """
+        key = key or event
+        quantize = quantize or {}
+        compared = {k: _quantized(v, quantize.get(k)) for k, v in payload.items() if k not in ignore}
+        signature = json.dumps(compared, sort_keys=True, default=str)
+        with self._cond:
+            if self._signatures.get(key) == signature:
+                return False
+            self._signatures[key] = signature
+            data = json.dumps(payload, default=str)
+            record = (self._next_id, event, data)
+            self._next_id += 1
+            self._events.append(record)
+            self._latest[key] = record
+            self._cond.notify_all()
+            return True
+
+    def event_id(self, number):
+        return f"{self.epoch}-{number}"
+
+    def parse_event_id(self, value):
+        """Event number of a Last-Event-ID, None when it isn't one of this process'."""
+        if not value:
+            return None
+        epoch, _, number = str(value).rpartition("-")
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def _missed(self, last_event_id):
+        """Events after last_event_id, or the latest state if it is unknown or fell out of history."""
+        if (last_event_id is None or not self._events or last_event_id >= self._next_id
+                or last_event_id < self._events[0][0] - 1):
+            return sorted(self._latest.values())
+        return [record for record in self._events if record[0] > last_event_id]
+
+    def subscribe(self, last_event_id=None):
+        """Generator of SSE-formatted chunks for one client (last_event_id as sent by it)."""
+        last_event_id = self.parse_event_id(last_event_id)
+        with self._cond:
+            pending = self._missed(last_event_id)
+            last_seen = pending[-1][0] if pending else (self._next_id - 1)
+
+        yield "retry: 2000\n\n"
+        while True:
+            for event_id, event, data in pending:
+                yield f"id: {self.event_id(event_id)}\nevent: {event}\ndata: {data}\n\n"
+
+            with self._cond:
+                self._cond.wait_for(lambda: self._next_id - 1 > last_seen, self.heartbeat)
+                pending = [record for record in self._events if record[0] > last_seen]
+                if pending:
+                    last_seen = pending[-1][0]
+
+            if not pending:
+                yield ": heartbeat\n\n"
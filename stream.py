@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+import cv2
+
+# Quality of the default stream, clients can ask for less with ?quality=
+STREAM_JPEG_QUALITY = int(os.getenv("STREAM_JPEG_QUALITY", "80"))
+MIN_VARIANT_WIDTH = 80
+
+PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+def encode_jpeg(frame, quality=STREAM_JPEG_QUALITY):
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buffer.tobytes()
+
+
+def mjpeg_part(jpeg):
+    """Complete multipart chunk, built once and shared by every subscriber."""
+    return PART_HEADER + jpeg + b'\r\n'
+
+
+class FrameBuffer:
+    """Latest annotated frame (plus status) published by a camera worker.
+
+    The worker writes here once per processed frame and any number of MJPEG
+    clients read from it, so adding viewers never adds inference work.
+    Readers always pick up the newest frame - a slow client simply skips
+    the frames it missed instead of holding up the pipeline.
+
+    The default JPEG is encoded once per tick. Downscaled / lower-quality
+    variants are encoded on first request and cached until the next tick, so
+    clients asking for the same setting share one encode.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._part = None
+        self._variants = {}
+        self._status = {}
+        self._seq = 0
+
+    def publish(self, jpeg, status=None, frame=None):
+        """Publishes an already-encoded JPEG (frame is kept for variants, if given)."""
+        part = mjpeg_part(jpeg)
+        with self._cond:
+            self._frame = frame
+            self._part = part
+            self._variants = {}
+            if status is not None:
+                self._status = dict(status)
+            self._seq += 1
+            self._cond.notify_all()
+
+    def publish_frame(self, frame, status=None, quality=STREAM_JPEG_QUALITY):
+        """Encodes the frame once at the default quality and publishes it."""
+        self.publish(encode_jpeg(frame, quality), status, frame)
+
+    def latest(self):
+        with self._cond:
+            return self._seq, self._part, self._status
+
+    def wait_for_frame(self, last_seq, timeout=1.0):
+        """Blocks until a frame newer than last_seq is published (or timeout)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq, timeout)
+            return self._seq, self._part
+
+    def variant(self, seq, width=None, quality=None):
+        """Multipart chunk of frame `seq` at the requested width/quality (cached per tick)."""
+        key = (width, quality)
+        with self._cond:
+            if seq != self._seq or self._frame is None or key == (None, None):
+                return self._part  # Newer frame already, or nothing to re-encode
+            part = self._variants.get(key)
+            if part is not None:
+                return part
+            frame = self._frame
+
+        if width and width < frame.shape[1]:
+            height = int(frame.shape[0] * width / frame.shape[1])
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        part = mjpeg_part(encode_jpeg(frame, quality or STREAM_JPEG_QUALITY))
+
+        with self._cond:
+            if seq == self._seq:
+                self._variants.setdefault(key, part)
+        return part
+
+
+def normalize_variant(width=None, quality=None, max_fps=None):
+    """Snaps client-requested settings so only a few variants get cached."""
+    if width:
+        width = max(MIN_VARIANT_WIDTH, int(width) // 16 * 16)
+    if quality:
+        quality = min(95, max(20, int(quality) // 5 * 5))
+        if quality == STREAM_JPEG_QUALITY:
+            quality = None
+    if max_fps:
+        max_fps = max(0.1, float(max_fps))
+    return width or None, quality or None, max_fps or None
+
+
+def mjpeg_stream(buffer, width=None, quality=None, max_fps=None):
+    """Yields multipart MJPEG chunks from a FrameBuffer for one HTTP client."""
+    width, quality, max_fps = normalize_variant(width, quality, max_fps)
+    min_interval = 1.0 / max_fps if max_fps else 0.0
+    seq = 0
+    last_sent = 0.0
+    while True:
+        if min_interval:
+            # Client asked for a lower frame rate, frames in between are skipped
+            wait = min_interval - (time.time() - last_sent)
+            if wait > 0:
+                time.sleep(wait)
+        new_seq, part = buffer.wait_for_frame(seq)
+        if part is None or new_seq == seq:
+            continue  # Nothing new yet, keep waiting
+        seq = new_seq
+        last_sent = time.time()
+        yield buffer.variant(seq, width, quality)
@@ -0,0 +1,184 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Structured logs: one JSON object per line on stderr
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Share of debug events actually written (per-frame events are very chatty)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+# Seconds, from sub-millisecond stages up to a slow model on a busy CPU
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    escaped = ((k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, n=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(key + (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(key)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(key)} {values[-1]}")
+        return lines
+
+
+class Registry:
+    """Metrics owned by this process plus gauges collected at scrape time.
+
+    Collectors are callables returning (name, help, type, [(labels, value)]),
+    so existing stats dicts (camera counters, queue sizes) are exported
+    without being mirrored on the hot path.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                log("warning", "collector_failed", error=str(e))
+                continue
+            for name, help_text, kind, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_label_text(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "flaresense_stage_seconds", "Per-frame latency of each pipeline stage")
+db_write_seconds = registry.histogram(
+    "flaresense_db_write_seconds", "Latency of one batched fire_events insert")
+detections_total = registry.counter(
+    "flaresense_detections_total", "Processed frames with at least one live fire track")
+alarms_total = registry.counter(
+    "flaresense_alarms_total", "Alarms raised (after the cooldown)")
+prealarms_total = registry.counter(
+    "flaresense_smoke_prealarms_total", "Smoke pre-alarm events recorded (after the cooldown)")
+
+
+# Structured logging
+
+logger = logging.getLogger("flaresense")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+
+_sample_counts = {}
+
+
+def is_enabled(level):
+    """True when `level` would be logged; guard hot-path calls so their fields aren't built for nothing."""
+    return logger.isEnabledFor(getattr(logging, level.upper()))
+
+
+def log(level, event, sample=None, **fields):
+    """Writes one JSON log line if the level is enabled.
+
+    `sample` (0-1) keeps only that share of the calls for this event,
+    deterministically (every n-th), so hot-path events cost a dict lookup.
+    Debug events default to LOG_SAMPLE_RATE.
+    """
+    levelno = getattr(logging, level.upper())
+    if not logger.isEnabledFor(levelno):
+        return
+    if sample is None and levelno <= logging.DEBUG:
+        sample = LOG_SAMPLE_RATE
+    if sample is not None and sample < 1.0:
+        count = _sample_counts.get(event, 0)
+        _sample_counts[event] = count + 1
+        if sample <= 0 or count % max(1, int(round(1.0 / sample))):
+            return
+        fields["sampled"] = sample
+    record = {"ts": round(time.time(), 3), "level": level.lower(), "event": event, **fields}
+    logger.log(levelno, json.dumps(record, default=str))
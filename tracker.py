@@ -0,0 +1,171 @@
+import itertools
+from collections import deque
+
+import numpy as np
+
+from config import settings
+
+# Rolling window of per-frame liveness samples kept per track
+TRACK_HISTORY = 15
+# Liveness samples needed before a track can be judged real or fake
+TRACK_MIN_FRAMES = 5
+# Detection passes a track may go unmatched before it is dropped
+TRACK_MAX_MISSES = 3
+IOU_MATCH_THRESHOLD = 0.3
+# Startup defaults of the verdict thresholds (tunable per camera at runtime)
+CHAOS_THRESHOLD = settings.get("chaos_threshold")
+MOTION_THRESHOLD = settings.get("motion_threshold")
+
+
+def iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+def centroid_close(a, b):
+    """Fallback match: centroids closer than half the larger box side."""
+    ax, ay = (a[0] + a[2]) / 2, (a[1] + a[3]) / 2
+    bx, by = (b[0] + b[2]) / 2, (b[1] + b[3]) / 2
+    reach = max(a[2] - a[0], a[3] - a[1], b[2] - b[0], b[3] - b[1]) / 2
+    return abs(ax - bx) <= reach and abs(ay - by) <= reach
+
+
+def judge(chaos, motion, thresholds):
+    """'pending', 'static', 'shaking' or 'live' for a window of liveness samples."""
+    if len(chaos) < TRACK_MIN_FRAMES:
+        return "pending"
+    if np.mean(motion) < thresholds["motion"]:
+        return "static"
+    if np.mean(chaos) < thresholds["chaos"]:
+        return "shaking"
+    return "live"
+
+
+class Track:
+    """One fire candidate followed over time, with rolling liveness evidence."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, box, conf, thresholds=None):
+        self.track_id = next(Track._ids)
+        # Shared with the tracker, so a threshold change applies to live tracks too
+        self.thresholds = thresholds if thresholds is not None else {
+            "motion": MOTION_THRESHOLD, "chaos": CHAOS_THRESHOLD}
+        self.box = tuple(box)           # Current box (may be predicted)
+        self.detected_box = tuple(box)  # Last box the detector actually saw
+        self.velocity = (0.0, 0.0)      # Centroid shift per frame
+        self.frames_since_detection = 0
+        self.hits = 1
+        self.misses = 0
+        self.chaos = deque(maxlen=TRACK_HISTORY)
+        self.motion = deque(maxlen=TRACK_HISTORY)
+        self.conf = deque([conf], maxlen=TRACK_HISTORY)
+
+    def update(self, box, conf):
+        old_cx, old_cy = (self.detected_box[0] + self.detected_box[2]) / 2, (self.detected_box[1] + self.detected_box[3]) / 2
+        new_cx, new_cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        frames = max(1, self.frames_since_detection)
+        self.velocity = ((new_cx - old_cx) / frames, (new_cy - old_cy) / frames)
+        self.box = tuple(box)
+        self.detected_box = tuple(box)
+        self.frames_since_detection = 0
+        self.conf.append(conf)
+        self.hits += 1
+        self.misses = 0
+
+    def predict(self):
+        """Box extrapolated from the last detection along the track velocity."""
+        steps = self.frames_since_detection
+        dx, dy = self.velocity[0] * steps, self.velocity[1] * steps
+        x1, y1, x2, y2 = self.detected_box
+        return (int(round(x1 + dx)), int(round(y1 + dy)), int(round(x2 + dx)), int(round(y2 + dy)))
+
+    def add_liveness(self, chaos, motion):
+        if not (np.isfinite(chaos) and np.isfinite(motion)):
+            return  # Engine still warming up, no sample for this frame
+        self.chaos.append(float(chaos))
+        self.motion.append(float(motion))
+
+    @property
+    def mean_conf(self):
+        return float(np.mean(self.conf))
+
+    @property
+    def mean_chaos(self):
+        return float(np.mean(self.chaos)) if self.chaos else 0.0
+
+    @property
+    def mean_motion(self):
+        return float(np.mean(self.motion)) if self.motion else 0.0
+
+    @property
+    def verdict(self):
+        """'pending', 'static', 'shaking' or 'live', from the rolling window."""
+        return judge(self.chaos, self.motion, self.thresholds)
+
+
+class FireTracker:
+    """Greedy IoU (with centroid fallback) tracker over the detector's boxes.
+
+    Alarms are decided on track-level evidence accumulated over several frames
+    instead of a single frame, and the tracker carries boxes forward on frames
+    where the detector is skipped.
+    """
+
+    def __init__(self, iou_threshold=IOU_MATCH_THRESHOLD, max_misses=TRACK_MAX_MISSES,
+                 motion_threshold=MOTION_THRESHOLD, chaos_threshold=CHAOS_THRESHOLD):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.thresholds = {"motion": motion_threshold, "chaos": chaos_threshold}
+        self.tracks = []
+
+    def update(self, boxes):
+        """Associates a detection pass with the existing tracks.
+
+        boxes: (x1, y1, x2, y2, conf) tuples. Returns the current tracks.
+        """
+        pairs = []
+        for ti, track in enumerate(self.tracks):
+            for di, box in enumerate(boxes):
+                score = iou(track.box, box[:4])
+                if score < self.iou_threshold and centroid_close(track.box, box[:4]):
+                    score = self.iou_threshold  # Weakest acceptable match
+                if score >= self.iou_threshold:
+                    pairs.append((score, ti, di))
+
+        matched_tracks, matched_boxes = set(), set()
+        for score, ti, di in sorted(pairs, reverse=True):
+            if ti in matched_tracks or di in matched_boxes:
+                continue
+            self.tracks[ti].update(boxes[di][:4], boxes[di][4])
+            matched_tracks.add(ti)
+            matched_boxes.add(di)
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                track.frames_since_detection += 1
+                track.box = track.predict()
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for di, box in enumerate(boxes):
+            if di not in matched_boxes:
+                self.tracks.append(Track(box[:4], box[4], self.thresholds))
+
+        return self.tracks
+
+    def carry(self):
+        """Moves every track along its velocity for a frame without detection."""
+        for track in self.tracks:
+            track.frames_since_detection += 1
+            track.box = track.predict()
+        return self.tracks
+
+    def reset(self):
+        self.tracks = []
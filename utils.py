@@ -1,23 +1,26 @@
 import os
-from datetime import datetime
 import cv2
 import numpy as np
 
+from config import settings
+
 # Liveness parameters
 # Lower motion threshold to detect small fires (matches)
 MIN_MOTION_PIXELS = 20
 # Chaos threshold: Real fire moves in many directions (High Variance)
 # Shaking moves in one direction (Low Variance)
-CHAOS_THRESHOLD = 0.15  # Lower threshold to accept less chaotic but still real small fires
+# 0.15 by default, lower to accept less chaotic but still real small fires (see config.py)
+CHAOS_THRESHOLD = settings.get("chaos_threshold")
+# Side of the square every ROI is resized to before optical flow
+FLOW_SIZE = 64
 
 if not os.path.exists("evidence"):
     os.makedirs("evidence")
 
-def save_fire_image(frame):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"evidence/fire_{timestamp}.jpg"
-    cv2.imwrite(filename, frame)
-    return filename
+def save_fire_image(frame, camera_id="cam1"):
+    # Written in the background by the evidence store, the path is reserved right away
+    from evidence import get_evidence_store
+    return get_evidence_store().save_event(camera_id, frame, clip=False)["image_path"]
 
 def calculate_chaos(curr_gray, prev_gray, x1, y1, x2, y2):
     # Extract ROI
@@ -55,3 +58,94 @@ def calculate_chaos(curr_gray, prev_gray, x1, y1, x2, y2):
     magnitude_score = np.mean(mag[mask])
     
     return chaos_score, magnitude_score
+
+def clip_box(x1, y1, x2, y2, shape):
+    """Clips box coordinates to the frame (shape is gray.shape).
+
+    Every coordinate is clamped into [0, w] / [0, h], so a box carried off
+    an edge comes back empty (x2 <= x1 or y2 <= y1) instead of wrapping a
+    negative slice index around the frame.
+    """
+    h, w = shape[:2]
+    return (min(w, max(0, x1)), min(h, max(0, y1)),
+            min(w, max(0, x2)), min(h, max(0, y2)))
+
+def calculate_chaos_batch(curr_gray, prev_gray, boxes, roi_cache=None, flow_size=FLOW_SIZE):
+    """Liveness scores for all boxes of a frame in one pass.
+
+    Same scores as calling calculate_chaos() per box, but the flow fields of
+    all boxes are stacked so magnitude/angle and the chaos statistics are
+    computed once with NumPy instead of once per box.
+
+    boxes: list of (x1, y1, x2, y2, ...) tuples, already clipped to the frame.
+    roi_cache: optional dict kept by the caller between frames. It holds this
+    frame's resized ROIs keyed by box, so when a box stays in place (e.g.
+    carried by a tracker) the previous frame's ROI isn't cropped/resized again.
+    flow_size: ROI side for the optical flow; smaller is cheaper (see
+    quality.py), scores are rescaled to what FLOW_SIZE would give so the
+    liveness thresholds don't depend on it.
+
+    Returns (chaos_scores, magnitude_scores) as float arrays of len(boxes).
+    """
+    n = len(boxes)
+    chaos_scores = np.zeros(n, dtype=np.float64)
+    magnitude_scores = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        if roi_cache is not None:
+            roi_cache.clear()  # Cached ROIs would be two frames old next time
+        return chaos_scores, magnitude_scores
+
+    prev_rois = roi_cache if roi_cache is not None else {}
+    next_rois = {}
+    flows = []
+    valid = []
+
+    for i, box in enumerate(boxes):
+        x1, y1, x2, y2 = box[:4]
+        curr_roi = curr_gray[y1:y2, x1:x2]
+        if curr_roi.size == 0:
+            continue
+
+        key = (x1, y1, x2, y2)
+        prev_small = prev_rois.get(key)
+        if prev_small is None or prev_small.shape[0] != flow_size:
+            prev_small = cv2.resize(prev_gray[y1:y2, x1:x2], (flow_size, flow_size))
+        curr_small = cv2.resize(curr_roi, (flow_size, flow_size))
+        next_rois[key] = curr_small
+
+        flows.append(cv2.calcOpticalFlowFarneback(prev_small, curr_small, None,
+                                                  0.5, 3, 15, 3, 5, 1.2, 0))
+        valid.append(i)
+
+    if roi_cache is not None:
+        roi_cache.clear()
+        roi_cache.update(next_rois)
+
+    if not valid:
+        return chaos_scores, magnitude_scores
+
+    # Stack to (k*64, 64) so cartToPolar runs once for every box
+    flows = np.stack(flows)
+    fx = np.ascontiguousarray(flows[..., 0]).reshape(-1, flow_size)
+    fy = np.ascontiguousarray(flows[..., 1]).reshape(-1, flow_size)
+    mag, ang = cv2.cartToPolar(fx, fy)
+    # Flow is in resized-ROI pixels, bring it back to the FLOW_SIZE scale
+    scale = FLOW_SIZE / float(flow_size)
+    mag = mag.reshape(len(valid), -1).astype(np.float64) * scale
+    ang = ang.reshape(len(valid), -1).astype(np.float64)
+
+    # Keep only significant motion, per box
+    mask = mag > 1.0
+    counts = mask.sum(axis=1)
+    safe_counts = np.maximum(counts, 1)
+
+    mean_ang = (ang * mask).sum(axis=1) / safe_counts
+    var_ang = (((ang - mean_ang[:, None]) * mask) ** 2).sum(axis=1) / safe_counts
+    mean_mag = (mag * mask).sum(axis=1) / safe_counts
+
+    # Fewer than 10 moving pixels (out of 64x64) = no significant motion
+    enough = counts >= 10 / scale ** 2
+    idx = np.asarray(valid)
+    chaos_scores[idx] = np.where(enough, np.sqrt(var_ang), 0.0)
+    magnitude_scores[idx] = np.where(enough, mean_mag, 0.0)
+    return chaos_scores, magnitude_scores
@@ -0,0 +1,164 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+# Per-camera polygons, coordinates are fractions (0-1) of the frame width/height:
+# {
+#   "lobby": {
+#     "zones": [{"name": "Loading bay", "polygon": [[0, 0.4], [1, 0.4], [1, 1], [0, 1]], "area_m2": 60}],
+#     "exclude": [[[0.7, 0], [1, 0], [1, 0.3], [0.7, 0.3]]]
+#   }
+# }
+# With include zones, only their pixels are watched; without, the whole frame
+# (minus exclusions) is a single zone named after the camera.
+ZONES_PATH = os.getenv("ZONES_PATH", "zones.json")
+# Severity cutoffs (Medium, High): % of the zone on fire, or m² when the zone has area_m2
+SEVERITY_COVERAGE_PCT = (2.0, 15.0)
+SEVERITY_AREA_M2 = (0.5, 2.0)
+# Boxes with less than this share of their area in a watched zone are rejected
+MIN_ALLOWED_FRACTION = 0.5
+
+
+def load_zone_config(path=ZONES_PATH):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        config = json.load(f)
+    print(f"🗺️ Loaded zones for {len(config)} camera(s) from {path}")
+    return config
+
+
+def _severity(value, cutoffs):
+    if value > cutoffs[1]:
+        return "High"
+    if value > cutoffs[0]:
+        return "Medium"
+    return "Low"
+
+
+class ZoneMap:
+    """Include / exclude polygons of one camera, rasterized per frame size.
+
+    Masks are built once per resolution: a label image (0 = default zone or
+    nothing, i = zone i), the excluded pixels, and an integral image of the
+    watched pixels so rejecting a box costs four lookups.
+    """
+
+    def __init__(self, default_name, zones=(), exclude=()):
+        self.default_name = default_name
+        self.zones = [dict(z) for z in zones]
+        self.exclude = [list(p) for p in exclude]
+        self._shape = None
+
+    @classmethod
+    def from_config(cls, camera_id, default_name, config=None):
+        entry = (config if config is not None else ZONE_CONFIG).get(camera_id, {})
+        return cls(default_name, entry.get("zones", ()), entry.get("exclude", ()))
+
+    @property
+    def configured(self):
+        return bool(self.zones or self.exclude)
+
+    def _points(self, polygon, w, h):
+        return np.array([[int(round(x * w)), int(round(y * h))] for x, y in polygon], dtype=np.int32)
+
+    def _build(self, shape):
+        h, w = shape[:2]
+        self.labels = np.zeros((h, w), dtype=np.uint8)
+        for i, zone in enumerate(self.zones, start=1):
+            cv2.fillPoly(self.labels, [self._points(zone["polygon"], w, h)], i)
+        excluded = np.zeros((h, w), dtype=np.uint8)
+        for polygon in self.exclude:
+            cv2.fillPoly(excluded, [self._points(polygon, w, h)], 1)
+        self.excluded = excluded.astype(bool)
+
+        watched = ~self.excluded
+        if self.zones:
+            watched &= self.labels > 0
+        self.labels[~watched] = 0
+        self.watched = watched
+        # Same object every frame, so the gates' downscaled copy stays cached
+        self.ignored = ~watched
+        self.integral = cv2.integral(watched.astype(np.uint8))
+        # Watched pixels per label, the denominator of coverage
+        self.zone_pixels = np.bincount(self.labels[watched], minlength=len(self.zones) + 1)
+        self._shape = shape[:2]
+
+    def _ensure(self, shape):
+        if self._shape != shape[:2]:
+            self._build(shape)
+
+    def ignore_mask(self, shape):
+        """Pixels the motion gate should not look at (None when everything is watched)."""
+        if not self.configured:
+            return None
+        self._ensure(shape)
+        return self.ignored
+
+    def filter_boxes(self, boxes, shape):
+        """Drops boxes lying mostly in excluded / unwatched areas, before tracking and liveness."""
+        if not self.configured or not boxes:
+            return boxes
+        self._ensure(shape)
+        h, w = shape[:2]
+        kept = []
+        for box in boxes:
+            x1, y1 = max(0, int(box[0])), max(0, int(box[1]))
+            x2, y2 = min(w, int(box[2])), min(h, int(box[3]))
+            area = (x2 - x1) * (y2 - y1)
+            if area <= 0:
+                continue
+            ii = self.integral
+            allowed = ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]
+            if allowed / area >= MIN_ALLOWED_FRACTION:
+                kept.append(box)
+        return kept
+
+    def zone_name(self, label):
+        return self.zones[label - 1]["name"] if label else self.default_name
+
+    def zone_at(self, box, shape):
+        """Name of the zone under the box centre."""
+        self._ensure(shape)
+        h, w = shape[:2]
+        cx = min(w - 1, max(0, (box[0] + box[2]) // 2))
+        cy = min(h - 1, max(0, (box[1] + box[3]) // 2))
+        return self.zone_name(int(self.labels[cy, cx]))
+
+    def aggregate(self, boxes, shape):
+        """Per-zone severity of a set of live boxes.
+
+        Overlapping boxes are merged (union of pixels) so two detections of
+        the same flame don't double its size. Returns {zone: {...}}.
+        """
+        if not boxes:
+            return {}
+        self._ensure(shape)
+        h, w = shape[:2]
+        fire = np.zeros((h, w), dtype=np.uint8)
+        for x1, y1, x2, y2 in boxes:
+            fire[max(0, y1):max(0, y2), max(0, x1):max(0, x2)] = 1
+        on_fire = fire.astype(bool) & self.watched
+        burning = np.bincount(self.labels[on_fire], minlength=len(self.zones) + 1)
+
+        result = {}
+        for label in np.nonzero(burning)[0]:
+            label = int(label)
+            zone = self.zones[label - 1] if label else {}
+            coverage = float(burning[label]) / max(1, int(self.zone_pixels[label]))
+            entry = {
+                "coverage_pct": round(coverage * 100, 2),
+                "count": sum(1 for b in boxes if self.zone_at(b, shape) == self.zone_name(label)),
+            }
+            if zone.get("area_m2"):
+                entry["area_m2"] = round(coverage * zone["area_m2"], 2)
+                entry["severity"] = _severity(entry["area_m2"], zone.get("severity_m2", SEVERITY_AREA_M2))
+            else:
+                entry["severity"] = _severity(entry["coverage_pct"], zone.get("severity_pct", SEVERITY_COVERAGE_PCT))
+            result[self.zone_name(label)] = entry
+        return result
+
+
+ZONE_CONFIG = load_zone_config()